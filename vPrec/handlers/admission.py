@@ -0,0 +1,180 @@
+"""Допуск файлов к обработке: лимиты размера и числа ячеек до полного разбора.
+
+Размер проверяется по document.file_size ещё до скачивания, число строк и колонок —
+по метаданным xlsx (zip-архив) без разбора ячеек. Большие книги обрабатываются
+по одной в очереди тяжёлых задач, слишком большие отклоняются.
+"""
+import os
+import re
+import zipfile
+import asyncio
+import posixpath
+import logging
+from contextlib import asynccontextmanager
+from dataclasses import dataclass, field
+from xml.etree import ElementTree
+from telegram import Message
+from .excel_stream import is_xlsx
+
+logger = logging.getLogger(__name__)
+
+MAX_FILE_MB = float(os.getenv("MAX_FILE_MB", "20"))
+MAX_UNPACKED_MB = float(os.getenv("MAX_UNPACKED_MB", "500"))
+MAX_CELLS = int(os.getenv("MAX_CELLS", "10000000"))
+HEAVY_CELLS = int(os.getenv("HEAVY_CELLS", "1000000"))
+HEAVY_JOBS = int(os.getenv("HEAVY_JOBS", "1"))
+
+# у .xls нет дешёвых метаданных — оценка по размеру файла
+XLS_BYTES_PER_CELL = 16
+
+OK = "ok"
+HEAVY = "heavy"
+REJECT = "reject"
+
+_NS = {
+    "m": "http://schemas.openxmlformats.org/spreadsheetml/2006/main",
+    "r": "http://schemas.openxmlformats.org/officeDocument/2006/relationships",
+    "rel": "http://schemas.openxmlformats.org/package/2006/relationships",
+}
+_DIMENSION = re.compile(rb'<(?:\w+:)?dimension ref="([A-Z]+)?(\d+)?(?::([A-Z]+)(\d+))?"')
+_ROW = re.compile(rb'<(?:\w+:)?row [^>]*?r="(\d+)"')
+_CELL = re.compile(rb'<(?:\w+:)?c [^>]*?r="([A-Z]+)\d+"')
+
+
+@dataclass
+class SheetSize:
+    name: str
+    rows: int
+    cols: int
+
+    @property
+    def cells(self) -> int:
+        return self.rows * self.cols
+
+
+@dataclass
+class Admission:
+    """решение по файлу: verdict — ok/heavy/reject, message — текст для пользователя"""
+    verdict: str
+    cells: int = 0
+    rows: int = 0
+    sheets: list = field(default_factory=list)
+    message: str = None
+
+
+def _col_number(letters: bytes) -> int:
+    n = 0
+    for ch in letters:
+        n = n * 26 + ch - 64
+    return n
+
+
+def _num(n: int) -> str:
+    return f"{n:,}".replace(",", " ")
+
+
+def _sheet_paths(zf: zipfile.ZipFile) -> list:
+    """(имя листа, путь к xml листа внутри архива) в порядке книги"""
+    rels = ElementTree.fromstring(zf.read("xl/_rels/workbook.xml.rels"))
+    targets = {}
+    for rel in rels.findall("rel:Relationship", _NS):
+        target = rel.get("Target", "")
+        targets[rel.get("Id")] = target.lstrip("/") if target.startswith("/") else posixpath.normpath(posixpath.join("xl", target))
+    workbook = ElementTree.fromstring(zf.read("xl/workbook.xml"))
+    return [(sheet.get("name"), targets.get(sheet.get(f"{{{_NS['r']}}}id")))
+            for sheet in workbook.findall("m:sheets/m:sheet", _NS)]
+
+
+def _scan_sheet(zf: zipfile.ZipFile, path: str) -> tuple:
+    """(строк, колонок) листа: из <dimension>, а если его нет (write-only openpyxl
+    и другие генераторы) — потоковым просмотром xml без разбора ячеек"""
+    rows = 0
+    tail = b""
+    with zf.open(path) as f:
+        head = f.read(4096)
+        m = _DIMENSION.search(head)
+        if m and m.group(4):
+            return int(m.group(4)), _col_number(m.group(3))
+        # колонки — по первым строкам, строки идут по возрастанию — хватает последней в чанке
+        cols = max((_col_number(m.group(1)) for m in _CELL.finditer(head)), default=0)
+        chunk = head
+        while chunk:
+            data = tail + chunk
+            pos = max(data.rfind(b"<row "), data.rfind(b":row "))
+            # у «<x:row» тег начинается с «<» перед префиксом
+            m = _ROW.search(data, max(0, data.rfind(b"<", 0, pos + 1))) if pos >= 0 else None
+            if m:
+                rows = max(rows, int(m.group(1)))
+            tail = data[-256:]
+            chunk = f.read(1024 * 1024)
+    return rows, cols
+
+
+def workbook_size(file_path: str) -> list:
+    """размеры листов книги без загрузки ячеек; для .xls — грубая оценка по размеру файла"""
+    if not is_xlsx(file_path):
+        cells = os.path.getsize(file_path) // XLS_BYTES_PER_CELL
+        return [SheetSize(None, cells // 10, 10)]
+    with zipfile.ZipFile(file_path) as zf:
+        unpacked = sum(info.file_size for info in zf.infolist())
+        if unpacked > MAX_UNPACKED_MB * 1024 * 1024:
+            # zip-бомба или гигантская книга — считать строки бессмысленно
+            return [SheetSize(None, MAX_CELLS + 1, 1)]
+        return [SheetSize(name, *_scan_sheet(zf, path)) for name, path in _sheet_paths(zf) if path in zf.namelist()]
+
+
+def check_document(file_size) -> Admission:
+    """проверка до скачивания: только размер файла из апдейта"""
+    if file_size and file_size > MAX_FILE_MB * 1024 * 1024:
+        return Admission(REJECT, message=(
+            f"❌ Файл слишком большой: {file_size / 1024 / 1024:.1f} МБ при лимите {MAX_FILE_MB:g} МБ. "
+            "Уберите лишние листы или разбейте отчёт на части."))
+    return Admission(OK)
+
+
+def admit_workbook(file_path: str) -> Admission:
+    """проверка после скачивания: оценка стоимости по числу ячеек"""
+    try:
+        sheets = workbook_size(file_path)
+    except (zipfile.BadZipFile, KeyError, ElementTree.ParseError, OSError):
+        # пусть разбирается обычный путь — он сообщит об ошибке формата
+        logger.warning("не удалось оценить размер книги %s", file_path, exc_info=True)
+        return Admission(OK)
+    cells = sum(s.cells for s in sheets)
+    rows = sum(s.rows for s in sheets)
+    if cells > MAX_CELLS:
+        return Admission(REJECT, cells, rows, sheets, (
+            f"❌ В файле около {_num(rows)} строк ({_num(cells)} ячеек) — больше лимита {_num(MAX_CELLS)} ячеек. "
+            "Выгрузите отчёт за меньший период или по частям."))
+    if cells > HEAVY_CELLS:
+        return Admission(HEAVY, cells, rows, sheets)
+    return Admission(OK, cells, rows, sheets)
+
+
+_heavy_semaphore = None
+_heavy_waiting = 0
+
+
+@asynccontextmanager
+async def job_slot(admission: Admission, message: Message = None):
+    """большие книги обрабатываются по HEAVY_JOBS за раз, чтобы не занимать весь пул"""
+    global _heavy_semaphore, _heavy_waiting
+    if admission.verdict != HEAVY:
+        yield
+        return
+    if _heavy_semaphore is None:
+        _heavy_semaphore = asyncio.Semaphore(HEAVY_JOBS)
+    if message is not None:
+        ahead = _heavy_waiting + (1 if _heavy_semaphore.locked() else 0)
+        text = f"⏳ Большой файл (около {_num(admission.rows)} строк) — обрабатывается в очереди тяжёлых задач"
+        text += f", впереди {ahead}." if ahead else ", это займёт больше времени."
+        await message.reply_text(text)
+    _heavy_waiting += 1
+    try:
+        await _heavy_semaphore.acquire()
+    finally:
+        _heavy_waiting -= 1
+    try:
+        yield
+    finally:
+        _heavy_semaphore.release()
@@ -2,7 +2,12 @@ import logging
 import pandas as pd
 from telegram import Update
 from telegram.ext import ContextTypes
-from .report_store import send_and_store
+from .report_store import send_and_store, StoredReport
+from .entity_index import NameSummary, people_frame
+from .excel_stream import iter_chunks
+from .column_schema import resolve_file
+from .workers import SheetResult, analyze_sheets, split_failed, failed_lines, failed_message
+from .rules import DEFAULT_RULES, compile_rules, rules_for_update, tier_lines
 
 logger = logging.getLogger(__name__)
 
@@ -14,66 +19,90 @@ async def start_attendance_report(update: Update, context: ContextTypes.DEFAULT_
     else:
         await update.message.reply_text(text)
 
-async def process_attendance_file(update: Update, context: ContextTypes.DEFAULT_TYPE, file_path: str) -> None:
-    #обработка файла посещаемости
-    try:
-        df = pd.read_excel(file_path)
-
-        columns = df.columns.tolist()
-        teacher_col = None
-        attendance_col = None
-        attendance_keywords = ['посещ', 'сред', 'процент', '%', 'присут', 'avg']
-        teacher_keywords = ['преподават', 'учител', 'фио', 'преподав']
-
-        for col in columns:
-            col_lower = str(col).lower()
-            if any(k in col_lower for k in teacher_keywords):
-                teacher_col = col
-            if any(k in col_lower for k in attendance_keywords):
-                attendance_col = col
-
-        if teacher_col is None:
-            teacher_col = columns[0]
-        if attendance_col is None:
-            attendance_col = columns[1] if len(columns) > 1 else columns[0]
-
-        s = df[attendance_col].astype(str).fillna('').str.replace('\xa0', ' ')
+class AttendanceAggregator:
+    """инкрементальный подсчёт преподавателей, попавших под правила, по чанкам"""
+
+    def __init__(self, teacher_col, attendance_col, rules: tuple = None):
+        self.teacher_col = teacher_col
+        self.attendance_col = attendance_col
+        self.rules = compile_rules('attendance', rules or tuple(DEFAULT_RULES['attendance'].items()))
+        self.rows_seen = 0
+        self.problems = []
+        self.people = NameSummary(mean=('attendance',))
+
+    def feed(self, chunk: pd.DataFrame) -> None:
+        self.rows_seen += len(chunk)
+
+        names = chunk[self.teacher_col]
+        s = chunk[self.attendance_col].astype(str).str.replace('\xa0', ' ')
         s_clean = s.str.replace(r"[^0-9,\.%-]", "", regex=True)
         s_clean = s_clean.str.replace('%', '', regex=False).str.replace(',', '.', regex=False)
         nums = pd.to_numeric(s_clean, errors='coerce')
+        # доли (0..1) переводим в проценты
+        nums = nums.where(~nums.between(0.0, 1.0), nums * 100.0)
+
+        self.people.feed(names, {'attendance': nums})
+        tiers = self.rules.evaluate({'attendance': nums})
+        mask = names.notna().to_numpy() & (tiers != '')
+        if mask.any():
+            self.problems.extend(zip(names[mask].astype(str).str.strip(), nums[mask].astype(float), tiers[mask]))
 
-        problem_teachers = []
-        for idx, row in df.iterrows():
-            try:
-                name = row[teacher_col]
-                if pd.isna(name):
-                    continue
-                name = str(name).strip()
+    def result(self) -> list:
+        return sorted(self.problems, key=lambda x: x[1])
 
-                val = nums.iloc[idx]
-                if pd.isna(val):
-                    continue
-                attendance = float(val)
-                if 0.0 <= attendance <= 1.0:
-                    attendance *= 100.0
 
-                if attendance < 40.0:
-                    problem_teachers.append((name, attendance))
-            except Exception:
-                continue
+def analyze_attendance_sheet(file_path: str, sheet=None, strict: bool = False, rules: tuple = None):
+    """разбор одного листа; None — лист не похож на отчёт посещаемости"""
+    header, _, mapping = resolve_file('attendance', file_path, sheet)
+    if not mapping.ok or (strict and not mapping.recognized):
+        return None
 
-        problem_teachers.sort(key=lambda x: x[1])
+    aggregator = AttendanceAggregator(mapping.get('teacher'), mapping.get('attendance'), rules)
+    for chunk in iter_chunks(file_path, header=header, sheet=sheet):
+        aggregator.feed(chunk)
+    return SheetResult(sheet, aggregator.result(), mapping.notes(), aggregator.rows_seen,
+                       people=aggregator.people.result())
+
+
+def _problem_lines(problem_teachers: list, rules) -> list:
+    if not problem_teachers:
+        return ["✅ Посещаемость всех преподавателей в норме."]
+    return tier_lines(rules, problem_teachers, lambda p: p[2], lambda p: f"• {p[0]}: {p[1]:.1f}%", "преподавателей")
+
+
+async def process_attendance_file(update: Update, context: ContextTypes.DEFAULT_TYPE, file_path: str) -> None:
+    #обработка файла посещаемости
+    try:
+        rules = rules_for_update(update, 'attendance')
+        compiled = compile_rules('attendance', rules)
+        sections, failed = split_failed(await analyze_sheets(file_path, analyze_attendance_sheet, rules))
+        if not sections:
+            msg = failed_message(failed, "❌ В файле нет колонок с данными.")
+            await send_and_store(update, context, msg, metadata={'type': 'attendance'})
+            return
 
         lines = ["📊 Отчет по посещаемости преподавателей:"]
-        if problem_teachers:
-            lines.append(f"⚠️ Преподавателей с посещаемостью < 40%: {len(problem_teachers)}")
-            for name, att in problem_teachers:
-                lines.append(f"• {name}: {att:.1f}%")
+        lines.extend(failed_lines(failed))
+        for section in sections:
+            lines.extend(section.notes)
+        if len(sections) == 1:
+            lines.extend(_problem_lines(sections[0].items, compiled))
         else:
-            lines.append("✅ Все преподаватели имеют посещаемость ≥ 40%.")
+            for section in sections:
+                lines.append("")
+                lines.append(f"📄 Лист «{section.sheet}»")
+                lines.extend(_problem_lines(section.items, compiled))
+            total = sum(len(section.items) for section in sections)
+            lines.append("")
+            lines.append(f"🧮 Итого по {len(sections)} листам: {total} преподавателей под правилами")
 
         text = "\n".join(lines)
-        await send_and_store(update, context, text, parse_mode=None, metadata={'type': 'attendance'})
+        results = pd.DataFrame(
+            [(name, att, tier, section.sheet) for section in sections for name, att, tier in section.items],
+            columns=['name', 'attendance', 'tier', 'sheet'],
+        )
+        report = StoredReport.from_results('attendance', results, 'attendance', people=people_frame(sections))
+        await send_and_store(update, context, text, parse_mode=None, metadata={'type': 'attendance'}, report=report)
 
     except Exception:
         logger.exception("ошибка при обработке файла посещаемости")
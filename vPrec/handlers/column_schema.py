@@ -0,0 +1,203 @@
+"""Декларативные схемы колонок отчётов и кешируемое сопоставление заголовков"""
+import re
+import logging
+from dataclasses import dataclass, field
+from functools import lru_cache
+from .excel_stream import read_head, build_columns
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class ColumnRole:
+    """роль колонки в отчёте.
+
+    patterns — регулярные выражения в порядке приоритета: колонка, совпавшая
+    с более ранним шаблоном, побеждает. fallback — индекс колонки, если ни один
+    шаблон не подошёл (None — без запасного варианта).
+    """
+    name: str
+    title: str
+    patterns: tuple
+    required: bool = True
+    fallback: int = None
+
+
+@dataclass(frozen=True)
+class ReportSchema:
+    """схема отчёта; header_rows — варианты строк заголовка в порядке перебора"""
+    name: str
+    roles: tuple
+    header_rows: tuple = ((0,),)
+
+
+@dataclass
+class ColumnMapping:
+    """результат сопоставления: роль -> имя колонки"""
+    columns: dict = field(default_factory=dict)
+    missing: list = field(default_factory=list)
+    ambiguous: dict = field(default_factory=dict)
+    titles: dict = field(default_factory=dict)
+    matched: list = field(default_factory=list)
+
+    @property
+    def ok(self) -> bool:
+        return not self.missing
+
+    @property
+    def recognized(self) -> bool:
+        """все обязательные роли есть и хотя бы одна найдена по шаблону, а не запасным индексом"""
+        return self.ok and bool(self.matched)
+
+    def get(self, role: str):
+        return self.columns.get(role)
+
+    def notes(self) -> list:
+        """человекочитаемые предупреждения о неоднозначном выборе колонок"""
+        return [
+            f"ℹ️ для «{self.titles.get(role, role)}» подошло несколько колонок ({', '.join(map(str, cands))}), выбрана «{self.columns[role]}»"
+            for role, cands in self.ambiguous.items()
+        ]
+
+
+SCHEMAS = {
+    "attendance": ReportSchema("attendance", (
+        ColumnRole("teacher", "преподаватель", (r"преподав|учител", r"фио"), fallback=0),
+        ColumnRole("attendance", "посещаемость", (r"посещ|присут", r"процент|%", r"сред|avg"), fallback=1),
+    )),
+    "homework_check": ReportSchema("homework_check", (
+        ColumnRole("teacher", "преподаватель", (r"преподават|учител", r"фио"), fallback=0),
+        ColumnRole("issued", "получено", (r"получ",)),
+        ColumnRole("checked", "проверено", (r"провер",)),
+    ), header_rows=((0, 1), (0,), (1,))),
+    "homework_submit": ReportSchema("homework_submit", (
+        ColumnRole("student", "студент", (r"фио", r"студент", r"имя|name"), fallback=0),
+        ColumnRole("group", "группа", (r"группа|group",), required=False),
+        ColumnRole("percentage", "процент выполнения", (r"percentage.*homework|homework.*percentage", r"percentage")),
+    )),
+    "students": ReportSchema("students", (
+        ColumnRole("fio", "ФИО", (r"^fio$",)),
+        ColumnRole("homework", "ДЗ", (r"^homework$",)),
+        ColumnRole("classroom", "классная работа", (r"^classroom$",)),
+        ColumnRole("group", "группа", (r"^группа$",), required=False),
+    )),
+    "lessons": ReportSchema("lessons", (
+        ColumnRole("topic", "тема урока", (r"^тема урока$", r"тема")),
+    )),
+    "schedule": ReportSchema("schedule", (
+        ColumnRole("group", "группа", (r"^группа$",)),
+        ColumnRole("slot", "номер пары", (r"^пара$|^№ ?пары$|^пара №",), required=False),
+    )),
+    "study_plan": ReportSchema("study_plan", (
+        ColumnRole("group", "группа", (r"^группа$|^group$",)),
+        ColumnRole("discipline", "дисциплина", (r"дисциплин|предмет",)),
+        ColumnRole("hours", "часы по плану", (r"час|hours",)),
+    )),
+}
+
+
+def normalize_header(header) -> str:
+    return " ".join(str(header).replace("\xa0", " ").split()).lower()
+
+
+@lru_cache(maxsize=None)
+def _compiled(schema_name: str) -> tuple:
+    """шаблоны схемы компилируются один раз на процесс"""
+    schema = SCHEMAS[schema_name]
+    return tuple(
+        (role, tuple(re.compile(p, re.IGNORECASE) for p in role.patterns))
+        for role in schema.roles
+    )
+
+
+@lru_cache(maxsize=256)
+def _resolve_cached(schema_name: str, headers: tuple) -> ColumnMapping:
+    normalized = [normalize_header(h) for h in headers]
+    mapping = ColumnMapping()
+    taken = set()
+
+    for role, patterns in _compiled(schema_name):
+        best_rank = None
+        candidates = []
+        for i, h in enumerate(normalized):
+            if i in taken:
+                continue
+            rank = next((r for r, p in enumerate(patterns) if p.search(h)), None)
+            if rank is None:
+                continue
+            if best_rank is None or rank < best_rank:
+                best_rank, candidates = rank, [i]
+            elif rank == best_rank:
+                candidates.append(i)
+
+        if candidates:
+            idx = candidates[0]
+            mapping.matched.append(role.name)
+            if len(candidates) > 1:
+                mapping.ambiguous[role.name] = [headers[i] for i in candidates]
+                mapping.titles[role.name] = role.title
+        elif role.fallback is not None and headers:
+            # запасной индекс занят другой ролью или вне таблицы — берём первую свободную колонку
+            free = [i for i in range(len(headers)) if i not in taken]
+            if role.fallback in free:
+                idx = role.fallback
+            else:
+                idx = free[0] if free else min(role.fallback, len(headers) - 1)
+        else:
+            if role.required:
+                mapping.missing.append(role.name)
+            continue
+
+        taken.add(idx)
+        mapping.columns[role.name] = headers[idx]
+
+    if mapping.ambiguous:
+        logger.warning("неоднозначные колонки в схеме %s: %s", schema_name, mapping.ambiguous)
+    return mapping
+
+
+def resolve_columns(schema_name: str, headers) -> ColumnMapping:
+    """сопоставляет заголовки файла ролям схемы.
+
+    результат кешируется по сигнатуре заголовков: повторные файлы с той же
+    раскладкой колонок не проходят поиск заново.
+    """
+    mapping = _resolve_cached(schema_name, tuple(headers))
+    # копия, чтобы вызывающий код не испортил кешированный объект
+    return ColumnMapping(dict(mapping.columns), list(mapping.missing), dict(mapping.ambiguous),
+                         dict(mapping.titles), list(mapping.matched))
+
+
+def _resolve_head(schema_name: str, head: list, header_idx: tuple) -> tuple:
+    """(header, columns, mapping) для заголовка из строк header_idx первых строк листа"""
+    columns = build_columns([head[i] for i in header_idx])
+    header = header_idx[0] if len(header_idx) == 1 else list(header_idx)
+    return header, columns, resolve_columns(schema_name, columns)
+
+
+def resolve_file(schema_name: str, file_path: str, sheet=None):
+    """подбирает строку заголовка по схеме и сопоставляет колонки.
+
+    возвращает (header, columns, mapping); если ни один вариант заголовка не
+    дал всех обязательных ролей — результат по первому варианту. многострочный
+    вариант, который распознаётся и без нижней строки, укорачивается: та строка —
+    первая строка данных, а не часть заголовка.
+    """
+    candidates = SCHEMAS[schema_name].header_rows
+    head = read_head(file_path, max(max(c) for c in candidates) + 1, sheet)
+    first = None
+    for header_idx in candidates:
+        if max(header_idx) >= len(head):
+            continue
+        found = _resolve_head(schema_name, head, header_idx)
+        if found[2].recognized:
+            if len(header_idx) > 1:
+                shorter = _resolve_head(schema_name, head, header_idx[:-1])
+                if shorter[2].recognized:
+                    return shorter
+            return found
+        if first is None:
+            first = found
+    if first is None:
+        return 0, [], resolve_columns(schema_name, ())
+    return first
@@ -0,0 +1,407 @@
+"""Индекс преподавателей и студентов по последним отчётам: нормализация имён и нечёткий поиск"""
+import os
+import re
+import sys
+import time
+import uuid
+import bisect
+import threading
+from collections import OrderedDict, defaultdict
+from dataclasses import dataclass, field
+import numpy as np
+import pandas as pd
+from telegram import Update, InlineQueryResultArticle, InputTextMessageContent
+from telegram.ext import ContextTypes
+from .rules import TIERS
+
+# какой отчёт о ком: преподаватели или студенты
+ENTITY_KINDS = {
+    'attendance': 'teacher',
+    'homework_check': 'teacher',
+    'homework_submit': 'student',
+    'students': 'student',
+    'schedule_load': 'teacher',
+}
+
+MIN_SCORE = 0.3
+INLINE_LIMIT = 10
+MAX_FACT_ROWS = 5  # строк одного отчёта в карточке сущности
+MESSAGE_LIMIT = 4000  # у Telegram — 4096 символов на сообщение
+
+# индексы чатов и связи пользователь -> чаты живут столько же, сколько отчёты в ReportStore
+ENTITY_INDEX_TTL_SECONDS = int(os.getenv("REPORT_TTL_SECONDS", str(24 * 3600)))
+ENTITY_INDEX_MAX_CHATS = int(os.getenv("ENTITY_INDEX_MAX_CHATS", "200"))
+ENTITY_INDEX_MAX_USERS = int(os.getenv("ENTITY_INDEX_MAX_USERS", "5000"))
+
+_JUNK_RE = re.compile(r"[^\w\s-]")
+_SPACE_RE = re.compile(r"\s+")
+
+
+def canonical_name(name) -> str:
+    """«Иванов\xa0 И.И.», «ИВАНОВ и и», «иванов  и.и» -> «иванов и и»"""
+    s = str(name).replace('\xa0', ' ').casefold().replace('ё', 'е')
+    s = _JUNK_RE.sub(' ', s)
+    return _SPACE_RE.sub(' ', s).strip()
+
+
+def trigrams(canon: str) -> set:
+    padded = f"  {canon} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class NameSummary:
+    """все разобранные имена листа, а не только попавшие под правила: число строк,
+    среднее по метрикам mean и сумма по метрикам total — по ней индекс находит любого"""
+
+    def __init__(self, mean: tuple = (), total: tuple = ()):
+        self.mean = tuple(mean)
+        self.total = tuple(total)
+        self._parts = []
+
+    def feed(self, names: pd.Series, values: dict, groups: pd.Series = None) -> None:
+        keep = names.notna().to_numpy()
+        frame = pd.DataFrame({'name': names[keep].astype(str).str.strip().to_numpy(), 'rows': 1})
+        for col in self.mean + self.total:
+            v = np.asarray(values[col], dtype='float64')[keep]
+            frame[col] = v
+            if col in self.mean:
+                frame[f'{col}_n'] = ~np.isnan(v)
+        if groups is not None:
+            g = groups[keep].astype(str).str.strip().to_numpy()
+            frame['group'] = np.where(groups[keep].notna().to_numpy() & (g != ''), g, None)
+        frame = frame[frame['name'] != '']
+        if not frame.empty:
+            # чанк сворачивается сразу: в памяти по строке на имя, а не на строку файла
+            self._parts.append(frame.groupby('name', sort=False).agg(self._spec(frame)))
+
+    def _spec(self, frame: pd.DataFrame) -> dict:
+        return {col: ('first' if col == 'group' else 'sum') for col in frame.columns if col != 'name'}
+
+    def result(self) -> pd.DataFrame:
+        """name, [group], метрики, rows — по строке на имя"""
+        if not self._parts:
+            return pd.DataFrame(columns=['name', *self.mean, *self.total, 'rows'])
+        merged = pd.concat(self._parts)
+        merged = merged.groupby(level=0, sort=False).agg(self._spec(merged))
+        for col in self.mean:
+            n = merged.pop(f'{col}_n')
+            merged[col] = merged[col].where(n > 0) / n.where(n > 0)
+        return merged.reset_index()
+
+
+def people_frame(sections: list) -> pd.DataFrame:
+    """сводки листов (SheetResult.people) одним фреймом с колонкой sheet"""
+    frames = [s.people.assign(sheet=s.sheet) for s in sections if s.people is not None]
+    return pd.concat(frames, ignore_index=True) if frames else None
+
+
+@dataclass(slots=True)
+class Entity:
+    kind: str
+    canon: str
+    name: str
+    grams: int
+    group: str = ""
+    facts: dict = field(default_factory=dict)  # тип отчёта -> строки результатов или сводка
+
+
+class EntityIndex:
+    """сущности последних отчётов одного чата; новый отчёт того же типа заменяет старый"""
+
+    def __init__(self):
+        self._entities = {}  # (kind, canon) -> Entity
+        # триграмма -> ключи сущностей; списки, а не множества — на 100k имён это втрое меньше памяти
+        self._grams = defaultdict(list)
+        self._by_report = {}  # тип отчёта -> ключи сущностей
+        self._indexed = {}  # тип отчёта -> проиндексированный отчёт
+        self._tokens = []  # отсортированные слова имён для поиска по префиксу
+        self._token_keys = []  # ключ сущности для каждого слова из _tokens
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._entities)
+
+    def _drop_report(self, report_type: str) -> None:
+        dropped = set()
+        for key in self._by_report.pop(report_type, ()):
+            entity = self._entities.get(key)
+            if entity is None:
+                continue
+            entity.facts.pop(report_type, None)
+            if not entity.facts:
+                del self._entities[key]
+                dropped.add(key)
+        if dropped:
+            # каждый затронутый список триграммы фильтруется один раз
+            touched = set().union(*(trigrams(key[1]) for key in dropped))
+            for g in touched:
+                self._grams[g] = [key for key in self._grams[g] if key not in dropped]
+
+    @staticmethod
+    def _records(df, parts: dict, skip: set = None) -> None:
+        """записи фрейма по каноническим именам; имена из skip пропускаются"""
+        if df is None or df.empty or 'name' not in df.columns:
+            return
+        canon = df['name'].astype(str).map(canonical_name)
+        keep = (canon != '').to_numpy()
+        # записи собираются один раз и раскладываются по именам словарём —
+        # groupby с DataFrame на каждую сущность на 100k строк занимал десятки секунд
+        for c, record in zip(canon[keep].tolist(), df[keep].to_dict('records')):
+            if skip is None or c not in skip:
+                parts.setdefault(c, []).append(record)
+
+    def add_report(self, report) -> None:
+        kind = ENTITY_KINDS.get(report.type)
+        if kind is None:
+            return
+        # длинный отчёт уходит несколькими сообщениями с одним и тем же report — индексируем один раз
+        if self._indexed.get(report.type) is report:
+            return
+
+        # у попавших под правила — их строки с уровнем, у остальных — сводка по имени
+        parts = {}
+        self._records(report.results, parts)
+        self._records(getattr(report, 'people', None), parts, skip=set(parts))
+        with self._lock:
+            self._drop_report(report.type)
+            keys = set()
+            for c, part in parts.items():
+                key = (kind, c)
+                entity = self._entities.get(key)
+                if entity is None:
+                    grams = trigrams(c)
+                    entity = Entity(kind, c, str(part[0]['name']).replace('\xa0', ' ').strip(), len(grams))
+                    self._entities[key] = entity
+                    for g in grams:
+                        self._grams[g].append(key)
+                if not entity.group:
+                    groups = (str(r['group']) for r in part if 'group' in r and not pd.isna(r['group']))
+                    entity.group = next((g for g in groups if g), "")
+                entity.facts[report.type] = part
+                keys.add(key)
+            self._by_report[report.type] = keys
+            self._indexed[report.type] = report
+            # префиксный индекс пересобирается один раз на отчёт, а не на каждый запрос
+            # слова вроде «иванов» повторяются у тысяч имён — храним одну копию строки
+            words, word_keys = [], []
+            for key, entity in self._entities.items():
+                for token in {entity.canon, *map(sys.intern, entity.canon.split())}:
+                    words.append(token)
+                    word_keys.append(key)
+            order = np.argsort(np.array(words, dtype=object), kind='stable')
+            self._tokens = [words[i] for i in order]
+            self._token_keys = [word_keys[i] for i in order]
+
+    def _prefix_hits(self, kind, q: str) -> dict:
+        hits = {}
+        i = bisect.bisect_left(self._tokens, q)
+        while i < len(self._tokens) and self._tokens[i].startswith(q):
+            key = self._token_keys[i]
+            if kind is None or key[0] == kind:
+                # начало полного имени ценнее начала отдельного слова
+                score = 1.0 if self._entities[key].canon.startswith(q) else 0.95
+                hits[key] = max(hits.get(key, 0.0), score)
+            i += 1
+        return hits
+
+    def search(self, kind, query: str, limit: int = 5, prefix: bool = False) -> list:
+        """сущности по убыванию сходства; точное совпадение имени — всегда первым.
+
+        kind=None — и преподаватели, и студенты; prefix=True — сначала совпадения
+        по началу имени или фамилии (для поиска по мере набора).
+        """
+        q = canonical_name(query)
+        if not q:
+            return []
+        kinds = (kind,) if kind else ('teacher', 'student')
+        with self._lock:
+            exact = [self._entities[(k, q)] for k in kinds if (k, q) in self._entities]
+            if exact and not prefix:
+                return exact
+
+            scored = self._prefix_hits(kind, q) if prefix else {}
+            for entity in exact:
+                scored[(entity.kind, entity.canon)] = 2.0
+            if len(scored) < limit:
+                self._fuzzy_hits(kind, q, scored)
+            ranked = sorted(scored.items(), key=lambda x: (-x[1], self._entities[x[0]].name))
+            return [self._entities[key] for key, _ in ranked[:limit]]
+
+    def _fuzzy_hits(self, kind, q: str, scored: dict) -> None:
+        q_grams = trigrams(q)
+        hits = defaultdict(int)
+        for g in q_grams:
+            for key in self._grams.get(g, ()):
+                if kind is None or key[0] == kind:
+                    hits[key] += 1
+
+        for key, common in hits.items():
+            entity = self._entities[key]
+            # коэффициент Дайса по триграммам; вхождение запроса в имя — почти точное совпадение
+            score = 2.0 * common / (len(q_grams) + entity.grams)
+            if q in entity.canon:
+                score = max(score, 0.9)
+            if score >= MIN_SCORE:
+                scored[key] = max(scored.get(key, 0.0), score)
+
+
+_indexes = OrderedDict()  # чат -> (время последнего отчёта, индекс), от старых к свежим
+_user_chats = OrderedDict()  # пользователь -> чаты, где он загружал отчёты
+_indexes_lock = threading.Lock()
+
+
+def _evict(now: float) -> None:
+    """под _indexes_lock: индексы старше TTL и сверх лимита, как в ReportStore"""
+    while _indexes:
+        chat_id, (updated, _) = next(iter(_indexes.items()))
+        if len(_indexes) <= ENTITY_INDEX_MAX_CHATS and now - updated <= ENTITY_INDEX_TTL_SECONDS:
+            break
+        del _indexes[chat_id]
+    while len(_user_chats) > ENTITY_INDEX_MAX_USERS:
+        _user_chats.popitem(last=False)
+
+
+def index_for(chat_id) -> EntityIndex:
+    """индекс чата для нового отчёта; создаётся при необходимости и считается свежим"""
+    now = time.monotonic()
+    with _indexes_lock:
+        entry = _indexes.get(chat_id)
+        index = entry[1] if entry is not None else EntityIndex()
+        _indexes[chat_id] = (now, index)
+        _indexes.move_to_end(chat_id)
+        _evict(now)
+        return index
+
+
+def chat_index(chat_id):
+    """индекс чата для поиска или None, если отчётов не было или они устарели"""
+    with _indexes_lock:
+        _evict(time.monotonic())
+        entry = _indexes.get(chat_id)
+        return entry[1] if entry is not None else None
+
+
+def remember_user(user_id, chat_id) -> None:
+    """inline-запросы приходят без чата — ищем по всем чатам, где пользователь получал отчёты"""
+    if user_id is None:
+        return
+    with _indexes_lock:
+        _user_chats.setdefault(user_id, set()).add(chat_id)
+        _user_chats.move_to_end(user_id)
+        _evict(time.monotonic())
+
+
+def indexes_for_user(user_id) -> list:
+    with _indexes_lock:
+        _evict(time.monotonic())
+        chats = _user_chats.get(user_id)
+        if chats is None:
+            return []
+        # чаты, чьи индексы уже вытеснены, забываем
+        chats.intersection_update(_indexes)
+        if not chats:
+            del _user_chats[user_id]
+        return [_indexes[c][1] for c in chats]
+
+
+def _num(value) -> str:
+    if value is None or pd.isna(value):
+        return "-"
+    value = float(value)
+    return f"{value:.0f}" if value.is_integer() else f"{value:.1f}"
+
+
+def _fact_line(report_type: str, row: dict) -> str:
+    if report_type == 'attendance':
+        text = f"📊 посещаемость: {_num(row.get('attendance'))}%"
+    elif report_type == 'homework_check':
+        text = (f"✅ проверка ДЗ: получено {_num(row.get('issued'))} | "
+                f"проверено {_num(row.get('checked'))} | {_num(row.get('percentage'))}%")
+    elif report_type == 'schedule_load':
+        text = f"📅 в расписании: {_num(row.get('count'))} пар, групп {_num(row.get('groups'))}"
+    elif report_type == 'homework_submit':
+        text = f"📝 сдача ДЗ: {_num(row.get('percentage'))}%"
+    else:
+        text = f"👥 ДЗ: {_num(row.get('homework'))} | классная: {_num(row.get('classroom'))}"
+    rows = row.get('rows')
+    if rows is not None and not pd.isna(rows) and rows > 1:
+        # сводка по нескольким строкам файла — метрики усреднены (у проверки ДЗ — суммы)
+        text += f" за {int(rows)} строк"
+    tier = row.get('tier')
+    if tier in TIERS:
+        text += f" {TIERS[tier][0]}"
+    sheet = row.get('sheet')
+    if isinstance(sheet, str) and sheet:
+        text += f" (лист «{sheet}»)"
+    return text
+
+
+def _truncate(text: str, limit: int = MESSAGE_LIMIT) -> str:
+    """обрезка по границе строки, чтобы уложиться в лимит сообщения"""
+    if len(text) <= limit:
+        return text
+    cut = text.rfind("\n", 0, limit - 2)
+    return text[:cut if cut > 0 else limit - 2] + "\n…"
+
+
+def describe_entity(entity: Entity) -> str:
+    group_text = f" ({entity.group})" if entity.group else ""
+    lines = [f"👤 {entity.name}{group_text}"]
+    for report_type, rows in entity.facts.items():
+        lines.extend(f"  {_fact_line(report_type, row)}" for row in rows[:MAX_FACT_ROWS])
+        if len(rows) > MAX_FACT_ROWS:
+            lines.append(f"  ... и ещё {len(rows) - MAX_FACT_ROWS}")
+    return _truncate("\n".join(lines))
+
+
+async def _lookup(update: Update, context: ContextTypes.DEFAULT_TYPE, kind: str) -> None:
+    title = "преподавателя" if kind == 'teacher' else "студента"
+    query = " ".join(context.args or [])
+    if not query:
+        await update.message.reply_text(f"❗ укажите фамилию {title}: /{kind} Иванов")
+        return
+
+    index = chat_index(update.effective_chat.id)
+    found = index.search(kind, query) if index is not None else []
+    if not found:
+        await update.message.reply_text(
+            f"ℹ️ {title} «{query}» нет в последних отчётах этого чата."
+        )
+        return
+    await update.message.reply_text(_truncate("\n\n".join(describe_entity(e) for e in found)))
+
+
+async def teacher_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """/teacher <фамилия> — преподаватель во всех последних отчётах чата"""
+    await _lookup(update, context, 'teacher')
+
+
+async def student_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """/student <фамилия> — студент во всех последних отчётах чата"""
+    await _lookup(update, context, 'student')
+
+
+async def inline_query(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """@bot фамилия — поиск по индексу последних отчётов, без чтения excel"""
+    query = update.inline_query
+    text = query.query.strip()
+    found = []
+    if text:
+        seen = set()
+        for index in indexes_for_user(query.from_user.id):
+            for entity in index.search(None, text, limit=INLINE_LIMIT, prefix=True):
+                key = (entity.kind, entity.canon)
+                if key not in seen:
+                    seen.add(key)
+                    found.append(entity)
+    results = []
+    for entity in found[:INLINE_LIMIT]:
+        description = describe_entity(entity)
+        kind_text = "преподаватель" if entity.kind == 'teacher' else "студент"
+        results.append(InlineQueryResultArticle(
+            id=uuid.uuid4().hex,
+            title=entity.name,
+            description=f"{kind_text}: " + "; ".join(l.strip() for l in description.splitlines()[1:3]),
+            input_message_content=InputTextMessageContent(description),
+        ))
+    await query.answer(results, cache_time=10, is_personal=True)
@@ -0,0 +1,165 @@
+"""Потоковое чтение Excel-файлов чанками с ограниченным потреблением памяти"""
+import os
+import logging
+from itertools import islice
+import pandas as pd
+from openpyxl import Workbook, load_workbook
+from . import snapshots
+from .progress import checkpoint
+
+logger = logging.getLogger(__name__)
+
+CHUNK_ROWS = int(os.getenv("EXCEL_CHUNK_ROWS", "5000"))
+
+_ZIP_MAGIC = b"PK\x03\x04"
+
+
+def is_xlsx(file_path: str) -> bool:
+    """xlsx — это zip-архив; расширение временного файла не показатель"""
+    with open(file_path, "rb") as f:
+        return f.read(4) == _ZIP_MAGIC
+
+
+def sheet_names(file_path: str) -> list:
+    """список листов книги без чтения данных"""
+    if snapshots.is_snapshot(file_path):
+        return snapshots.sheet_names(file_path)
+    if is_xlsx(file_path):
+        wb = load_workbook(file_path, read_only=True)
+        try:
+            return list(wb.sheetnames)
+        finally:
+            wb.close()
+    with pd.ExcelFile(file_path) as xls:
+        return list(xls.sheet_names)
+
+
+def iter_rows(file_path: str, sheet=None):
+    """построчный итератор значений листа (tuple на строку)"""
+    if snapshots.is_snapshot(file_path):
+        yield from snapshots.iter_rows(file_path, sheet)
+    elif is_xlsx(file_path):
+        wb = load_workbook(file_path, read_only=True, data_only=True)
+        try:
+            ws = wb[sheet] if sheet is not None else wb.worksheets[0]
+            for row in ws.iter_rows(values_only=True):
+                yield row
+        finally:
+            wb.close()
+    else:
+        # старый .xls не умеет читаться построчно — читаем лист целиком и отдаём строки
+        df = pd.read_excel(file_path, sheet_name=sheet or 0, header=None)
+        for row in df.itertuples(index=False, name=None):
+            yield row
+        del df
+
+
+def _cell_str(value) -> str:
+    if value is None or (isinstance(value, float) and pd.isna(value)):
+        return ""
+    return str(value).strip()
+
+
+def build_columns(header_rows: list) -> list:
+    """склеивает многострочный заголовок в плоские имена колонок"""
+    width = max((len(r) for r in header_rows), default=0)
+    levels = []
+    for row in header_rows:
+        cells = [_cell_str(v) for v in row] + [""] * (width - len(row))
+        levels.append(cells)
+
+    # объединённые ячейки верхних уровней заполнены только слева — протягиваем вправо
+    for cells in levels[:-1]:
+        last = ""
+        for i, c in enumerate(cells):
+            if c:
+                last = c
+            else:
+                cells[i] = last
+
+    columns = []
+    seen = {}
+    for i in range(width):
+        name = " ".join(lvl[i] for lvl in levels if lvl[i]) or f"Unnamed: {i}"
+        if name in seen:
+            seen[name] += 1
+            name = f"{name}.{seen[name]}"
+        else:
+            seen[name] = 0
+        columns.append(name)
+    return columns
+
+
+def read_head(file_path: str, nrows: int = 10, sheet=None) -> list:
+    """первые nrows строк листа без разбора всего файла"""
+    return list(islice(iter_rows(file_path, sheet), nrows))
+
+
+def iter_chunks(file_path: str, header=0, sheet=None, chunk_size: int = None):
+    """отдаёт DataFrame-чанки по chunk_size строк.
+
+    header — номер строки заголовка, список номеров (многострочный заголовок)
+    или None (колонки нумеруются). в памяти одновременно держится только один чанк.
+    """
+    chunk_size = chunk_size or CHUNK_ROWS
+    if header is None:
+        header_idx = []
+    elif isinstance(header, int):
+        header_idx = [header]
+    else:
+        header_idx = list(header)
+    skip = max(header_idx) + 1 if header_idx else 0
+
+    rows = iter_rows(file_path, sheet)
+    head = list(islice(rows, skip))
+    columns = build_columns([head[i] for i in header_idx if i < len(head)]) if header_idx else None
+
+    if snapshots.is_snapshot(file_path):
+        # снимок отдаёт колоночные блоки сразу, без построчного обхода
+        rows.close()
+        width = len(columns) if columns else None
+        for offset, chunk in snapshots.iter_frames(file_path, sheet, skip, width, chunk_size):
+            checkpoint(offset)
+            if columns:
+                chunk.columns = columns
+            chunk.index = pd.RangeIndex(offset, offset + len(chunk))
+            chunk = chunk.dropna(how="all")
+            if not chunk.empty:
+                yield chunk
+        return
+
+    offset = 0
+    while True:
+        checkpoint(offset)
+        batch = list(islice(rows, chunk_size))
+        if not batch:
+            break
+        width = len(columns) if columns else max(len(r) for r in batch)
+        data = [tuple(r[:width]) + (None,) * (width - len(r)) for r in batch]
+        # индекс — сквозной номер строки данных, как у pd.read_excel
+        index = pd.RangeIndex(offset, offset + len(data))
+        offset += len(data)
+        chunk = pd.DataFrame.from_records(data, columns=columns or list(range(width)), index=index)
+        # пустые строки (хвост форматирования) не несут данных
+        chunk = chunk.dropna(how="all")
+        if not chunk.empty:
+            yield chunk
+
+
+def read_columns(file_path: str, header=0, sheet=None) -> list:
+    """только имена колонок, без чтения данных"""
+    if header is None:
+        return []
+    header_idx = [header] if isinstance(header, int) else list(header)
+    head = read_head(file_path, max(header_idx) + 1, sheet)
+    return build_columns([head[i] for i in header_idx if i < len(head)])
+
+
+def write_sheets(file_path: str, sheets) -> None:
+    """записывает листы [(название, строки), ...] в новый xlsx в потоковом режиме (write_only)"""
+    wb = Workbook(write_only=True)
+    for title, rows in sheets:
+        ws = wb.create_sheet(title=title)
+        for row in rows:
+            ws.append(row)
+    wb.save(file_path)
@@ -3,20 +3,28 @@ import logging
 import pandas as pd
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.ext import ContextTypes
+from .excel_stream import iter_chunks, read_head
+from .column_schema import resolve_file
+from .workers import SheetResult, analyze_sheets, split_failed, failed_lines, failed_message
+from .report_store import send_and_store, StoredReport
+from .entity_index import NameSummary, people_frame
+from .rules import DEFAULT_RULES, compile_rules, rules_for_update, tier_lines
 
 logger = logging.getLogger(__name__)
 
-async def start_homework_check_report(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
-    keyboard = [
+PERIOD_KEYBOARD = InlineKeyboardMarkup(
+    [
         [
             InlineKeyboardButton("📅 За месяц", callback_data="hw_check_month"),
             InlineKeyboardButton("📆 За неделю", callback_data="hw_check_week"),
         ]
     ]
-    reply_markup = InlineKeyboardMarkup(keyboard)
+)
+
+async def start_homework_check_report(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     await update.callback_query.edit_message_text(
         "✅ Выберите период для проверки домашних заданий:",
-        reply_markup=reply_markup
+        reply_markup=PERIOD_KEYBOARD
     )
 
 async def handle_hw_check_period(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
@@ -35,88 +43,139 @@ async def handle_hw_check_period(update: Update, context: ContextTypes.DEFAULT_T
         "Файл должен содержать информацию по преподавателям и проверенным заданиям."
     )
 
+class HomeworkCheckAggregator:
+    """инкрементальный подсчёт преподавателей, попавших под правила, по чанкам"""
+
+    def __init__(self, teacher_col, issued_col, checked_col, rules: tuple = None):
+        self.teacher_col = teacher_col
+        self.issued_col = issued_col
+        self.checked_col = checked_col
+        self.rules = compile_rules('homework_check', rules or tuple(DEFAULT_RULES['homework_check'].items()))
+        self.rows_seen = 0
+        self.problems = []
+        self.people = NameSummary(total=('issued', 'checked'))
+
+    @staticmethod
+    def _to_number(s: pd.Series) -> pd.Series:
+        s = s.astype(str).str.strip().str.replace('\xa0', '', regex=False).str.replace(',', '.', regex=False)
+        return pd.to_numeric(s, errors='coerce')
+
+    def feed(self, chunk: pd.DataFrame) -> None:
+        self.rows_seen += len(chunk)
+
+        names = chunk[self.teacher_col].astype(str).str.strip()
+        issued = self._to_number(chunk[self.issued_col])
+        checked = self._to_number(chunk[self.checked_col])
+
+        valid = chunk[self.teacher_col].notna() & (names != '') & issued.notna() & (issued > 0) & checked.notna()
+        self.people.feed(names.where(valid), {'issued': issued, 'checked': checked})
+        pct = checked / issued * 100.0
+        tiers = self.rules.evaluate({'percentage': pct, 'issued': issued, 'checked': checked})
+        mask = valid.to_numpy() & (tiers != '')
+        if mask.any():
+            self.problems.extend(zip(
+                names[mask],
+                issued[mask].astype(int),
+                checked[mask].astype(int),
+                pct[mask].astype(float),
+                tiers[mask],
+            ))
+
+    def result(self) -> list:
+        return sorted(self.problems, key=lambda x: x[3])
+
+    def summary(self) -> pd.DataFrame:
+        """все преподаватели листа: суммы получено/проверено и общий процент"""
+        people = self.people.result()
+        people['percentage'] = people['checked'] / people['issued'] * 100.0
+        return people
+
+
+def analyze_homework_check_sheet(file_path: str, sheet=None, strict: bool = False, rules: tuple = None):
+    """разбор одного листа; None — лист не похож на отчёт по проверке ДЗ"""
+    header, columns, mapping = resolve_file('homework_check', file_path, sheet)
+    if strict and not mapping.recognized:
+        return None
+
+    teacher_col = mapping.get('teacher')
+    issued_col = mapping.get('issued')
+    checked_col = mapping.get('checked')
+
+    if (issued_col is None or checked_col is None) and columns:
+        # заголовки не распознаны — берём первые числовые колонки первой строки данных
+        header_rows = header if isinstance(header, list) else [header]
+        head = read_head(file_path, max(header_rows) + 2, sheet)
+        first_row = head[-1] if len(head) > max(header_rows) + 1 else ()
+        issued_col = checked_col = None
+        for i in range(1, min(len(columns), len(first_row))):
+            if columns[i] == teacher_col:
+                continue
+            val = pd.to_numeric(first_row[i], errors='coerce')
+            if pd.notna(val) and val > 0:
+                if issued_col is None:
+                    issued_col = columns[i]
+                elif checked_col is None:
+                    checked_col = columns[i]
+                    break
+
+    if issued_col is None or checked_col is None:
+        sample = [c.lower() for c in columns[:12]]
+        msg = "❌ не найдены колонки 'получено' или 'проверено'.\nнайденные заголовки:\n"
+        msg += "\n".join(f"{i}: {c}" for i, c in enumerate(sample))
+        return SheetResult(sheet, [], error=msg)
+
+    aggregator = HomeworkCheckAggregator(teacher_col, issued_col, checked_col, rules)
+    for chunk in iter_chunks(file_path, header=header, sheet=sheet):
+        aggregator.feed(chunk)
+    return SheetResult(sheet, aggregator.result(), mapping.notes(), aggregator.rows_seen,
+                       people=aggregator.summary())
+
+
+def _problem_lines(problem_teachers: list, period_text: str, rules) -> list:
+    if not problem_teachers:
+        return [f"✅ проверка заданий за {period_text} в норме у всех преподавателей."]
+    return tier_lines(rules, problem_teachers, lambda p: p[4],
+                      lambda p: f"• {p[0]}: получено {p[1]} | проверено {p[2]} | {p[3]:.1f}%", "преподавателей")
+
+
 async def process_homework_check_file(update: Update, context: ContextTypes.DEFAULT_TYPE, file_path: str) -> None:
     try:
-        df = None
-        for header_row in [[0, 1], None, 1]:
-            try:
-                if header_row is None:
-                    df = pd.read_excel(file_path)
-                else:
-                    df = pd.read_excel(file_path, header=header_row)
-                
-                columns = df.columns.tolist()
-                def col_to_str(c):
-                    if isinstance(c, tuple):
-                        return " ".join([str(x).strip() for x in c if str(x).strip()])
-                    return str(c).strip()
-                
-                cols_lower = [col_to_str(c).lower() for c in columns]
-                if any('получ' in c for c in cols_lower) and any('провер' in c for c in cols_lower):
-                    break
-            except Exception:
-                continue
-        
-        if df is None:
-            df = pd.read_excel(file_path)
-            columns = df.columns.tolist()
-            cols_lower = [col_to_str(c).lower() for c in columns]
-
-        teacher_idx = next((i for i, c in enumerate(cols_lower) if any(k in c for k in ['преподават', 'учител', 'фио'])), 0)
-        issued_idx = next((i for i, c in enumerate(cols_lower) if 'получ' in c), None)
-        checked_idx = next((i for i, c in enumerate(cols_lower) if 'провер' in c), None)
-
-        if issued_idx is None or checked_idx is None:
-            for i in range(1, len(columns)):
-                try:
-                    val = pd.to_numeric(df.iloc[0, i], errors='coerce')
-                    if pd.notna(val) and val > 0:
-                        if issued_idx is None:
-                            issued_idx = i
-                        elif checked_idx is None:
-                            checked_idx = i
-                            break
-                except Exception:
-                    continue
-
-        if issued_idx is None or checked_idx is None:
-            sample = cols_lower[:12]
-            msg = "❌ не найдены колонки 'получено' или 'проверено'.\nнайденные заголовки:\n"
-            msg += "\n".join(f"{i}: {c}" for i, c in enumerate(sample))
+        rules = rules_for_update(update, 'homework_check')
+        compiled = compile_rules('homework_check', rules)
+        sections, failed = split_failed(await analyze_sheets(file_path, analyze_homework_check_sheet, rules))
+        if not sections:
+            msg = failed_message(failed, "❌ ошибка обработки файла.")
             await (update.message.reply_text(msg) if update.message else update.callback_query.edit_message_text(msg))
             return
 
         selected_period = context.user_data.get('hw_check_period', 'month')
         period_text = 'месяц' if selected_period == 'month' else 'неделю'
 
-        problem_teachers = []
-        for idx, row in df.iterrows():
-            try:
-                name = str(row[columns[teacher_idx]]).strip()
-                if not name or pd.isna(row[columns[teacher_idx]]):
-                    continue
-
-                issued = pd.to_numeric(str(row[columns[issued_idx]]).strip().replace('\xa0', '').replace(',', '.'), errors='coerce')
-                checked = pd.to_numeric(str(row[columns[checked_idx]]).strip().replace('\xa0', '').replace(',', '.'), errors='coerce')
-                
-                if pd.notna(issued) and issued > 0 and pd.notna(checked):
-                    pct = (float(checked) / float(issued)) * 100.0
-                    if pct < 70.0:
-                        problem_teachers.append((name, int(issued), int(checked), pct))
-            except Exception:
-                continue
-
-        problem_teachers.sort(key=lambda x: x[3])
-
         lines = [f"✅ отчет по проверке домашних заданий за {period_text}:"]
-        if problem_teachers:
-            lines.append(f"⚠️ преподавателей с проверкой < 70%: {len(problem_teachers)}")
-            lines.extend(f"• {name}: получено {issued} | проверено {checked} | {pct:.1f}%" for name, issued, checked, pct in problem_teachers)
+        lines.extend(failed_lines(failed))
+        for section in sections:
+            lines.extend(section.notes)
+        if len(sections) == 1:
+            lines.extend(_problem_lines(sections[0].items, period_text, compiled))
         else:
-            lines.append(f"✅ все преподаватели проверили ≥ 70% заданий за {period_text}.")
+            for section in sections:
+                lines.append("")
+                lines.append(f"📄 лист «{section.sheet}»")
+                lines.extend(_problem_lines(section.items, period_text, compiled))
+            issued_total = sum(item[1] for section in sections for item in section.items)
+            checked_total = sum(item[2] for section in sections for item in section.items)
+            total = sum(len(section.items) for section in sections)
+            lines.append("")
+            lines.append(f"🧮 итого по {len(sections)} листам: {total} преподавателей под правилами "
+                         f"(получено {issued_total} | проверено {checked_total})")
 
         text = "\n".join(lines)
-        await (update.message.reply_text(text) if update.message else update.callback_query.edit_message_text(text))
+        results = pd.DataFrame(
+            [row + (section.sheet,) for section in sections for row in section.items],
+            columns=['name', 'issued', 'checked', 'percentage', 'tier', 'sheet'],
+        )
+        report = StoredReport.from_results('homework_check', results, 'percentage', people=people_frame(sections))
+        await send_and_store(update, context, text, parse_mode=None, metadata={'type': 'homework_check'}, report=report)
 
     except Exception:
         logger.exception("ошибка при обработке файла проверки ДЗ")
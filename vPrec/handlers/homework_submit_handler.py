@@ -3,7 +3,12 @@ import logging
 import pandas as pd
 from telegram import Update
 from telegram.ext import ContextTypes
-from .report_store import send_and_store
+from .report_store import send_and_store, StoredReport
+from .entity_index import NameSummary, people_frame
+from .excel_stream import iter_chunks
+from .column_schema import resolve_file
+from .workers import SheetResult, analyze_sheets, split_failed, failed_lines, failed_message
+from .rules import DEFAULT_RULES, compile_rules, rules_for_update, tier_lines
 
 logger = logging.getLogger(__name__)
 
@@ -15,101 +20,103 @@ async def start_homework_submit_report(update: Update, context: ContextTypes.DEF
         "группам и проценту выполненных заданий."
     )
 
+class HomeworkSubmitAggregator:
+    """инкрементальный подсчёт студентов, попавших под правила сдачи ДЗ, по чанкам"""
+
+    def __init__(self, student_col, group_col, percentage_col, rules: tuple = None):
+        self.student_col = student_col
+        self.group_col = group_col
+        self.percentage_col = percentage_col
+        self.rules = compile_rules('homework_submit', rules or tuple(DEFAULT_RULES['homework_submit'].items()))
+        self.rows_seen = 0
+        self.problems = []
+        self.people = NameSummary(mean=('percentage',))
+
+    def feed(self, chunk: pd.DataFrame) -> None:
+        self.rows_seen += len(chunk)
+
+        names = chunk[self.student_col]
+        raw = chunk[self.percentage_col]
+        pct_str = raw.astype(str).str.strip().str.replace('\xa0', '', regex=False)
+        pct_str = pct_str.str.replace(',', '.', regex=False).str.replace('%', '', regex=False)
+        pct = pd.to_numeric(pct_str, errors='coerce')
+        pct = pct.where(~pct.between(0.0, 1.0), pct * 100.0)
+
+        self.people.feed(names, {'percentage': pct},
+                         chunk[self.group_col] if self.group_col is not None else None)
+        tiers = self.rules.evaluate({'percentage': pct})
+        mask = (names.notna() & raw.notna()).to_numpy() & (tiers != '')
+        if not mask.any():
+            return
+
+        if self.group_col is not None:
+            groups = chunk.loc[mask, self.group_col]
+            groups = groups.where(groups.notna(), '').astype(str).str.strip()
+        else:
+            groups = pd.Series('', index=names[mask].index)
+
+        for name, group, value, tier in zip(names[mask].astype(str).str.strip(), groups, pct[mask].astype(float), tiers[mask]):
+            self.problems.append({'name': name, 'group': group, 'percentage': value, 'tier': tier})
+
+    def result(self) -> list:
+        return sorted(self.problems, key=lambda x: x['percentage'])
+
+
+def analyze_homework_submit_sheet(file_path: str, sheet=None, strict: bool = False, rules: tuple = None):
+    """разбор одного листа; None — лист не похож на отчёт по сдаче ДЗ"""
+    header, _, mapping = resolve_file('homework_submit', file_path, sheet)
+    if strict and not mapping.recognized:
+        return None
+    if mapping.get('percentage') is None:
+        return SheetResult(sheet, [], error="❌ Не удалось найти колонку 'Percentage Homework' в файле.")
+
+    aggregator = HomeworkSubmitAggregator(mapping.get('student'), mapping.get('group'), mapping.get('percentage'), rules)
+    for chunk in iter_chunks(file_path, header=header, sheet=sheet):
+        aggregator.feed(chunk)
+    return SheetResult(sheet, aggregator.result(), mapping.notes(), aggregator.rows_seen,
+                       people=aggregator.people.result())
+
+
+def _student_line(s: dict) -> str:
+    group_text = f" ({s['group']})" if s['group'] else ""
+    return f"• {s['name']}{group_text}: {s['percentage']:.1f}%"
+
+
+def _problem_lines(problem_students: list, rules) -> list:
+    if not problem_students:
+        return ["✅ Выполнение заданий в норме у всех студентов."]
+    return tier_lines(rules, problem_students, lambda s: s['tier'], _student_line, "студентов")
+
+
 async def process_homework_submit_file(update: Update, context: ContextTypes.DEFAULT_TYPE, file_path: str) -> None:
     """обработка файла сданных ДЗ"""
     try:
-        df = pd.read_excel(file_path)
-
-        columns = df.columns.tolist()
-
-        def col_to_str(c):
-            if isinstance(c, tuple):
-                return " ".join([str(x).strip() for x in c if str(x).strip()])
-            return str(c).strip()
-
-        cols_lower = [col_to_str(c).lower() for c in columns]
-
-        student_idx = None
-        for i, c in enumerate(cols_lower):
-            if any(k in c for k in ['фио', 'студент', 'имя', 'name']):
-                student_idx = i
-                break
-        if student_idx is None:
-            student_idx = 0
-
-        group_idx = None
-        for i, c in enumerate(cols_lower):
-            if any(k in c for k in ['группа', 'group']):
-                group_idx = i
-                break
-
-        percentage_idx = None
-        for i, c in enumerate(cols_lower):
-            if 'percentage' in c and 'homework' in c:
-                percentage_idx = i
-                break
-        
-        if percentage_idx is None:
-            for i, c in enumerate(cols_lower):
-                if 'percentage' in c:
-                    percentage_idx = i
-                    break
-
-        if percentage_idx is None:
-            msg = "❌ Не удалось найти колонку 'Percentage Homework' в файле."
+        rules = rules_for_update(update, 'homework_submit')
+        compiled = compile_rules('homework_submit', rules)
+        sections, failed = split_failed(await analyze_sheets(file_path, analyze_homework_submit_sheet, rules))
+
+        if not sections:
+            msg = failed_message(failed, "❌ Ошибка обработки файла.")
             if update.message:
                 await update.message.reply_text(msg)
             elif update.callback_query:
                 await update.callback_query.edit_message_text(msg)
             return
 
-        problem_students = []
-
-        for idx, row in df.iterrows():
-            try:
-                name = row[columns[student_idx]]
-                if pd.isna(name):
-                    continue
-                name = str(name).strip()
-
-                group = ""
-                if group_idx is not None:
-                    group_val = row[columns[group_idx]]
-                    if pd.notna(group_val):
-                        group = str(group_val).strip()
-
-                if percentage_idx is not None:
-                    pct_raw = row[columns[percentage_idx]]
-                    if pd.isna(pct_raw):
-                        continue
-                    pct_str = str(pct_raw).strip().replace('\xa0', '').replace(',', '.').replace('%', '')
-                    try:
-                        pct = float(pct_str)
-                        if 0.0 <= pct <= 1.0:
-                            pct *= 100.0
-
-                        if pct < 70.0:
-                            problem_students.append({
-                                'name': name,
-                                'group': group,
-                                'percentage': pct
-                            })
-                    except ValueError:
-                        continue
-
-            except Exception:
-                continue
-
-        problem_students.sort(key=lambda x: x['percentage'])
-
         lines = ["📝 Отчет по сданным домашним заданиям:"]
-        if problem_students:
-            lines.append(f"⚠️ Студентов с выполнением < 70%: {len(problem_students)}")
-            for s in problem_students:
-                group_text = f" ({s['group']})" if s['group'] else ""
-                lines.append(f"• {s['name']}{group_text}: {s['percentage']:.1f}%")
+        lines.extend(failed_lines(failed))
+        for section in sections:
+            lines.extend(section.notes)
+        if len(sections) == 1:
+            lines.extend(_problem_lines(sections[0].items, compiled))
         else:
-            lines.append("✅ Все студенты выполнили ≥ 70% заданий.")
+            for section in sections:
+                lines.append("")
+                lines.append(f"📄 Лист «{section.sheet}»")
+                lines.extend(_problem_lines(section.items, compiled))
+            total = sum(len(section.items) for section in sections)
+            lines.append("")
+            lines.append(f"🧮 Итого по {len(sections)} листам: {total} студентов под правилами")
 
         text = "\n".join(lines)
         
@@ -129,11 +136,16 @@ async def process_homework_submit_file(update: Update, context: ContextTypes.DEF
             if current:
                 messages.append(current)
 
+        results = pd.DataFrame(
+            [(s['name'], s['group'], s['percentage'], s['tier'], section.sheet) for section in sections for s in section.items],
+            columns=['name', 'group', 'percentage', 'tier', 'sheet'],
+        )
+        report = StoredReport.from_results('homework_submit', results, 'percentage', people=people_frame(sections))
         if update.message:
             for msg in messages:
-                await send_and_store(update, context, msg, parse_mode=None, metadata={'type': 'homework_submit'})
+                await send_and_store(update, context, msg, parse_mode=None, metadata={'type': 'homework_submit'}, report=report)
         elif update.callback_query:
-            await send_and_store(update, context, messages[0], parse_mode=None, metadata={'type': 'homework_submit'})
+            await send_and_store(update, context, messages[0], parse_mode=None, metadata={'type': 'homework_submit'}, report=report)
 
     except Exception:
         logger.exception("ошибка при обработке файла сданных ДЗ")
@@ -1,11 +1,17 @@
 """Обработчик отчета по темам занятий"""
+import os
 import logging
-import pandas as pd
 import re
+import tempfile
+import numpy as np
+import pandas as pd
 from telegram import Update
 from telegram.ext import ContextTypes
 from telegram.helpers import escape_markdown
-from .report_store import send_and_store
+from .report_store import send_and_store, StoredReport
+from .excel_stream import iter_chunks, iter_rows, sheet_names, write_sheets
+from .column_schema import resolve_file
+from .workers import SheetResult, analyze_sheets, run_in_pool, split_failed, failed_lines, failed_message
 
 logger = logging.getLogger(__name__)
 
@@ -16,89 +22,258 @@ async def start_lessons_report(update: Update, context: ContextTypes.DEFAULT_TYP
     else:
         await update.message.reply_text("📚 Загрузите файл с темами уроков (Excel).\nПроверяется формат: 'Урок № X. Тема: ...'")
 
-async def process_lessons_file(update: Update, context: ContextTypes.DEFAULT_TYPE, file_path: str) -> None:
-    try:
-        df = pd.read_excel(file_path, header=0)
+# шаблоны компилируются один раз; проверка идёт векторно через pandas .str
+TOPIC_RE = re.compile(r'^Урок\s*№\s*\d+\.?\s*Тема\s*:\s*.+', re.IGNORECASE)
+_EMPTY_TOPIC_RE = re.compile(r'^Урок\s*№\s*\d+\.?\s*Тема\s*:\s*$', re.IGNORECASE)
+_LESSON_RE = re.compile(r'^Урок\s*№\s*\d+', re.IGNORECASE)
+# урок с номером, пусть и без «№»: «Урок 5 Тема - ...» — ошибка разделителя, а не отсутствие урока
+_LESSON_LOOSE_RE = re.compile(r'^Урок\w*\s*(?:№|#)?\s*\d+', re.IGNORECASE)
+_TOPIC_LABEL_RE = re.compile(r'Тема\s*:', re.IGNORECASE)
+_TOPIC_WORD_RE = re.compile(r'Тема', re.IGNORECASE)
+# разбор «как получится»: номер урока и текст темы для автоисправления
+_PARTS_RE = re.compile(
+    r'^\s*(?:урок\w*)?\s*(?:№|#|n\b|no\.?)?\s*(?P<num>\d+)\s*[.,:;)\-–—]*\s*'
+    r'(?:тема\s*[:.,;\-–—]*)?\s*(?P<topic>.*?)\s*$',
+    re.IGNORECASE,
+)
 
-        topic_col = None
-        if 'Тема урока' in df.columns:
-            topic_col = 'Тема урока'
-        else:
-            for col in df.columns:
-                if isinstance(col, str) and 'тема' in col.lower():
+CATEGORY_TITLES = {
+    'no_lesson': "🔢 Нет «Урок №»",
+    'no_topic_label': "🏷 Нет «Тема:»",
+    'separator': "➖ Неверный разделитель",
+    'empty': "🕳 Пустая тема",
+}
+MAX_EXAMPLES = 20
+FIX_BATCH_ROWS = 5000  # строк за раз при записи исправленной книги
+
+
+def _normalize(topics: pd.Series) -> pd.Series:
+    text = topics.astype(str).str.strip()
+    return text.mask(topics.isna(), '')
+
+
+def suggest_fixes(text: pd.Series) -> pd.Series:
+    """исправленная тема для строк, которые можно починить, иначе NaN.
+
+    исправляются только строки вида «Урок[ №] N ...» с непустой темой —
+    произвольный текст с числом в начале («5 марта контрольная») не трогаем
+    """
+    parts = text.str.extract(_PARTS_RE)
+    fixable = (~text.str.match(TOPIC_RE) & text.str.match(_LESSON_LOOSE_RE)
+               & parts['num'].notna() & (parts['topic'].fillna('') != ''))
+    return ("Урок № " + parts['num'] + ". Тема: " + parts['topic']).where(fixable)
+
+
+class LessonTopicsCheck:
+    """векторная проверка формата тем по чанкам с группировкой ошибок и автоисправлением"""
+
+    def __init__(self, sheet=None, header=0, topic_idx: int = 0):
+        self.sheet = sheet
+        self.header = header
+        self.topic_idx = topic_idx
+        self.total = 0
+        self.correct = 0
+        self.counts = {}
+        self.examples = {k: [] for k in CATEGORY_TITLES}
+        self.fixable = 0  # сами исправления не копятся — write_corrected_workbook считает их заново
+
+    def feed(self, topics: pd.Series) -> None:
+        text = _normalize(topics)
+        self.total += len(text)
+
+        ok = text.str.match(TOPIC_RE)
+        self.correct += int(ok.sum())
+        bad = text[~ok]
+        if bad.empty:
+            return
+
+        has_lesson = bad.str.match(_LESSON_RE)
+        has_label = bad.str.contains(_TOPIC_LABEL_RE)
+        has_word = bad.str.contains(_TOPIC_WORD_RE)
+        empty = (bad == '') | bad.str.match(_EMPTY_TOPIC_RE)
+        # форма с разделителем проверяется до отсутствия «Урок №»
+        wrong_separator = has_word & ~has_label & bad.str.match(_LESSON_LOOSE_RE)
+        category = pd.Series(np.select(
+            [empty, wrong_separator, ~has_lesson, ~has_word],
+            ['empty', 'separator', 'no_lesson', 'no_topic_label'],
+            default='separator',
+        ), index=bad.index)
+
+        suggestion = suggest_fixes(bad)
+        self.fixable += int(suggestion.notna().sum())
+
+        for name, group in category.groupby(category, sort=False):
+            self.counts[name] = self.counts.get(name, 0) + len(group)
+            room = MAX_EXAMPLES - len(self.examples[name])
+            if room > 0:
+                idx = group.index[:room]
+                self.examples[name].extend(zip(idx, bad[idx], suggestion[idx].where(suggestion[idx].notna(), None)))
+
+
+def _fixed_rows(rows, skip: int, topic_idx: int):
+    """строки листа с исправленными темами; исправления считаются пачками по мере чтения"""
+    batch = []
+
+    def flush():
+        topics = pd.Series([row[topic_idx] if len(row) > topic_idx else None for row in batch], dtype=object)
+        for row, fix in zip(batch, suggest_fixes(_normalize(topics)).tolist()):
+            if isinstance(fix, str):
+                row = list(row) + [None] * (topic_idx + 1 - len(row))
+                row[topic_idx] = fix
+            yield row
+        batch.clear()
+
+    for i, row in enumerate(rows):
+        if i < skip:
+            yield row
+            continue
+        batch.append(row)
+        if len(batch) >= FIX_BATCH_ROWS:
+            yield from flush()
+    if batch:
+        yield from flush()
+
+
+def write_corrected_workbook(src_path: str, dst_path: str, checks: list) -> None:
+    """копия всей книги с исправленными темами — заменяет исходный файл при повторном импорте.
+
+    листы без проверки копируются как есть; исправления не держатся в памяти, а
+    пересчитываются при записи, поэтому исправляется весь файл, а не первые N строк
+    """
+    names = sheet_names(src_path)
+    by_sheet = {(check.sheet if check.sheet is not None else names[0]): check for check in checks}
+
+    def rows(sheet):
+        check = by_sheet.get(sheet)
+        if check is None:
+            return iter_rows(src_path, sheet)
+        skip = (max(check.header) if isinstance(check.header, list) else check.header) + 1
+        return _fixed_rows(iter_rows(src_path, sheet), skip, check.topic_idx)
+
+    write_sheets(dst_path, ((sheet, rows(sheet)) for sheet in names))
+
+
+def analyze_lessons_sheet(file_path: str, sheet=None, strict: bool = False):
+    """разбор одного листа; None — в листе нет колонки с темами"""
+    header, columns, mapping = resolve_file('lessons', file_path, sheet)
+    topic_col = mapping.get('topic')
+    if topic_col is None:
+        if strict:
+            return None
+        # заголовок не подсказал — берём первую непустую колонку
+        first_chunk = next(iter_chunks(file_path, header=header, sheet=sheet), None)
+        if first_chunk is not None:
+            for col in first_chunk.columns:
+                sample = first_chunk[col].dropna().astype(str).str.strip()
+                if len(sample) > 0:
                     topic_col = col
                     break
-            if topic_col is None:
-                for col in df.columns:
-                    sample = df[col].dropna().astype(str).str.strip()
-                    if len(sample) > 0:
-                        topic_col = col
-                        break
-
-        if topic_col is None:
-            await update.message.reply_text("❌ Не удалось определить колонку с темами уроков.")
+
+    if topic_col is None:
+        return SheetResult(sheet, None, error="❌ Не удалось определить колонку с темами уроков.")
+
+    check = LessonTopicsCheck(sheet, header, columns.index(topic_col))
+    for chunk in iter_chunks(file_path, header=header, sheet=sheet):
+        check.feed(chunk[topic_col])
+    return SheetResult(sheet, check, rows=check.total)
+
+
+def _category_lines(check) -> list:
+    data_row_offset = (max(check.header) if isinstance(check.header, list) else check.header) + 2
+    lines = []
+    for category, title in CATEGORY_TITLES.items():
+        count = check.counts.get(category, 0)
+        if not count:
+            continue
+        lines.append(f"{title}: {count}")
+        for idx, topic_text, suggestion in check.examples[category]:
+            line = f"• [строка {idx + data_row_offset}] {topic_text}"
+            if suggestion:
+                line += f" → {suggestion}"
+            lines.append(line)
+        if count > len(check.examples[category]):
+            lines.append(f"... и ещё {count - len(check.examples[category])}")
+        lines.append("")
+    return lines
+
+
+async def process_lessons_file(update: Update, context: ContextTypes.DEFAULT_TYPE, file_path: str) -> None:
+    try:
+        sections, failed = split_failed(await analyze_sheets(file_path, analyze_lessons_sheet))
+        if not sections:
+            await update.message.reply_text(failed_message(failed, "❌ Ошибка при чтении файла."))
             return
 
-        topics_series = df[topic_col].astype(str).fillna('').str.strip()
-        if topics_series.dropna().shape[0] == 0 and all(t == '' for t in topics_series):
+        checks = [section.items for section in sections]
+        total = sum(check.total for check in checks)
+        correct = sum(check.correct for check in checks)
+        if total == 0:
             await update.message.reply_text("❌ Нет тем уроков в выбранной колонке.")
             return
 
-        pattern = re.compile(r'^Урок\s*№\s*\d+\.?\s*Тема\s*:\s*.+', re.IGNORECASE)
-
-        correct = []
-        incorrect = []
-
-        for idx, topic in topics_series.items():
-            topic_text = topic if isinstance(topic, str) else str(topic)
-            if pattern.match(topic_text):
-                correct.append(topic_text)
-            else:
-                row_no = int(idx) + 2 if hasattr(idx, '__int__') else idx
-                incorrect.append((row_no, topic_text))
+        incorrect_count = total - correct
+        counts = {}
+        for check in checks:
+            for k, v in check.counts.items():
+                counts[k] = counts.get(k, 0) + v
+        results = pd.DataFrame(
+            [(CATEGORY_TITLES[k], v) for k, v in counts.items()] + [("✅ Корректные", correct)],
+            columns=['name', 'count'],
+        )
+        stored = StoredReport.from_results('lessons', results, 'count')
 
         report_lines = [
             "📚 Отчет по темам занятий",
+            *failed_lines(failed),
             "",
-            f"✅ Корректных тем: {len(correct)}",
-            f"❌ Некорректных тем: {len(incorrect)}",
+            f"✅ Корректных тем: {correct}",
+            f"❌ Некорректных тем: {incorrect_count}",
             ""
         ]
 
-        if incorrect:
-            report_lines.append("примеры некорректных тем (первые 100):")
-            for row_no, topic_text in incorrect[:100]:
-                report_lines.append(f"• [строка {row_no}] {topic_text}")
-            if len(incorrect) > 100:
-                report_lines.append(f"... и ещё {len(incorrect) - 100} некорректных.")
-        else:
+        if not incorrect_count:
             report_lines.append("🎉 Все темы в правильном формате!")
-
-        report = "\n".join(report_lines)
-        MAX_LEN = 4000
-
-        if not incorrect:
-            escaped = escape_markdown(report, version=2)
-            await update.message.reply_text(escaped, parse_mode='MarkdownV2')
+            escaped = escape_markdown("\n".join(report_lines), version=2)
+            await send_and_store(update, context, escaped, parse_mode='MarkdownV2', metadata={'type': 'lessons'}, report=stored)
             return
 
-        header_lines = report_lines[:5]
-        header = "\n".join(header_lines) + "\n"
-        item_lines = [f"• [строка {row_no}] {topic_text}" for row_no, topic_text in incorrect]
+        item_lines = []
+        if len(checks) == 1:
+            item_lines.extend(_category_lines(checks[0]))
+        else:
+            for check in checks:
+                item_lines.append(f"📄 Лист «{check.sheet}»: корректных {check.correct}, некорректных {check.total - check.correct}")
+                item_lines.extend(_category_lines(check))
+        fixes_count = sum(check.fixable for check in checks)
+        if fixes_count:
+            item_lines.append(f"🛠 Автоисправлено тем: {fixes_count} — исправленный файл ниже.")
 
-        cur = header
+        MAX_LEN = 4000
+        cur = "\n".join(report_lines) + "\n"
         for line in item_lines:
             candidate = cur + line + "\n"
             if len(candidate) > MAX_LEN:
                 escaped = escape_markdown(cur, version=2)
-                await send_and_store(update, context, escaped, parse_mode='MarkdownV2', metadata={'type': 'lessons'})
+                await send_and_store(update, context, escaped, parse_mode='MarkdownV2', metadata={'type': 'lessons'}, report=stored)
                 cur = line + "\n"
             else:
                 cur = candidate
 
         if cur.strip():
             escaped = escape_markdown(cur, version=2)
-            await send_and_store(update, context, escaped, parse_mode='MarkdownV2', metadata={'type': 'lessons'})
+            await send_and_store(update, context, escaped, parse_mode='MarkdownV2', metadata={'type': 'lessons'}, report=stored)
+
+        if fixes_count:
+            # file_path может быть каталогом снимка — исправленную книгу пишем во временный файл
+            fd, fixed_path = tempfile.mkstemp(prefix="bot_", suffix=".fixed.xlsx")
+            os.close(fd)
+            try:
+                await run_in_pool(write_corrected_workbook, file_path, fixed_path, checks)
+                with open(fixed_path, "rb") as f:
+                    await update.message.reply_document(f, filename="Темы уроков (исправлено).xlsx")
+            finally:
+                if os.path.exists(fixed_path):
+                    os.remove(fixed_path)
 
     except Exception:
         logger.exception("ошибка при обработке тем занятий")
@@ -0,0 +1,353 @@
+"""Подключаемые LLM-бэкенды: Mistral, локальный OpenAI-совместимый сервер и rule-based резерв.
+
+Маршрутизатор выбирает бэкенд по здоровью и задержке, дублирует (hedge) запрос
+на следующий бэкенд, если первый не ответил за LLM_HEDGE_AFTER секунд, и
+отключает сбоящие бэкенды circuit breaker'ом. Если удалённые бэкенды недоступны,
+отвечает детерминированный rule-based суммаризатор.
+"""
+import os
+import re
+import time
+import logging
+import threading
+from abc import ABC, abstractmethod
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+import requests
+
+logger = logging.getLogger(__name__)
+
+MISTRAL_API_KEY = os.getenv("MISTRAL_API_KEY")
+MISTRAL_MODEL = os.getenv("MISTRAL_MODEL", "mistral-large-latest")
+MISTRAL_ENDPOINT = os.getenv(
+    "MISTRAL_ENDPOINT",
+    "https://api.mistral.ai/v1/chat/completions",
+)
+LOCAL_LLM_ENDPOINT = os.getenv("LOCAL_LLM_ENDPOINT")  # например http://127.0.0.1:8000/v1/chat/completions
+LOCAL_LLM_MODEL = os.getenv("LOCAL_LLM_MODEL", "local")
+
+LLM_DEADLINE = float(os.getenv("LLM_DEADLINE", "30"))
+LLM_HEDGE_AFTER = float(os.getenv("LLM_HEDGE_AFTER", "6"))
+LLM_HEALTH_INTERVAL = float(os.getenv("LLM_HEALTH_INTERVAL", "60"))
+LLM_BREAKER_FAILURES = int(os.getenv("LLM_BREAKER_FAILURES", "3"))
+LLM_BREAKER_RESET = float(os.getenv("LLM_BREAKER_RESET", "60"))
+
+
+class LLMBackend(ABC):
+    """базовый бэкенд: complete() возвращает текст или бросает исключение"""
+    name = "base"
+
+    @abstractmethod
+    def complete(self, prompt: str, timeout: float) -> str:
+        ...
+
+    def health_check(self, timeout: float = 3.0) -> bool:
+        return True
+
+
+class OpenAICompatibleBackend(LLMBackend):
+    """любой сервер с /v1/chat/completions (llama.cpp server, vLLM, Mistral API)"""
+
+    def __init__(self, name: str, endpoint: str, model: str, api_key: str = None,
+                 temperature: float = 0.6, max_tokens: int = 512, session: requests.Session = None):
+        self.name = name
+        self.endpoint = endpoint
+        self.model = model
+        self.api_key = api_key
+        self.temperature = temperature
+        self.max_tokens = max_tokens
+        self.session = session or requests.Session()
+
+    def _headers(self) -> dict:
+        headers = {"Content-Type": "application/json"}
+        if self.api_key:
+            headers["Authorization"] = f"Bearer {self.api_key}"
+        return headers
+
+    def complete(self, prompt: str, timeout: float) -> str:
+        data = {
+            "model": self.model,
+            "messages": [{"role": "user", "content": prompt}],
+            "temperature": self.temperature,
+            "max_tokens": self.max_tokens,
+        }
+
+        try:
+            resp = self.session.post(self.endpoint, json=data, headers=self._headers(), timeout=timeout)
+        except requests.RequestException as e:
+            raise RuntimeError(f"ошибка сети при обращении к {self.name}: {e}")
+
+        if resp.status_code == 404:
+            body = resp.text.strip()
+            raise RuntimeError(
+                f"{self.name} вернул 404 not found для url {self.endpoint}. "
+                "проверьте модель и адрес эндпоинта." +
+                (f" ответ: {body}" if body else "")
+            )
+
+        try:
+            resp.raise_for_status()
+        except requests.HTTPError as e:
+            body = resp.text.strip()
+            raise RuntimeError(f"ошибка {self.name} {resp.status_code}: {body or str(e)}")
+
+        try:
+            j = resp.json()
+        except Exception:
+            return resp.text or ""
+
+        if isinstance(j, dict) and "choices" in j and isinstance(j["choices"], list) and j["choices"]:
+            choice = j["choices"][0]
+            if isinstance(choice, dict) and "message" in choice and isinstance(choice["message"], dict):
+                return choice["message"].get("content", "")
+
+        return j.get("message") if isinstance(j, dict) and "message" in j else ""
+
+    def health_check(self, timeout: float = 3.0) -> bool:
+        # у OpenAI-совместимых серверов рядом с chat/completions живёт /models
+        models_url = re.sub(r"/chat/completions/?$", "/models", self.endpoint)
+        try:
+            resp = self.session.get(models_url, headers=self._headers(), timeout=timeout)
+        except requests.RequestException:
+            return False
+        return resp.status_code < 500
+
+
+class MistralBackend(OpenAICompatibleBackend):
+    def __init__(self, endpoint: str = MISTRAL_ENDPOINT, model: str = MISTRAL_MODEL, api_key: str = MISTRAL_API_KEY, **kwargs):
+        super().__init__("mistral", endpoint, model, api_key=api_key, **kwargs)
+
+
+class RuleBasedBackend(LLMBackend):
+    """детерминированная сводка без модели — последний рубеж, когда ai недоступен"""
+    name = "rules"
+
+    _number_re = re.compile(r"-?\d+(?:[.,]\d+)?")
+
+    def complete(self, prompt: str, timeout: float = None) -> str:
+        prefixes = ("вопрос пользователя", "задача от пользователя")
+        lines = [l.strip() for l in prompt.splitlines() if l.strip()]
+        question = next((l.split(":", 1)[1].strip() for l in reversed(lines) if l.lower().startswith(prefixes)), "")
+        data_lines = [l for l in lines if not l.lower().startswith(prefixes)
+                      and not l.endswith(":") and ("," in l or "|" in l or ":" in l)]
+        numbers = [float(n.replace(",", ".")) for l in data_lines for n in self._number_re.findall(l)]
+
+        out = ["⚙️ ai сейчас недоступен, вот автоматическая сводка по данным:"]
+        if question:
+            out.append(f"запрос: {question}")
+        out.append(f"строк с данными: {len(data_lines)}")
+        if numbers:
+            out.append(f"числовых значений: {len(numbers)}, мин {min(numbers):g}, макс {max(numbers):g}, "
+                       f"среднее {sum(numbers) / len(numbers):.1f}")
+        if data_lines:
+            out.append("первые строки:")
+            out.extend(f"• {l[:200]}" for l in data_lines[:5])
+        return "\n".join(out)
+
+
+class CircuitBreaker:
+    """closed -> open после N ошибок подряд; через reset_after секунд (half-open) пропускает
+    ровно один пробный запрос: успех закрывает breaker, ошибка снова открывает"""
+
+    def __init__(self, failures: int = LLM_BREAKER_FAILURES, reset_after: float = LLM_BREAKER_RESET, clock=time.monotonic):
+        self.max_failures = failures
+        self.reset_after = reset_after
+        self.clock = clock
+        self.failures = 0
+        self.opened_at = None
+        self.trial = False  # пробный запрос half-open в полёте
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        if self.clock() - self.opened_at >= self.reset_after:
+            return "half-open"
+        return "open"
+
+    def available(self) -> bool:
+        """можно ли ставить бэкенд в очередь; разрешение не расходует"""
+        state = self.state
+        return state == "closed" or (state == "half-open" and not self.trial)
+
+    def allow(self) -> bool:
+        """разрешение на вызов; в half-open выдаётся один раз до исхода пробного запроса"""
+        with self._lock:
+            state = self.state
+            if state == "closed":
+                return True
+            if state == "half-open" and not self.trial:
+                self.trial = True
+                return True
+            return False
+
+    def record_success(self) -> None:
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self.trial = False
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self.failures += 1
+            if self.failures >= self.max_failures or self.opened_at is not None:
+                self.opened_at = self.clock()
+            self.trial = False
+
+
+class _BackendState:
+    def __init__(self, backend: LLMBackend, breaker: CircuitBreaker):
+        self.backend = backend
+        self.breaker = breaker
+        self.latency = None  # EWMA, секунды
+        self.healthy = True
+        self.checked_at = None
+        self.checking = False
+
+    def record_latency(self, seconds: float, alpha: float = 0.3) -> None:
+        self.latency = seconds if self.latency is None else alpha * seconds + (1 - alpha) * self.latency
+
+
+class _Attempt:
+    """один вызов бэкенда; исход попадает в breaker ровно один раз —
+    от самого вызова или от маршрутизатора по дедлайну, что случится раньше"""
+
+    def __init__(self, state: _BackendState):
+        self.state = state
+        self._settled = False
+        self._lock = threading.Lock()
+
+    def settle(self, ok: bool, latency: float = None) -> bool:
+        with self._lock:
+            if self._settled:
+                return False
+            self._settled = True
+        if ok:
+            self.state.breaker.record_success()
+            self.state.record_latency(latency)
+        else:
+            self.state.breaker.record_failure()
+        return True
+
+
+class LLMRouter:
+    def __init__(self, backends: list, fallback: LLMBackend = None, deadline: float = LLM_DEADLINE,
+                 hedge_after: float = LLM_HEDGE_AFTER, health_interval: float = LLM_HEALTH_INTERVAL,
+                 breaker_factory=CircuitBreaker, clock=time.monotonic):
+        self.states = [_BackendState(b, breaker_factory()) for b in backends]
+        self.fallback = fallback or RuleBasedBackend()
+        self.deadline = deadline
+        self.hedge_after = hedge_after
+        self.health_interval = health_interval
+        self.clock = clock
+        self._pool = ThreadPoolExecutor(max_workers=max(4, 2 * len(backends)), thread_name_prefix="llm")
+
+    def _refresh_health(self, state: _BackendState) -> None:
+        """проверка здоровья в фоне, не задерживая текущий запрос"""
+        if state.checking or (state.checked_at is not None and self.clock() - state.checked_at < self.health_interval):
+            return
+        state.checking = True
+
+        def check():
+            try:
+                state.healthy = state.backend.health_check()
+            except Exception:
+                state.healthy = False
+            finally:
+                state.checked_at = self.clock()
+                state.checking = False
+
+        self._pool.submit(check)
+
+    def candidates(self) -> list:
+        """доступные бэкенды: сначала здоровые, затем по средней задержке"""
+        for s in self.states:
+            self._refresh_health(s)
+        ready = [s for s in self.states if s.breaker.available()]
+        return sorted(ready, key=lambda s: (not s.healthy, s.latency if s.latency is not None else 0.0))
+
+    def _run(self, attempt: _Attempt, prompt: str, timeout: float) -> str:
+        started = self.clock()
+        try:
+            reply = attempt.state.backend.complete(prompt, timeout)
+        except Exception:
+            attempt.settle(False)
+            raise
+        if not reply:
+            attempt.settle(False)
+            raise RuntimeError(f"{attempt.state.backend.name} вернул пустой ответ")
+        attempt.settle(True, self.clock() - started)
+        return reply
+
+    def complete(self, prompt: str) -> str:
+        queue = self.candidates()
+        started = self.clock()
+        pending = {}
+
+        def launch():
+            # breaker мог открыться или отдать пробный запрос другому вызову, пока бэкенд ждал в очереди
+            while queue:
+                state = queue.pop(0)
+                if state.breaker.allow():
+                    remaining = max(1.0, self.deadline - (self.clock() - started))
+                    attempt = _Attempt(state)
+                    pending[self._pool.submit(self._run, attempt, prompt, remaining)] = attempt
+                    return
+
+        launch()
+        while pending:
+            remaining = self.deadline - (self.clock() - started)
+            if remaining <= 0:
+                break
+            # пока есть запасные бэкенды — ждём только до порога хеджирования
+            timeout = min(self.hedge_after, remaining) if queue else remaining
+            done, _ = wait(pending, timeout=timeout, return_when=FIRST_COMPLETED)
+            if not done:
+                if queue:
+                    logger.info("llm: %s не ответил за %.1fс, дублирую запрос",
+                                ", ".join(a.state.backend.name for a in pending.values()), self.hedge_after)
+                    launch()
+                continue
+            for fut in done:
+                attempt = pending.pop(fut)
+                try:
+                    return fut.result()
+                except Exception as e:
+                    logger.warning("llm-бэкенд %s не справился: %s", attempt.state.backend.name, e)
+            if queue and not pending:
+                launch()
+
+        for fut, attempt in pending.items():
+            # не дождались — считаем отказом, чтобы breaker увидел зависший бэкенд;
+            # поздний ответ этой попытки в breaker уже не попадёт
+            fut.cancel()
+            attempt.settle(False)
+        logger.warning("llm: удалённые бэкенды недоступны, отвечает %s", self.fallback.name)
+        return self.fallback.complete(prompt, timeout=None)
+
+
+def build_router() -> LLMRouter:
+    """бэкенды из окружения: Mistral при наличии ключа, локальный сервер при наличии адреса"""
+    backends = []
+    if MISTRAL_API_KEY:
+        backends.append(MistralBackend())
+    if LOCAL_LLM_ENDPOINT:
+        backends.append(OpenAICompatibleBackend("local", LOCAL_LLM_ENDPOINT, LOCAL_LLM_MODEL))
+    return LLMRouter(backends)
+
+
+_router = None
+_router_lock = threading.Lock()
+
+
+def get_router() -> LLMRouter:
+    global _router
+    with _router_lock:
+        if _router is None:
+            _router = build_router()
+        return _router
+
+
+def complete(prompt: str) -> str:
+    """синхронный вызов; из корутин — через run_in_executor"""
+    return get_router().complete(prompt)
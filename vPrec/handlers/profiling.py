@@ -0,0 +1,216 @@
+"""Выборочное профилирование запросов: этапы, cProfile (включая пул процессов) и пик памяти.
+
+Включается переменной PROFILE_SAMPLE_PERCENT или командой /profile у администратора.
+Для каждого попавшего в выборку запроса в PROFILE_DIR сохраняются .prof (открывается
+snakeviz/pstats) и .json со временем этапов и пиковой памятью, а в чат администратора
+уходят самые горячие функции.
+
+Разбор книг идёт в пуле процессов, поэтому по умолчанию профилируются только вызовы
+в воркерах — это дёшево и не мешает остальным запросам. PROFILE_MAIN=1 добавляет
+cProfile/tracemalloc в основном процессе (замедляет весь бот на время запроса).
+"""
+import os
+import json
+import time
+import types
+import random
+import pstats
+import cProfile
+import logging
+import tracemalloc
+import contextvars
+from contextlib import contextmanager
+from functools import wraps
+from telegram import Update
+from telegram.ext import ContextTypes
+
+logger = logging.getLogger(__name__)
+
+PROFILE_DIR = os.getenv("PROFILE_DIR", "profiles")
+ADMIN_IDS = {int(x) for x in os.getenv("ADMIN_IDS", "").replace(" ", "").split(",") if x.lstrip("-").isdigit()}
+ADMIN_CHAT_ID = int(os.getenv("ADMIN_CHAT_ID")) if os.getenv("ADMIN_CHAT_ID", "").lstrip("-").isdigit() else None
+PROFILE_MAIN = os.getenv("PROFILE_MAIN", "0") == "1"
+TOP_FUNCTIONS = 12
+# ожидание event loop — не горячая точка
+IDLE_FUNCTIONS = ("<method 'poll' of 'select.epoll' objects>", "<method 'select' of 'select.select' objects>",
+                  "<method 'control' of 'select.kqueue' objects>")
+
+settings = {"percent": float(os.getenv("PROFILE_SAMPLE_PERCENT", "0"))}
+
+_session = contextvars.ContextVar("profile_session", default=None)
+_main_profiler_busy = False
+
+
+class ProfileSession:
+    """замеры одного запроса: этапы, статистика cProfile основного процесса и воркеров"""
+
+    def __init__(self, kind: str, chat_id):
+        self.kind = kind
+        self.chat_id = chat_id
+        self.started = time.perf_counter()
+        self.stages = {}
+        self.worker_stats = []
+        self.worker_peak = 0
+        self.main_peak = 0
+        self.profiler = None
+
+    def add_stage(self, name: str, seconds: float) -> None:
+        self.stages[name] = self.stages.get(name, 0.0) + seconds
+
+    def stats(self):
+        stats = pstats.Stats()
+        if self.profiler is not None:
+            stats.add(self.profiler)
+        for raw in self.worker_stats:
+            stats.add(types.SimpleNamespace(stats=raw, create_stats=lambda: None))
+        return stats
+
+
+def current_session():
+    return _session.get()
+
+
+@contextmanager
+def stage(name: str):
+    """замер этапа запроса; вне выборки ничего не делает"""
+    session = _session.get()
+    if session is None:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        session.add_stage(name, time.perf_counter() - started)
+
+
+def profiled_call(func, *args):
+    """выполняется в процессе пула: результат, статистика cProfile и пик памяти вызова"""
+    profiler = cProfile.Profile()
+    tracemalloc.start()
+    try:
+        result = profiler.runcall(func, *args)
+    finally:
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+    profiler.create_stats()
+    return result, profiler.stats, peak
+
+
+def record_worker(session: ProfileSession, stats: dict, peak: int) -> None:
+    session.worker_stats.append(stats)
+    session.worker_peak = max(session.worker_peak, peak)
+
+
+def _hot_spots(stats: pstats.Stats, limit: int = TOP_FUNCTIONS) -> list:
+    rows = []
+    for (filename, line, func), (_, calls, tottime, cumtime, _) in stats.stats.items():
+        if func in IDLE_FUNCTIONS:
+            continue
+        rows.append((tottime, cumtime, calls, f"{os.path.basename(filename)}:{line}({func})"))
+    rows.sort(reverse=True)
+    return rows[:limit]
+
+
+def _save(session: ProfileSession, wall: float) -> tuple:
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    base = os.path.join(PROFILE_DIR, f"{time.strftime('%Y%m%d-%H%M%S')}_{session.kind}_{session.chat_id}")
+    stats = session.stats()
+    if stats.stats:
+        stats.dump_stats(f"{base}.prof")
+    summary = {
+        "kind": session.kind,
+        "chat_id": session.chat_id,
+        "wall_seconds": round(wall, 4),
+        "stages": {k: round(v, 4) for k, v in session.stages.items()},
+        "main_peak_bytes": session.main_peak,
+        "worker_peak_bytes": session.worker_peak,
+        "hot_spots": [{"function": f, "tottime": round(t, 4), "cumtime": round(c, 4), "calls": n}
+                      for t, c, n, f in _hot_spots(stats)],
+    }
+    with open(f"{base}.json", "w", encoding="utf-8") as f:
+        json.dump(summary, f, ensure_ascii=False, indent=2)
+    return base, summary
+
+
+def _summary_text(base: str, summary: dict) -> str:
+    mb = lambda b: b / 1024 / 1024
+    lines = [f"🔬 профиль {summary['kind']} (чат {summary['chat_id']}): {summary['wall_seconds']:.2f} с"]
+    if summary["stages"]:
+        lines.append("этапы: " + ", ".join(f"{k} {v:.2f} с" for k, v in summary["stages"].items()))
+    memory = f"пик памяти: пул {mb(summary['worker_peak_bytes']):.1f} МБ"
+    if summary["main_peak_bytes"]:
+        memory += f", бот {mb(summary['main_peak_bytes']):.1f} МБ"
+    lines.append(memory)
+    lines.append("горячие функции (собственное время):")
+    lines.extend(f"• {h['function']}: {h['tottime']:.3f} с, всего {h['cumtime']:.3f} с, вызовов {h['calls']}"
+                 for h in summary["hot_spots"])
+    lines.append(f"файл: {base}.prof")
+    return "\n".join(lines)
+
+
+def profiled(kind: str):
+    """декоратор обработчика: выбранный процент запросов выполняется под профилировщиком"""
+
+    def decorator(handler):
+        @wraps(handler)
+        async def wrapper(update: Update, context: ContextTypes.DEFAULT_TYPE, *args, **kwargs):
+            global _main_profiler_busy
+            if settings["percent"] <= 0 or random.uniform(0, 100) >= settings["percent"] or _session.get() is not None:
+                return await handler(update, context, *args, **kwargs)
+
+            chat_id = update.effective_chat.id if update.effective_chat else None
+            session = ProfileSession(kind, chat_id)
+            token = _session.set(session)
+            # cProfile и tracemalloc в основном процессе — по одному запросу за раз;
+            # чужие корутины всё равно попадут в профиль, поэтому только по PROFILE_MAIN
+            own_main = PROFILE_MAIN and not _main_profiler_busy
+            if own_main:
+                _main_profiler_busy = True
+                session.profiler = cProfile.Profile()
+                tracemalloc.start()
+                session.profiler.enable()
+            try:
+                return await handler(update, context, *args, **kwargs)
+            finally:
+                if own_main:
+                    session.profiler.disable()
+                    _, session.main_peak = tracemalloc.get_traced_memory()
+                    tracemalloc.stop()
+                    _main_profiler_busy = False
+                _session.reset(token)
+                wall = time.perf_counter() - session.started
+                try:
+                    base, summary = _save(session, wall)
+                    admin_chat = ADMIN_CHAT_ID or next(iter(ADMIN_IDS), None)
+                    if admin_chat is not None:
+                        await context.bot.send_message(admin_chat, _summary_text(base, summary)[:4000])
+                except Exception:
+                    logger.exception("не удалось сохранить профиль запроса")
+
+        return wrapper
+
+    return decorator
+
+
+async def profile_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """/profile [процент|off] — включение выборочного профилирования (только администраторы)"""
+    user = update.effective_user
+    if user is None or user.id not in ADMIN_IDS:
+        await update.message.reply_text("⛔ Команда доступна только администраторам.")
+        return
+
+    args = context.args or []
+    if args:
+        value = args[0].lower().rstrip("%")
+        if value in ("off", "0"):
+            settings["percent"] = 0.0
+        else:
+            try:
+                settings["percent"] = min(100.0, max(0.0, float(value.replace(",", "."))))
+            except ValueError:
+                await update.message.reply_text("❗ Использование: /profile 10 — профилировать 10% запросов, /profile off")
+                return
+
+    state = f"{settings['percent']:g}% запросов" if settings["percent"] > 0 else "выключено"
+    await update.message.reply_text(f"🔬 Профилирование: {state}. Профили сохраняются в {PROFILE_DIR}.")
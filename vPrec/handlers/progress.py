@@ -0,0 +1,237 @@
+"""Прогресс длинных задач и отмена по /cancel.
+
+Задача обработки файла (Job) проходит этапы; воркеры пула на контрольных точках
+в циклах по чанкам сообщают число строк и проверяют флаг отмены — через очередь
+и Event менеджера multiprocessing. Состояние показывается в одном сообщении,
+которое редактируется не чаще раза в PROGRESS_INTERVAL секунд.
+"""
+import os
+import time
+import queue
+import asyncio
+import logging
+import itertools
+import contextvars
+import multiprocessing
+from telegram import Message
+
+logger = logging.getLogger(__name__)
+
+PROGRESS_INTERVAL = float(os.getenv("PROGRESS_INTERVAL", "2"))
+# короткие задачи заканчиваются раньше — их статус не редактируем
+PROGRESS_DELAY = float(os.getenv("PROGRESS_DELAY", "2"))
+# как часто воркер отчитывается и проверяет отмену
+CHECKPOINT_INTERVAL = 0.5
+
+STAGE_TITLES = {
+    "download": "Скачиваю файл",
+    "check": "Проверяю размер",
+    "parse": "Разбираю Excel",
+    "analyze": "Анализирую",
+    "send": "Отправляю отчёт",
+}
+
+
+class JobCancelled(BaseException):
+    """отмена задачи; BaseException — чтобы пройти сквозь except Exception в обработчиках отчётов"""
+
+
+_manager = None
+_current = contextvars.ContextVar("progress_job", default=None)
+_jobs = {}  # (чат, пользователь) -> Job
+
+
+def get_manager():
+    global _manager
+    if _manager is None:
+        _manager = multiprocessing.get_context("spawn").Manager()
+    return _manager
+
+
+def shutdown_manager() -> None:
+    global _manager
+    if _manager is not None:
+        _manager.shutdown()
+        _manager = None
+
+
+def _fmt_rows(n: int) -> str:
+    return f"{n:,}".replace(",", " ")
+
+
+class Job:
+    """одна обработка файла: этап, строки по вызовам пула, флаг отмены"""
+
+    def __init__(self, key, status: Message = None, total_rows: int = 0):
+        self.key = key
+        self.status = status
+        self.total_rows = total_rows
+        self.stage_name = None
+        self.stage_started = self.started = time.monotonic()
+        self.rows = {}  # номер вызова пула -> строк обработано
+        self.stage_calls = set()  # вызовы пула текущего этапа; поздние отчёты прошлых этапов не считаются
+        self.cancelled = False
+        self.events = None
+        self.cancel_event = None
+        self._calls = itertools.count(1)
+        self._shown = None
+        self._pump = None
+
+    # --- основной процесс ---
+
+    def stage(self, name: str) -> None:
+        self.check()
+        self.stage_name = name
+        self.stage_started = time.monotonic()
+        self.rows.clear()
+        self.stage_calls.clear()
+
+    def check(self) -> None:
+        if self.cancelled:
+            raise JobCancelled()
+
+    def cancel(self) -> None:
+        self.cancelled = True
+        if self.cancel_event is not None:
+            try:
+                self.cancel_event.set()
+            except (OSError, EOFError):
+                pass
+
+    def token(self) -> tuple:
+        """что нужно воркеру: куда писать строки и где смотреть отмену"""
+        call_id = next(self._calls)
+        self.stage_calls.add(call_id)
+        return call_id, self.events, self.cancel_event
+
+    def _drain(self) -> None:
+        while True:
+            try:
+                call_id, rows = self.events.get_nowait()
+            except queue.Empty:
+                return
+            if call_id in self.stage_calls:
+                self.rows[call_id] = rows
+
+    def text(self) -> str:
+        title = STAGE_TITLES.get(self.stage_name, self.stage_name or "Обрабатываю")
+        done = sum(self.rows.values())
+        line = f"⏳ {title}"
+        if done:
+            line += f": {_fmt_rows(done)}"
+            if self.total_rows:
+                line += f" из ~{_fmt_rows(self.total_rows)} строк ({min(99, done * 100 // self.total_rows)}%)"
+                elapsed = time.monotonic() - self.stage_started
+                if done < self.total_rows and elapsed > 1:
+                    line += f", осталось ~{(self.total_rows - done) * elapsed / done:.0f} с"
+            else:
+                line += " строк"
+        line += f"\n⏱ {time.monotonic() - self.started:.0f} с • /cancel — отменить"
+        return line
+
+    async def _refresh(self) -> None:
+        if self.events is not None:
+            await asyncio.to_thread(self._drain)
+        text = self.text()
+        if self.status is not None and text != self._shown:
+            self._shown = text
+            try:
+                await self.status.edit_text(text)
+            except Exception:
+                logger.debug("не удалось обновить статус задачи", exc_info=True)
+
+    async def _run_pump(self) -> None:
+        await asyncio.sleep(PROGRESS_DELAY)
+        while True:
+            await self._refresh()
+            await asyncio.sleep(PROGRESS_INTERVAL)
+
+    async def finish(self, text: str = None) -> None:
+        if self._pump is not None:
+            self._pump.cancel()
+            await asyncio.gather(self._pump, return_exceptions=True)
+        if text and self.status is not None and self._shown is not None:
+            # статус уже показывался — заменяем его итогом, иначе оставляем как есть
+            try:
+                await self.status.edit_text(text)
+            except Exception:
+                logger.debug("не удалось обновить статус задачи", exc_info=True)
+
+
+async def start_job(key, status: Message = None, total_rows: int = 0) -> Job:
+    job = Job(key, status, total_rows)
+    manager = await asyncio.to_thread(get_manager)
+    job.events, job.cancel_event = await asyncio.to_thread(lambda: (manager.Queue(), manager.Event()))
+    previous = _jobs.get(key)
+    if previous is not None:
+        previous.cancel()
+    _jobs[key] = job
+    _current.set(job)
+    job._pump = asyncio.create_task(job._run_pump())
+    return job
+
+
+async def end_job(job: Job, text: str = None) -> None:
+    # снимаем с учёта до правки статуса: /cancel после итога уже не должен находить задачу
+    if _jobs.get(job.key) is job:
+        del _jobs[job.key]
+    _current.set(None)
+    await job.finish(text)
+
+
+def cancel_job(key) -> bool:
+    """отмена по /cancel; False — у пользователя нет активной задачи"""
+    job = _jobs.get(key)
+    if job is None:
+        return False
+    job.cancel()
+    return True
+
+
+def current_job():
+    return _current.get()
+
+
+def stage(name: str) -> None:
+    job = _current.get()
+    if job is not None:
+        job.stage(name)
+
+
+# --- воркер пула ---
+
+_bound = None  # (номер вызова, очередь, Event) задачи, для которой работает воркер
+_last_report = 0.0
+
+
+def run_bound(token: tuple, func, *args):
+    """выполняется в процессе пула: func с контрольными точками задачи token"""
+    global _bound, _last_report
+    _bound, _last_report = token, 0.0
+    try:
+        return func(*args)
+    finally:
+        _bound = None
+
+
+def checkpoint(rows: int) -> None:
+    """контрольная точка цикла по чанкам: rows — строк обработано в этом вызове.
+    бросает JobCancelled, если задачу отменили"""
+    global _last_report
+    if _bound is None:
+        job = _current.get()
+        if job is not None:
+            job.check()
+        return
+    now = time.monotonic()
+    if now - _last_report < CHECKPOINT_INTERVAL:
+        return
+    _last_report = now
+    call_id, events, cancel_event = _bound
+    try:
+        if cancel_event.is_set():
+            raise JobCancelled()
+        events.put_nowait((call_id, rows))
+    except (OSError, EOFError, queue.Full):
+        # менеджер недоступен (остановка бота) — продолжаем без прогресса
+        pass
@@ -0,0 +1,92 @@
+"""Реестр типов отчётов: одна таблица для меню, справки и диспетчеризации.
+
+Всё, что зависит от списка отчётов (клавиатура, текст справки, словари обработчиков),
+собирается один раз при импорте; новый отчёт — одна запись в REPORT_TYPES.
+"""
+from dataclasses import dataclass, field
+from telegram import InlineKeyboardButton, InlineKeyboardMarkup
+from . import (
+    schedule_handler,
+    lessons_handler,
+    students_handler,
+    attendance_handler,
+    homework_check_handler,
+    homework_submit_handler,
+    ai_handler,
+)
+
+HELP = "help"
+RESTART = "restart"
+AI = "ai"
+
+
+@dataclass(frozen=True)
+class ReportType:
+    """key — callback_data кнопки и состояние разговора; processor(update, context, path) —
+    разбор загруженной книги (None — у состояния свои обработчики, как у ai);
+    help — строка о файле в справке; callbacks — дополнительные кнопки внутри сценария"""
+    key: str
+    icon: str
+    title: str
+    start: object
+    processor: object = None
+    help: str = None
+    callbacks: dict = field(default_factory=dict)
+
+    @property
+    def button(self) -> str:
+        return f"{self.icon} {self.title}"
+
+
+REPORT_TYPES = (
+    ReportType("schedule", "📅", "Отчет по расписанию", schedule_handler.start_schedule_report,
+               schedule_handler.process_schedule_file, "файл Расписание групп.xlsx"),
+    ReportType("lessons", "📚", "Отчет по темам занятий", lessons_handler.start_lessons_report,
+               lessons_handler.process_lessons_file, "файл Темы уроков.xls"),
+    ReportType("students", "👥", "Отчет по студентам", students_handler.start_students_report,
+               students_handler.process_students_file, "файл Отчет по студентам.xls"),
+    ReportType("attendance", "📊", "Отчет по посещаемости", attendance_handler.start_attendance_report,
+               attendance_handler.process_attendance_file, "файл Посещаемость по преподавателям.xlsx"),
+    ReportType("homework_check", "✅", "Отчет по проверке ДЗ", homework_check_handler.start_homework_check_report,
+               homework_check_handler.process_homework_check_file, "файл Отчет по домашним заданиям.xlsx",
+               callbacks={"hw_check_month": homework_check_handler.handle_hw_check_period,
+                          "hw_check_week": homework_check_handler.handle_hw_check_period}),
+    ReportType("homework_submit", "📝", "Отчет по сдаче ДЗ", homework_submit_handler.start_homework_submit_report,
+               homework_submit_handler.process_homework_submit_file, "файл Отчет по студентам.xls"),
+    ReportType(AI, "🤖", "AI-помощник", ai_handler.start_ai_report),
+)
+
+BY_KEY = {t.key: t for t in REPORT_TYPES}
+PROCESSORS = {t.key: t.processor for t in REPORT_TYPES if t.processor is not None}
+# callback_data -> (тип отчёта, обработчик) для кнопок внутри сценариев
+CALLBACKS = {data: (t.key, handler) for t in REPORT_TYPES for data, handler in t.callbacks.items()}
+
+MAIN_KEYBOARD = InlineKeyboardMarkup(
+    [[InlineKeyboardButton(t.button, callback_data=t.key)] for t in REPORT_TYPES]
+    + [
+        [InlineKeyboardButton("❓ Справка", callback_data=HELP)],
+        [InlineKeyboardButton("🔄 Начать заново", callback_data=RESTART)],
+    ]
+)
+
+HELP_TEXT = """
+*справка по боту*
+
+*Доступные отчёты:*
+
+{reports}
+
+*Как пользоваться:*
+1. Нажмите на нужный отчёт
+2. Загрузите соответствующий Excel-файл
+3. Получите результат
+
+Команды:
+/start — главное меню
+/help — эта справка
+/rules — пороги отчётов для этого чата
+/teacher <фамилия> — преподаватель в последних отчётах
+/student <фамилия> — студент в последних отчётах
+@бот фамилия — быстрый поиск из любого чата
+/cancel — отменить текущую операцию
+""".format(reports="\n".join(f"{t.icon} *{t.title}* — {t.help}" for t in REPORT_TYPES if t.help))
@@ -0,0 +1,173 @@
+"""Локальные ответы на вопросы по сохранённым результатам отчётов (без обращения к ai)"""
+import re
+import pandas as pd
+from .report_store import StoredReport
+
+# подписи колонок результатов для ответов
+COLUMN_TITLES = {
+    'attendance': "посещаемость",
+    'percentage': "процент",
+    'issued': "получено",
+    'checked': "проверено",
+    'homework': "ДЗ",
+    'classroom': "классная",
+    'count': "кол-во",
+}
+
+# ключевые слова, по которым вопрос переключается на другую числовую колонку
+COLUMN_KEYWORDS = (
+    ('issued', re.compile(r'получ|выдан')),
+    ('checked', re.compile(r'проверено|проверенн')),
+    ('homework', re.compile(r'\bдз\b|домашн')),
+    ('classroom', re.compile(r'классн')),
+)
+
+_NUM = r'(\d+(?:[.,]\d+)?)'
+_FILTERS = (
+    (re.compile(r'(?:<=|≤|не больше|не более)\s*' + _NUM), 'le'),
+    (re.compile(r'(?:>=|≥|не меньше|не менее)\s*' + _NUM), 'ge'),
+    (re.compile(r'(?:<|меньше|ниже|менее|below|under)\s*' + _NUM), 'lt'),
+    (re.compile(r'(?:>|больше|выше|более|above|over)\s*' + _NUM), 'gt'),
+    (re.compile(r'(?:=|равн\w*)\s*' + _NUM), 'eq'),
+)
+_GROUP_RE = re.compile(r'групп\w*\s+([^\s,?!]+)')
+_TOP_RE = re.compile(r'(?:топ|top|первые|первых)\s*-?\s*(\d+)?')
+_BOTTOM_RE = re.compile(r'(?:худш\w*|последни\w*|bottom|анти-?топ)\s*(\d+)?')
+_MIN_RE = re.compile(r'меньше всех|наимен|минимал|\bmin\b|least|хуже всех|самы[йм] низк')
+_MAX_RE = re.compile(r'больше всех|наиболь|максимал|\bmax\b|most|лучше всех|самы[йм] высок')
+_AVG_RE = re.compile(r'средн|average|\bavg\b|\bmean\b')
+_COUNT_RE = re.compile(r'сколько|количеств|count|how many')
+_LIST_RE = re.compile(r'\bкто\b|список|покажи|перечисли|\bwho\b|\blist\b')
+# вопросы именно о попавших под правила — отвечаем по строкам отчёта, остальные — по всем именам
+_FLAGGED_RE = re.compile(r'проблем|под правил|отмечен|критич|нарушен|отста|flagged')
+_FLAGGED_NOTE = " (только попавшие под правила)"
+
+
+def _fmt(value) -> str:
+    if pd.isna(value):
+        return "-"
+    value = float(value)
+    return f"{value:.0f}" if value.is_integer() else f"{value:.1f}"
+
+
+def _describe(row: pd.Series, columns: list) -> str:
+    extra = " | ".join(f"{COLUMN_TITLES.get(c, c)} {_fmt(row[c])}" for c in columns)
+    group = row.get('group')
+    group_text = f" ({group})" if isinstance(group, str) and group else ""
+    return f"• {row['name']}{group_text}: {extra}"
+
+
+def _numeric_columns(df: pd.DataFrame) -> list:
+    # rows — служебный счётчик строк файла в сводке по именам, не метрика
+    return [c for c in df.columns if c != 'rows' and pd.api.types.is_numeric_dtype(df[c])]
+
+
+def _frame_for(report: StoredReport, question: str) -> tuple:
+    """(таблица, пометка об охвате): сводка по всем разобранным именам, а строки отчёта
+    (только попавшие под правила) — для вопросов о проблемных"""
+    if report.people is None:
+        return report.results, ""
+    if _FLAGGED_RE.search(question):
+        return report.results, _FLAGGED_NOTE
+    return report.people, ""
+
+
+def answer_locally(report: StoredReport, question: str, limit: int = 30):
+    """отвечает на типовые вопросы (мин, макс, топ-N, количество, среднее, фильтры).
+
+    возвращает текст ответа или None, если вопрос не распознан и нужен ai.
+    """
+    q = question.lower()
+    df, scope = _frame_for(report, q)
+    numeric = _numeric_columns(df)
+    if df.empty or not numeric:
+        return None
+
+    value = report.value if report.value in numeric else numeric[0]
+    for col, pattern in COLUMN_KEYWORDS:
+        if col in numeric and col != value and pattern.search(q):
+            value = col
+            break
+
+    # фильтры применяются маской над всей таблицей сразу
+    mask = pd.Series(True, index=df.index)
+    filtered = False
+    for pattern, op in _FILTERS:
+        m = pattern.search(q)
+        if m:
+            threshold = float(m.group(1).replace(',', '.'))
+            col = df[value]
+            mask &= {'lt': col < threshold, 'le': col <= threshold, 'gt': col > threshold,
+                     'ge': col >= threshold, 'eq': col == threshold}[op]
+            filtered = True
+            break
+    m = _GROUP_RE.search(q)
+    if m and 'group' in df.columns:
+        mask &= df['group'].astype(str).str.lower() == m.group(1).lower()
+        filtered = True
+    view = df[mask]
+    # у метрики может не быть значений (студент без оценок за ДЗ) — такие строки не сравниваются
+    valid = view.dropna(subset=[value])
+
+    shown = [value] + [c for c in numeric if c != value]
+    title = COLUMN_TITLES.get(value, value)
+
+    if _AVG_RE.search(q):
+        if valid.empty:
+            return "ℹ️ нет строк, подходящих под условие."
+        return f"📊 среднее ({title}): {_fmt(valid[value].mean())} по {len(valid)} строкам{scope}"
+
+    if _COUNT_RE.search(q):
+        if report.type in ('schedule', 'schedule_load', 'lessons') and not filtered:
+            return f"🔢 всего ({title}): {_fmt(view[value].sum())}, строк в отчёте: {len(view)}"
+        return f"🔢 подходящих строк: {len(view)}{scope}"
+
+    m_bottom = _BOTTOM_RE.search(q)
+    m_top = _TOP_RE.search(q)
+    if m_bottom or m_top:
+        m = m_bottom or m_top
+        n = min(int(m.group(1)) if m.group(1) else 5, limit)
+        rows = valid.nsmallest(n, value) if m_bottom else valid.nlargest(n, value)
+        if rows.empty:
+            return "ℹ️ нет строк, подходящих под условие."
+        header = f"{'худшие' if m_bottom else 'топ'} {len(rows)} ({title}){scope}:"
+        return "\n".join([header] + [_describe(r, shown) for _, r in rows.iterrows()])
+
+    if _MIN_RE.search(q) or _MAX_RE.search(q):
+        if valid.empty:
+            return "ℹ️ нет строк, подходящих под условие."
+        is_min = bool(_MIN_RE.search(q))
+        idx = valid[value].idxmin() if is_min else valid[value].idxmax()
+        label = "👎 минимум" if is_min else "👍 максимум"
+        return f"{label} ({title}){scope}:\n{_describe(valid.loc[idx], shown)}"
+
+    if filtered or _LIST_RE.search(q):
+        rows = view.sort_values(value).head(limit)
+        if rows.empty:
+            return "ℹ️ нет строк, подходящих под условие."
+        lines = [f"найдено строк: {len(view)}{scope}"] + [_describe(r, shown) for _, r in rows.iterrows()]
+        if len(view) > limit:
+            lines.append(f"... и ещё {len(view) - limit}")
+        return "\n".join(lines)
+
+    return None
+
+
+def report_context(report: StoredReport, max_rows: int = 50) -> str:
+    """компактное табличное представление результатов для промпта ai"""
+    df = report.results
+    rows = df.sort_values(report.value).head(max_rows) if report.value in df.columns else df.head(max_rows)
+    text = rows.to_csv(index=False)
+    if len(df) > max_rows:
+        text += f"... (ещё {len(df) - max_rows} строк; всего {len(df)})\n"
+    people = report.people
+    if people is None:
+        return f"тип отчёта: {report.type}\n{text}"
+    # в csv — только попавшие под правила; сводка по всем именам отдельной строкой
+    summary = [f"всего имён в отчёте: {len(people)}, под правилами строк: {len(df)}"]
+    for col in _numeric_columns(people):
+        values = people[col].dropna()
+        if not values.empty:
+            summary.append(f"{COLUMN_TITLES.get(col, col)} по всем: среднее {_fmt(values.mean())}, "
+                           f"мин {_fmt(values.min())}, макс {_fmt(values.max())}")
+    return f"тип отчёта: {report.type}\n" + "\n".join(summary) + f"\nпопавшие под правила:\n{text}"
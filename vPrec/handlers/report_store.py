@@ -1,17 +1,106 @@
+import os
+import time
+import asyncio
 import logging
+from collections import OrderedDict
+from dataclasses import dataclass, field
+import pandas as pd
 from telegram import Update, Message
+from .entity_index import index_for, remember_user
+from .profiling import stage
+from . import progress
 
 logger = logging.getLogger(__name__)
 
-async def send_and_store(update: Update, context, text: str, parse_mode: str = None, metadata: dict = None) -> Message:
+REPORT_TTL_SECONDS = int(os.getenv("REPORT_TTL_SECONDS", str(24 * 3600)))
+REPORT_STORE_MAX = int(os.getenv("REPORT_STORE_MAX", "500"))
+
+
+@dataclass
+class StoredReport:
+    """структурированные результаты, стоящие за отправленным отчётом"""
+    type: str
+    results: pd.DataFrame
+    value: str
+    created: float = field(default_factory=time.monotonic)
+    people: pd.DataFrame = None  # все разобранные имена со сводкой — для /teacher, /student и inline
+
+    @classmethod
+    def from_results(cls, report_type: str, results: pd.DataFrame, value: str, people: pd.DataFrame = None) -> "StoredReport":
+        """value — основная числовая колонка (по ней считаются мин/макс/топ)"""
+        return cls(report_type, compact_frame(results), value,
+                   people=compact_frame(people) if people is not None else None)
+
+
+def compact_frame(df: pd.DataFrame) -> pd.DataFrame:
+    """строки -> category, числа -> float32/наименьший целый тип"""
+    out = df.copy()
+    for col in out.columns:
+        s = out[col]
+        if s.dtype == object:
+            out[col] = s.astype('category')
+        elif pd.api.types.is_float_dtype(s):
+            out[col] = s.astype('float32')
+        elif pd.api.types.is_integer_dtype(s):
+            out[col] = pd.to_numeric(s, downcast='integer')
+    return out.reset_index(drop=True)
+
+
+class ReportStore:
+    """LRU-хранилище результатов с TTL, ключ — (chat_id, message_id)"""
+
+    def __init__(self, ttl: float = REPORT_TTL_SECONDS, max_items: int = REPORT_STORE_MAX):
+        self.ttl = ttl
+        self.max_items = max_items
+        self._items = OrderedDict()
+
+    def put(self, chat_id: int, message_id: int, report: StoredReport) -> None:
+        key = (chat_id, message_id)
+        self._items[key] = report
+        self._items.move_to_end(key)
+        while len(self._items) > self.max_items:
+            self._items.popitem(last=False)
+
+    def get(self, chat_id: int, message_id: int):
+        key = (chat_id, message_id)
+        report = self._items.get(key)
+        if report is None:
+            return None
+        if time.monotonic() - report.created > self.ttl:
+            del self._items[key]
+            return None
+        self._items.move_to_end(key)
+        return report
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+
+store = ReportStore()
+
+
+async def send_and_store(update: Update, context, text: str, parse_mode: str = None, metadata: dict = None, report: StoredReport = None) -> Message:
+    """отправляет отчёт; если передан report — запоминает его под id отправленного сообщения
+    и обновляет индекс преподавателей/студентов чата"""
+    progress.stage("send")
+    message = None
     try:
-        if update.callback_query:
-            try:
-                return await update.callback_query.edit_message_text(text, parse_mode=parse_mode)
-            except Exception:
-                if update.callback_query.message:
-                    return await update.callback_query.message.reply_text(text, parse_mode=parse_mode)
-        elif update.message:
-            return await update.message.reply_text(text, parse_mode=parse_mode)
+        with stage("send"):
+            if update.callback_query:
+                try:
+                    message = await update.callback_query.edit_message_text(text, parse_mode=parse_mode)
+                except Exception:
+                    if update.callback_query.message:
+                        message = await update.callback_query.message.reply_text(text, parse_mode=parse_mode)
+            elif update.message:
+                message = await update.message.reply_text(text, parse_mode=parse_mode)
     except Exception:
         logger.exception('ошибка при отправке сообщения')
+
+    if report is not None and getattr(message, 'message_id', None) is not None:
+        store.put(message.chat_id, message.message_id, report)
+        # на 100k строк индекс строится секунды — не держим цикл событий, другие чаты ждать не должны
+        await asyncio.to_thread(index_for(message.chat_id).add_report, report)
+        if update.effective_user:
+            remember_user(update.effective_user.id, message.chat_id)
+    return message
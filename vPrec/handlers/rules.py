@@ -0,0 +1,294 @@
+"""Настраиваемые пороги отчётов: правила по чатам, компилируемые в векторные маски"""
+import os
+import re
+import json
+import logging
+import threading
+from functools import lru_cache
+import numpy as np
+from telegram import Update
+from telegram.ext import ContextTypes
+
+logger = logging.getLogger(__name__)
+
+RULES_PATH = os.getenv("RULES_PATH", "rules.json")
+
+# уровни в порядке приоритета: строка попадает в первый сработавший
+TIERS = {
+    'critical': ("🔴", "критично"),
+    'warning': ("🟡", "внимание"),
+}
+
+# метрики каждого отчёта: имя колонки -> русские синонимы для записи правил
+METRICS = {
+    'attendance': {'attendance': ("посещаемость", "посещ")},
+    'homework_check': {'percentage': ("процент", "%"), 'issued': ("получено",), 'checked': ("проверено",)},
+    'homework_submit': {'percentage': ("процент", "%")},
+    'students': {'homework': ("дз", "homework"), 'classroom': ("классная", "classroom")},
+}
+
+DEFAULT_RULES = {
+    'attendance': {'critical': "посещаемость < 40"},
+    'homework_check': {'critical': "процент < 70"},
+    'homework_submit': {'critical': "процент < 70"},
+    'students': {'critical': "дз = 1 или классная < 3"},
+}
+
+REPORT_TITLES = {
+    'attendance': "посещаемость",
+    'homework_check': "проверка ДЗ",
+    'homework_submit': "сдача ДЗ",
+    'students': "студенты",
+}
+
+
+class RuleError(ValueError):
+    pass
+
+
+_TOKEN_RE = re.compile(r"\s*(<=|>=|==|!=|<|>|=|\(|\)|\||&|\d+(?:[.,]\d+)?|[\w%]+)", re.UNICODE)
+_OPS = {
+    '<': np.less, '<=': np.less_equal, '>': np.greater, '>=': np.greater_equal,
+    '=': np.equal, '==': np.equal, '!=': np.not_equal,
+}
+
+
+def _tokenize(text: str) -> list:
+    tokens = []
+    pos = 0
+    text = text.strip().lower()
+    while pos < len(text):
+        m = _TOKEN_RE.match(text, pos)
+        if not m or m.end() == pos:
+            raise RuleError(f"не понимаю правило возле «{text[pos:pos + 10]}»")
+        tokens.append(m.group(1))
+        pos = m.end()
+    return [{'или': '|', 'or': '|', 'и': '&', 'and': '&'}.get(t, t) for t in tokens]
+
+
+def _metric_for(report_type: str, word: str):
+    for col, aliases in METRICS[report_type].items():
+        if word == col or word in aliases:
+            return col
+    return None
+
+
+def _parse(report_type: str, tokens: list):
+    """рекурсивный спуск: expr := term ('|' term)*; term := factor ('&' factor)*"""
+    pos = 0
+    default_metric = next(iter(METRICS[report_type]))
+
+    def peek():
+        return tokens[pos] if pos < len(tokens) else None
+
+    def take():
+        nonlocal pos
+        if pos >= len(tokens):
+            raise RuleError("неожиданный конец правила")
+        pos += 1
+        return tokens[pos - 1]
+
+    def factor():
+        if peek() == '(':
+            take()
+            node = expr()
+            if take() != ')':
+                raise RuleError("не закрыта скобка")
+            return node
+        metric = default_metric
+        if peek() not in _OPS:
+            word = take()
+            metric = _metric_for(report_type, word)
+            if metric is None:
+                known = ", ".join(a[0] for a in METRICS[report_type].values())
+                raise RuleError(f"неизвестная метрика «{word}»; доступны: {known}")
+        op = take() if peek() in _OPS else None
+        if op is None:
+            raise RuleError("ожидается сравнение: <, <=, >, >=, =, !=")
+        word = take()
+        try:
+            value = float(word.replace(',', '.'))
+        except ValueError:
+            raise RuleError("после сравнения ожидается число")
+        return ('cmp', metric, op, value)
+
+    def term():
+        node = factor()
+        while peek() == '&':
+            take()
+            node = ('and', node, factor())
+        return node
+
+    def expr():
+        node = term()
+        while peek() == '|':
+            take()
+            node = ('or', node, term())
+        return node
+
+    if not tokens:
+        raise RuleError("пустое правило")
+    node = expr()
+    if pos != len(tokens):
+        raise RuleError(f"лишнее в правиле: «{' '.join(tokens[pos:])}»")
+    return node
+
+
+def _build(node):
+    """дерево правила -> функция columns(dict of ndarray) -> bool ndarray"""
+    kind = node[0]
+    if kind == 'cmp':
+        _, metric, op, value = node
+        fn = _OPS[op]
+        # NaN не проходит ни одно сравнение, кроме «!=» — явно отсекаем пропуски
+        return lambda cols: fn(cols[metric], value) & ~np.isnan(cols[metric])
+    left, right = _build(node[1]), _build(node[2])
+    if kind == 'and':
+        return lambda cols: left(cols) & right(cols)
+    return lambda cols: left(cols) | right(cols)
+
+
+class CompiledRules:
+    """набор правил отчёта; evaluate() за один проход даёт уровень каждой строки"""
+
+    def __init__(self, report_type: str, tiers: tuple):
+        self.report_type = report_type
+        self.tiers = [t for t, _ in tiers]
+        self.texts = dict(tiers)
+        self._masks = [_build(_parse(report_type, _tokenize(text))) for _, text in tiers]
+
+    def evaluate(self, columns: dict) -> np.ndarray:
+        """columns — метрика -> Series/ndarray; возвращает массив имён уровней ('' — норма)"""
+        cols = {k: np.asarray(v, dtype='float64') for k, v in columns.items()}
+        n = len(next(iter(cols.values()))) if cols else 0
+        if not self._masks:
+            return np.full(n, '', dtype=object)
+        conds = [m(cols) for m in self._masks]
+        return np.select(conds, self.tiers, default='').astype(object)
+
+    def describe(self, tier: str) -> str:
+        icon, title = TIERS[tier]
+        return f"{icon} {title} ({self.texts[tier]})"
+
+
+@lru_cache(maxsize=256)
+def compile_rules(report_type: str, tiers: tuple) -> CompiledRules:
+    """tiers — ((уровень, текст правила), ...); компиляция кешируется по тексту правил"""
+    return CompiledRules(report_type, tiers)
+
+
+def tier_lines(rules: CompiledRules, items: list, tier_of, format_item, subject: str) -> list:
+    """строки отчёта, сгруппированные по уровням в порядке приоритета"""
+    lines = []
+    for tier in rules.tiers:
+        group = [item for item in items if tier_of(item) == tier]
+        if group:
+            lines.append(f"{rules.describe(tier)} — {subject}: {len(group)}")
+            lines.extend(format_item(item) for item in group)
+    return lines
+
+
+class RulesStore:
+    """правила по чатам в локальном json-файле"""
+
+    def __init__(self, path: str = RULES_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        self._data = None
+
+    def _load(self) -> dict:
+        if self._data is None:
+            try:
+                with open(self.path, encoding="utf-8") as f:
+                    self._data = json.load(f)
+            except FileNotFoundError:
+                self._data = {}
+            except Exception:
+                logger.exception("не удалось прочитать файл правил %s", self.path)
+                self._data = {}
+        return self._data
+
+    def _save(self) -> None:
+        tmp = f"{self.path}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(self._data, f, ensure_ascii=False, indent=2)
+        os.replace(tmp, self.path)
+
+    def rules_for(self, chat_id, report_type: str) -> tuple:
+        """((уровень, текст), ...) в порядке приоритета уровней"""
+        with self._lock:
+            custom = self._load().get(str(chat_id), {}).get(report_type)
+        rules = custom if custom is not None else DEFAULT_RULES[report_type]
+        return tuple((t, rules[t]) for t in TIERS if rules.get(t))
+
+    def set_rule(self, chat_id, report_type: str, tier: str, text: str = None) -> None:
+        if text is not None:
+            compile_rules(report_type, ((tier, text),))  # проверка синтаксиса до сохранения
+        with self._lock:
+            data = self._load()
+            chat = data.setdefault(str(chat_id), {})
+            rules = chat.setdefault(report_type, dict(DEFAULT_RULES[report_type]))
+            if text is None:
+                rules.pop(tier, None)
+            else:
+                rules[tier] = text
+            self._save()
+
+    def reset(self, chat_id) -> None:
+        with self._lock:
+            self._load().pop(str(chat_id), None)
+            self._save()
+
+
+rules_store = RulesStore()
+
+
+def rules_for_update(update: Update, report_type: str) -> tuple:
+    chat_id = update.effective_chat.id if update.effective_chat else None
+    return rules_store.rules_for(chat_id, report_type)
+
+
+RULES_HELP = (
+    "⚙️ Правила порогов для отчётов этого чата.\n\n"
+    "Показать: /rules\n"
+    "Задать: /rules <отчёт> <уровень> <условие>\n"
+    "Убрать уровень: /rules <отчёт> <уровень> off\n"
+    "Сбросить всё: /rules reset\n\n"
+    "Отчёты: attendance, homework_check, homework_submit, students\n"
+    "Уровни: critical, warning\n"
+    "Пример: /rules attendance warning посещаемость < 60\n"
+    "Пример: /rules students critical дз = 1 или классная < 3"
+)
+
+
+async def rules_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """/rules — просмотр и настройка порогов"""
+    chat_id = update.effective_chat.id
+    args = context.args or []
+
+    if args and args[0].lower() == "reset":
+        rules_store.reset(chat_id)
+        await update.message.reply_text("♻️ Правила сброшены к значениям по умолчанию.")
+        return
+
+    if len(args) >= 3:
+        report_type, tier, text = args[0].lower(), args[1].lower(), " ".join(args[2:])
+        if report_type not in DEFAULT_RULES or tier not in TIERS:
+            await update.message.reply_text(RULES_HELP)
+            return
+        try:
+            rules_store.set_rule(chat_id, report_type, tier, None if text.lower() == "off" else text)
+        except RuleError as e:
+            await update.message.reply_text(f"❌ {e}")
+            return
+        await update.message.reply_text("✅ Правило сохранено.")
+
+    lines = ["⚙️ Текущие правила:"]
+    for report_type, title in REPORT_TITLES.items():
+        tiers = rules_store.rules_for(chat_id, report_type)
+        rules_text = "; ".join(f"{TIERS[t][0]} {t}: {text}" for t, text in tiers) or "нет"
+        lines.append(f"• {title} ({report_type}): {rules_text}")
+    if not args or len(args) < 3:
+        lines.append("")
+        lines.append(RULES_HELP)
+    await update.message.reply_text("\n".join(lines))
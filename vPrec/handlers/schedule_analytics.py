@@ -0,0 +1,193 @@
+"""Аналитика расписания: ячейки «Предмет:» разбираются один раз в колоночную таблицу,
+из которой кешированными groupby строятся все срезы (нагрузка, конфликты, план/факт)"""
+import os
+import re
+from functools import cached_property
+import pandas as pd
+from .excel_stream import iter_chunks
+from .column_schema import resolve_file
+
+PAIR_HOURS = float(os.getenv("SCHEDULE_PAIR_HOURS", "2"))
+
+TABLE_COLUMNS = ['sheet', 'group', 'day', 'slot', 'discipline', 'teacher', 'room']
+
+_SUBJECT = 'Предмет:'
+_TEACHER_RE = re.compile(r'Преподаватель:[ \t]*([^\n]*)')
+_ROOM_RE = re.compile(r'Ауд(?:итория)?\.?:?[ \t]*([^\n]*)')
+_DUP_SUFFIX_RE = re.compile(r'\.\d+$')
+
+
+def _blank_to_na(s: pd.Series) -> pd.Series:
+    s = s.str.strip()
+    return s.where(s != '')
+
+
+def parse_chunk(chunk: pd.DataFrame, group_col, slot_col, content_columns: list) -> pd.DataFrame:
+    """строки расписания -> длинная таблица: одна строка на каждый блок «Предмет:»"""
+    chunk = chunk[chunk[group_col].notna()]
+    if chunk.empty:
+        return pd.DataFrame(columns=TABLE_COLUMNS[1:])
+
+    groups = chunk[group_col].astype(str).str.strip()
+    if slot_col is not None:
+        slots = pd.to_numeric(chunk[slot_col], errors='coerce')
+    else:
+        # без колонки пары номер пары — порядок строки внутри группы
+        slots = groups.groupby(groups, sort=False).cumcount() + 1
+
+    frame = chunk[content_columns].copy()
+    frame['_group'] = groups
+    frame['_slot'] = slots
+    long = frame.melt(id_vars=['_group', '_slot'], var_name='day', value_name='cell').dropna(subset=['cell'])
+    cells = long['cell'].astype(str)
+    long = long[cells.str.contains(_SUBJECT, regex=False)]
+    if long.empty:
+        return pd.DataFrame(columns=TABLE_COLUMNS[1:])
+
+    # в одной ячейке может быть несколько блоков (подгруппы) — каждый становится строкой
+    long = long.assign(block=long['cell'].astype(str).str.split(_SUBJECT).str[1:]).explode('block')
+    block = long['block'].astype(str)
+    table = pd.DataFrame({
+        'group': long['_group'],
+        'day': long['day'].astype(str).str.replace(_DUP_SUFFIX_RE, '', regex=True).str.strip(),
+        'slot': long['_slot'],
+        'discipline': _blank_to_na(block.str.split('\n', n=1).str[0]),
+        'teacher': _blank_to_na(block.str.extract(_TEACHER_RE, expand=False)),
+        'room': _blank_to_na(block.str.extract(_ROOM_RE, expand=False)),
+    })
+    return table[table['discipline'].notna()]
+
+
+def finalize_table(parts: list, sheet, groups: list) -> pd.DataFrame:
+    """склейка чанков и приведение типов; категории групп хранят и группы без занятий"""
+    table = pd.concat(parts, ignore_index=True) if parts else pd.DataFrame(columns=TABLE_COLUMNS[1:])
+    table.insert(0, 'sheet', str(sheet) if sheet is not None else '')
+    table['group'] = pd.Categorical(table['group'], categories=list(dict.fromkeys(groups)))
+    table['day'] = pd.Categorical(table['day'], categories=list(dict.fromkeys(table['day'])), ordered=True)
+    table['slot'] = pd.to_numeric(table['slot'], errors='coerce').astype('Int16')
+    for col in ('sheet', 'discipline', 'teacher', 'room'):
+        table[col] = table[col].astype('category')
+    return table[TABLE_COLUMNS]
+
+
+def build_table(file_path: str, sheet, header, group_col, slot_col, content_columns: list):
+    """(таблица, число прочитанных строк) одного листа; файл читается чанками"""
+    parts = []
+    groups = []
+    rows = 0
+    for chunk in iter_chunks(file_path, header=header, sheet=sheet):
+        rows += len(chunk)
+        groups.extend(chunk[group_col].dropna().astype(str).str.strip())
+        part = parse_chunk(chunk, group_col, slot_col, content_columns)
+        if not part.empty:
+            parts.append(part)
+    return finalize_table(parts, sheet, groups), rows
+
+
+def read_plan(file_path: str, sheet=None):
+    """лист учебного плана (группа, дисциплина, часы) или None, если лист не похож на план"""
+    header, _, mapping = resolve_file('study_plan', file_path, sheet)
+    if not mapping.recognized:
+        return None
+    cols = [mapping.get('group'), mapping.get('discipline'), mapping.get('hours')]
+    parts = [chunk[cols].set_axis(['group', 'discipline', 'hours'], axis=1)
+             for chunk in iter_chunks(file_path, header=header, sheet=sheet)]
+    plan = pd.concat(parts, ignore_index=True) if parts else pd.DataFrame(columns=['group', 'discipline', 'hours'])
+    plan['hours'] = pd.to_numeric(plan['hours'], errors='coerce')
+    plan = plan.dropna()
+    plan['group'] = plan['group'].astype(str).str.strip()
+    plan['discipline'] = plan['discipline'].astype(str).str.strip()
+    return plan
+
+
+def concat_tables(tables: list) -> pd.DataFrame:
+    """объединение таблиц нескольких листов с объединением категорий"""
+    if len(tables) == 1:
+        return tables[0]
+    out = pd.concat([t.astype({c: object for c in TABLE_COLUMNS if c != 'slot'}) for t in tables], ignore_index=True)
+    groups = [g for t in tables for g in t['group'].cat.categories]
+    days = [d for t in tables for d in t['day'].cat.categories]
+    out['group'] = pd.Categorical(out['group'], categories=list(dict.fromkeys(groups)))
+    out['day'] = pd.Categorical(out['day'], categories=list(dict.fromkeys(days)), ordered=True)
+    for col in ('sheet', 'discipline', 'teacher', 'room'):
+        out[col] = out[col].astype('category')
+    return out
+
+
+class ScheduleAnalytics:
+    """срезы по таблице расписания; каждый считается один раз при первом обращении"""
+
+    def __init__(self, table: pd.DataFrame, plan: pd.DataFrame = None, pair_hours: float = PAIR_HOURS):
+        self.table = table
+        self.plan = plan
+        self.pair_hours = pair_hours
+
+    @cached_property
+    def pairs_by_group(self) -> pd.DataFrame:
+        """sheet, group, discipline, count — в порядке групп из файла, внутри по убыванию пар"""
+        counts = (self.table.groupby(['sheet', 'group', 'discipline'], observed=True, sort=False)
+                  .size().rename('count').reset_index())
+        order = counts['group'].cat.codes
+        return (counts.assign(_order=order)
+                .sort_values(['_order', 'count'], ascending=[True, False], kind='stable')
+                .drop(columns='_order').reset_index(drop=True))
+
+    @cached_property
+    def teacher_load(self) -> pd.DataFrame:
+        """teacher, pairs, hours, groups, days — по убыванию нагрузки"""
+        t = self.table[self.table['teacher'].notna()]
+        load = t.groupby('teacher', observed=True).agg(
+            pairs=('discipline', 'size'), groups=('group', 'nunique'), days=('day', 'nunique'))
+        load['hours'] = load['pairs'] * self.pair_hours
+        return load.sort_values('pairs', ascending=False, kind='stable').reset_index()
+
+    @cached_property
+    def day_load(self) -> pd.DataFrame:
+        """day, pairs, groups, teachers — в порядке дней из файла"""
+        return self.table.groupby('day', observed=True).agg(
+            pairs=('discipline', 'size'), groups=('group', 'nunique'), teachers=('teacher', 'nunique')).reset_index()
+
+    def _conflicts(self, key: str, occupant: pd.Series) -> pd.DataFrame:
+        t = self.table.assign(_occupant=occupant)
+        t = t[t[key].notna() & t['slot'].notna()]
+        grouped = t.groupby(['sheet', 'day', 'slot', key], observed=True)
+        counts = grouped['_occupant'].nunique()
+        clashes = counts[counts > 1].index
+        if len(clashes) == 0:
+            return pd.DataFrame(columns=['sheet', 'day', 'slot', key, 'groups'])
+        t = t.set_index(['sheet', 'day', 'slot', key]).loc[clashes].reset_index()
+        return (t.groupby(['sheet', 'day', 'slot', key], observed=True)['group']
+                .agg(lambda g: ", ".join(dict.fromkeys(map(str, g)))).rename('groups').reset_index())
+
+    @cached_property
+    def room_conflicts(self) -> pd.DataFrame:
+        """аудитория в одну пару занята разными преподавателями (без преподавателя — разными группами)"""
+        occupant = self.table['teacher'].astype(object).fillna(self.table['group'].astype(object)).astype(str)
+        return self._conflicts('room', occupant)
+
+    @cached_property
+    def teacher_conflicts(self) -> pd.DataFrame:
+        """преподаватель в одну пару стоит в разных аудиториях"""
+        occupant = self.table['room'].astype(object).fillna('').astype(str)
+        return self._conflicts('teacher', occupant)
+
+    @cached_property
+    def plan_comparison(self) -> pd.DataFrame:
+        """group, discipline, planned, scheduled, diff — только расхождения, по убыванию |diff|"""
+        if self.plan is None or self.plan.empty:
+            return pd.DataFrame(columns=['group', 'discipline', 'planned', 'scheduled', 'diff'])
+        key = lambda s: s.astype(str).str.casefold().str.replace('ё', 'е').str.split().str.join(' ')
+        scheduled = self.table.groupby(['group', 'discipline'], observed=True).size().rename('pairs').reset_index()
+        scheduled = scheduled.assign(_g=key(scheduled['group']), _d=key(scheduled['discipline']))
+        planned = self.plan.groupby(['group', 'discipline'], sort=False)['hours'].sum().reset_index()
+        planned = planned.assign(_g=key(planned['group']), _d=key(planned['discipline']))
+        # план может покрывать не все группы — сравниваем только группы из плана
+        scheduled = scheduled[scheduled['_g'].isin(planned['_g'])]
+        merged = planned.merge(scheduled, on=['_g', '_d'], how='outer', suffixes=('', '_s'))
+        merged['group'] = merged['group'].astype(object).fillna(merged['group_s'].astype(object))
+        merged['discipline'] = merged['discipline'].astype(object).fillna(merged['discipline_s'].astype(object))
+        merged['planned'] = merged['hours'].fillna(0.0)
+        merged['scheduled'] = merged['pairs'].fillna(0) * self.pair_hours
+        merged['diff'] = merged['scheduled'] - merged['planned']
+        out = merged.loc[merged['diff'] != 0, ['group', 'discipline', 'planned', 'scheduled', 'diff']]
+        return out.reindex(out['diff'].abs().sort_values(ascending=False, kind='stable').index).reset_index(drop=True)
@@ -1,76 +1,166 @@
 """Обработчик отчета по расписанию"""
 import logging
-import pandas as pd
 from telegram import Update
 from telegram.ext import ContextTypes
-from .report_store import send_and_store
-from collections import Counter
+import pandas as pd
+from .report_store import send_and_store, StoredReport
+from .column_schema import resolve_file
+from .workers import SheetResult, analyze_sheets, split_failed, failed_lines, failed_message
+from .schedule_analytics import ScheduleAnalytics, build_table, concat_tables, read_plan
 
 logger = logging.getLogger(__name__)
 
 async def start_schedule_report(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """сообщение перед загрузкой файла"""
-    text = "📅 Загрузите файл с расписанием групп (Расписание групп.xlsx).\nБот посчитает количество пар по каждой дисциплине для каждой группы."
+    text = "📅 Загрузите файл с расписанием групп (Расписание групп.xlsx).\nБот посчитает количество пар по каждой дисциплине для каждой группы,\nнагрузку преподавателей и дней, конфликты аудиторий.\nЛист с учебным планом (Группа, Дисциплина, Часы) в той же книге — сравнение план/факт."
     if update.callback_query:
         await update.callback_query.edit_message_text(text)
     else:
         await update.message.reply_text(text)
 
+def analyze_schedule_sheet(file_path: str, sheet=None, strict: bool = False):
+    """разбор листа в таблицу пар; лист учебного плана возвращается с kind='plan';
+    None — в листе нет колонки 'Группа'"""
+    plan = read_plan(file_path, sheet)
+    if plan is not None:
+        return SheetResult(sheet, plan, rows=len(plan), kind='plan')
+
+    header, columns, mapping = resolve_file('schedule', file_path, sheet)
+    group_col = mapping.get('group')
+
+    if group_col is None:
+        if strict:
+            return None
+        return SheetResult(sheet, None, error="❌ В файле не найдена колонка 'Группа'. Файл некорректный.")
+
+    content_columns = columns[3::2]
+    if len(content_columns) == 0:
+        return SheetResult(sheet, None, error="❌ Не найдены колонки с расписанием по дням.")
+
+    table, rows = build_table(file_path, sheet, header, group_col, mapping.get('slot'), content_columns)
+    return SheetResult(sheet, table, rows=rows, kind='schedule')
+
+
+def _groups_text(groups: list, pairs: dict) -> tuple:
+    """groups — группы листа в порядке файла; pairs — группа -> [(дисциплина, пар)]"""
+    report = ""
+    overall_total = 0
+    for group in groups:
+        if str(group).strip() == '':
+            continue
+
+        counts = pairs.get(group)
+        if not counts:
+            report += f"*Группа {group}*: Нет занятий в расписании.\n\n"
+            continue
+
+        report += f"*Группа {group}*:\n"
+        group_total = 0
+        for disc, count in counts:
+            report += f"• {disc}: *{count} пар*\n"
+            group_total += count
+            overall_total += count
+
+        report += f"Всего пар в группе: *{group_total}*\n\n"
+    return report, overall_total
+
+
+def _hours(value: float) -> str:
+    return f"{value:.0f}" if float(value).is_integer() else f"{value:.1f}"
+
+
+def _analytics_text(analytics: ScheduleAnalytics, multi_sheet: bool, limit: int = 10) -> str:
+    where = lambda r: (f"{r['sheet']}, " if multi_sheet else "") + f"{r['day']}, пара {r['slot']}"
+    lines = ["📊 Аналитика расписания"]
+
+    load = analytics.teacher_load
+    if not load.empty:
+        lines.append("")
+        lines.append(f"👩‍🏫 Нагрузка преподавателей (топ {min(limit, len(load))} из {len(load)}):")
+        lines.extend(f"• {r['teacher']}: {r['pairs']} пар ({_hours(r['hours'])} ч), групп {r['groups']}, дней {r['days']}"
+                     for _, r in load.head(limit).iterrows())
+
+    days = analytics.day_load
+    if not days.empty:
+        lines.append("")
+        lines.append("📆 Нагрузка по дням:")
+        lines.extend(f"• {r['day']}: {r['pairs']} пар, групп {r['groups']}, преподавателей {r['teachers']}"
+                     for _, r in days.iterrows())
+
+    rooms = analytics.room_conflicts
+    lines.append("")
+    if rooms.empty:
+        lines.append("✅ Конфликтов аудиторий нет.")
+    else:
+        lines.append(f"⚠️ Конфликты аудиторий: {len(rooms)}")
+        lines.extend(f"• {where(r)}, ауд. {r['room']}: {r['groups']}" for _, r in rooms.head(limit).iterrows())
+
+    teachers = analytics.teacher_conflicts
+    if not teachers.empty:
+        lines.append(f"⚠️ Преподаватель в разных аудиториях в одну пару: {len(teachers)}")
+        lines.extend(f"• {where(r)}, {r['teacher']}: {r['groups']}" for _, r in teachers.head(limit).iterrows())
+
+    if analytics.plan is not None:
+        diff = analytics.plan_comparison
+        lines.append("")
+        if diff.empty:
+            lines.append("✅ Часы в расписании совпадают с учебным планом.")
+        else:
+            lines.append(f"📋 Расхождения с учебным планом: {len(diff)}")
+            lines.extend(f"• {r['group']} — {r['discipline']}: план {_hours(r['planned'])} ч, "
+                         f"в расписании {_hours(r['scheduled'])} ч ({r['diff']:+.0f})"
+                         for _, r in diff.head(limit).iterrows())
+    return "\n".join(lines)
+
+
 async def process_schedule_file(update: Update, context: ContextTypes.DEFAULT_TYPE, file_path: str) -> None:
     """обработка файла и генерация отчета"""
     try:
-        df = pd.read_excel(file_path)
-
-        if 'Группа' not in df.columns:
-            await update.message.reply_text("❌ В файле не найдена колонка 'Группа'. Файл некорректный.")
+        found, failed = split_failed(await analyze_sheets(file_path, analyze_schedule_sheet))
+        plans = [s.items for s in found if s.kind == 'plan']
+        sections = [s for s in found if s.kind != 'plan']
+        if not sections:
+            await update.message.reply_text(failed_message(failed, "❌ В файле не найдена колонка 'Группа'. Файл некорректный."))
             return
 
-        content_columns = df.columns[3::2]
-        if len(content_columns) == 0:
-            await update.message.reply_text("❌ Не найдены колонки с расписанием по дням.")
-            return
+        analytics = ScheduleAnalytics(
+            concat_tables([section.items for section in sections]),
+            plan=pd.concat(plans, ignore_index=True) if plans else None,
+        )
+        pairs = {}
+        for row in analytics.pairs_by_group.itertuples(index=False):
+            pairs.setdefault((row.sheet, row.group), []).append((row.discipline, row.count))
 
-        groups = df['Группа'].dropna().unique()
         report = "📅 *Отчет по выставленному расписанию*\n\n"
+        if failed:
+            report += "\n".join(failed_lines(failed)) + "\n\n"
         overall_total = 0
 
-        for group in groups:
-            if pd.isna(group) or str(group).strip() == '':
-                continue
-
-            group_df = df[df['Группа'] == group]
-            disciplines = []
-
-            for col in content_columns:
-                for cell in group_df[col]:
-                    if pd.notna(cell):
-                        cell_str = str(cell)
-                        for line in cell_str.split('\n'):
-                            if 'Предмет:' in line:
-                                discipline = line.split('Предмет:', 1)[1].strip()
-                                if discipline:
-                                    disciplines.append(discipline)
-
-            if not disciplines:
-                report += f"*Группа {group}*: Нет занятий в расписании.\n\n"
-                continue
-
-            counts = Counter(disciplines)
-            report += f"*Группа {group}*:\n"
-            group_total = 0
-            for disc, count in sorted(counts.items(), key=lambda x: x[1], reverse=True):
-                report += f"• {disc}: *{count} пар*\n"
-                group_total += count
-                overall_total += count
-
-            report += f"Всего пар в группе: *{group_total}*\n\n"
+        for section in sections:
+            if len(sections) > 1:
+                report += f"📄 *Лист «{section.sheet}»*\n\n"
+            sheet = str(section.sheet) if section.sheet is not None else ''
+            groups = section.items['group'].cat.categories
+            text, sheet_total = _groups_text(groups, {g: pairs.get((sheet, g)) for g in groups})
+            report += text
+            overall_total += sheet_total
+            if len(sections) > 1:
+                report += f"Всего пар на листе: *{sheet_total}*\n\n"
 
         if overall_total == 0:
             report += "Нет данных о занятиях в загруженном файле.\n"
 
         report += f"*Общее количество пар по всем группам: {overall_total}*"
-        await send_and_store(update, context, report, parse_mode='Markdown', metadata={'type': 'schedule'})
+        results = analytics.pairs_by_group.rename(columns={'discipline': 'name'})[['name', 'group', 'count', 'sheet']]
+        stored = StoredReport.from_results('schedule', results.astype({'name': str, 'group': str, 'sheet': str}), 'count')
+        await send_and_store(update, context, report, parse_mode='Markdown', metadata={'type': 'schedule'}, report=stored)
+
+        if overall_total:
+            load = analytics.teacher_load.rename(columns={'teacher': 'name', 'pairs': 'count'})
+            stored_load = StoredReport.from_results('schedule_load', load.astype({'name': str}), 'count')
+            await send_and_store(update, context, _analytics_text(analytics, len(sections) > 1),
+                                 metadata={'type': 'schedule_load'}, report=stored_load)
 
     except Exception as e:
         logger.exception("ошибка при обработке файла расписания")
-        await update.message.reply_text("❌ Произошла ошибка при обработке файла.")
\ No newline at end of file
+        await update.message.reply_text("❌ Произошла ошибка при обработке файла.")
@@ -0,0 +1,362 @@
+"""Снимки разобранных книг в формате Arrow: Excel читается один раз, дальше — memory-map.
+
+Снимок — каталог <sha256 содержимого>.snap в SNAPSHOT_DIR: meta.json со списком листов
+и по файлу Arrow IPC на лист. Значения ячеек хранятся без потерь, но компактно:
+колонка листа раскладывается по видам значений (целые, дробные, строки, даты, логические),
+строки — словарём (как category), дробные — float32, если это не меняет значений.
+"""
+import os
+import json
+import time
+import shutil
+import hashlib
+import logging
+import datetime
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+from .progress import checkpoint
+
+logger = logging.getLogger(__name__)
+
+SNAPSHOT_DIR = os.getenv("SNAPSHOT_DIR", "snapshots")
+SNAPSHOT_MAX_MB = float(os.getenv("SNAPSHOT_MAX_MB", "512"))
+# снимки, которыми пользовались недавно, вытесняются в последнюю очередь — их может читать
+# другой запрос (уже отображённые в память файлы переживают удаление, но не все листы открыты сразу)
+SNAPSHOT_MIN_AGE = float(os.getenv("SNAPSHOT_MIN_AGE", "600"))
+
+SUFFIX = ".snap"
+META = "meta.json"
+VERSION = 2  # 2: целые отдельно от дробных — в смешанной колонке 7 не становится 7.0
+BLOCK_ROWS = 5000
+HEAD_ROWS = 64
+
+INT, NUM, STR, DATE, BOOL = "int", "num", "str", "date", "bool"
+_KIND_ORDER = (INT, NUM, STR, DATE, BOOL)
+
+
+# --- кэш ---
+
+def content_hash(file_path: str) -> str:
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def snapshot_path(digest: str) -> str:
+    # версия в имени: снимки старого формата не подхватываются и уходят при вытеснении
+    return os.path.join(SNAPSHOT_DIR, f"{digest}.v{VERSION}{SUFFIX}")
+
+
+def is_snapshot(path) -> bool:
+    return isinstance(path, str) and path.endswith(SUFFIX) and os.path.isfile(os.path.join(path, META))
+
+
+def touch(path: str) -> None:
+    """время использования снимка — по mtime meta.json (для вытеснения)"""
+    try:
+        os.utime(os.path.join(path, META))
+    except OSError:
+        pass
+
+
+def new_build_dir(digest: str) -> str:
+    os.makedirs(SNAPSHOT_DIR, exist_ok=True)
+    path = os.path.join(SNAPSHOT_DIR, f"{digest}.tmp-{os.getpid()}-{time.monotonic_ns()}")
+    os.makedirs(path)
+    return path
+
+
+def sheet_file(path: str, index: int) -> str:
+    return os.path.join(path, f"{index}.arrow")
+
+
+def publish(build_dir: str, digest: str, sheets: list) -> str:
+    """дописывает meta.json и атомарно переименовывает каталог; параллельная сборка того же файла не мешает"""
+    with open(os.path.join(build_dir, META), "w", encoding="utf-8") as f:
+        json.dump({"version": VERSION, "sheets": sheets}, f, ensure_ascii=False)
+    target = snapshot_path(digest)
+    try:
+        os.rename(build_dir, target)
+    except OSError:
+        # такой снимок уже опубликовал другой запрос
+        shutil.rmtree(build_dir, ignore_errors=True)
+    return target
+
+
+def _dir_size(path: str) -> int:
+    return sum(entry.stat().st_size for entry in os.scandir(path) if entry.is_file())
+
+
+def evict(max_bytes: int = None, keep: str = None) -> int:
+    """удаляет снимки от давно не использованных, пока каталог не уложится в max_bytes;
+    возвращает число удалённых.
+
+    сначала удаляются снимки старше SNAPSHOT_MIN_AGE; если этого мало, лимит важнее —
+    дальше удаляются и недавние, от самых старых. не трогаются только keep и идущие сборки
+    """
+    max_bytes = SNAPSHOT_MAX_MB * 1024 * 1024 if max_bytes is None else max_bytes
+    if not os.path.isdir(SNAPSHOT_DIR):
+        return 0
+    entries = []
+    for entry in os.scandir(SNAPSHOT_DIR):
+        if not entry.is_dir():
+            continue
+        try:
+            used, building = os.path.getmtime(os.path.join(entry.path, META)), False
+        except OSError:
+            # недостроенный каталог: чужая сборка или остаток упавшей
+            used, building = entry.stat().st_mtime, True
+        entries.append((used, entry.path, _dir_size(entry.path), building))
+    total = sum(entry[2] for entry in entries)
+    removed = 0
+    now = time.time()
+    for forced in (False, True):
+        for used, path, size, building in sorted(entries):
+            if total <= max_bytes:
+                return removed
+            recent = now - used < SNAPSHOT_MIN_AGE
+            if path == keep or not os.path.isdir(path) or (recent and (building or not forced)):
+                continue
+            shutil.rmtree(path, ignore_errors=True)
+            total -= size
+            removed += 1
+    if total > max_bytes:
+        logger.warning("снимки занимают %d МБ при лимите %d МБ", total // 2 ** 20, max_bytes // 2 ** 20)
+    return removed
+
+
+# --- запись листа ---
+
+def _kind(value):
+    if value is None or (isinstance(value, float) and value != value):
+        return None
+    if isinstance(value, bool) or isinstance(value, np.bool_):
+        return BOOL
+    if isinstance(value, (int, np.integer)):
+        return INT
+    if isinstance(value, (float, np.floating)):
+        return NUM
+    if isinstance(value, (datetime.datetime, datetime.date, pd.Timestamp)):
+        return DATE
+    return STR
+
+
+def _block_arrays(column: list) -> dict:
+    """значения одной колонки блока -> {вид: pyarrow-массив с null на чужих местах}"""
+    kinds = [_kind(v) for v in column]
+    out = {}
+    for kind in set(kinds) - {None}:
+        values = [v if k == kind else None for v, k in zip(column, kinds)]
+        if kind == INT and any(not -2 ** 63 <= v < 2 ** 63 for v in values if v is not None):
+            kind, values = STR, [None if v is None else str(v) for v in values]
+        elif kind == STR:
+            # время, Decimal и прочая экзотика — строкой
+            values = [v if v is None or isinstance(v, str) else str(v) for v in values]
+        elif kind == DATE:
+            values = [v if v is None or isinstance(v, datetime.datetime) else pd.Timestamp(v).to_pydatetime() for v in values]
+        array = pa.array(values, type=pa.timestamp("us") if kind == DATE else None)
+        out[kind] = pa.concat_arrays([out[kind], array]) if kind in out else array
+    return out
+
+
+def _compact_numbers(array: pa.ChunkedArray) -> pa.Array:
+    if pa.types.is_integer(array.type):
+        values = array.combine_chunks()
+        if values.null_count == len(values):
+            return values
+        lo, hi = pc.min(values).as_py(), pc.max(values).as_py()
+        for t in (pa.int8(), pa.int16(), pa.int32()):
+            info = np.iinfo(t.to_pandas_dtype())
+            if info.min <= lo and hi <= info.max:
+                return values.cast(t)
+        return values
+    values = array.cast(pa.float64()).combine_chunks()
+    dense = values.to_numpy(zero_copy_only=False)
+    f32 = dense.astype(np.float32)
+    # float32 — только если кратчайшая запись каждого числа остаётся той же
+    same = (f32.astype(str).astype(np.float64) == dense) | np.isnan(dense)
+    return values.cast(pa.float32()) if same.all() else values
+
+
+def write_sheet(rows, path: str) -> int:
+    """записывает строки листа (кортежи значений) в Arrow-файл; возвращает число строк"""
+    columns = {}  # (колонка, вид) -> [массивы по блокам]
+    block_sizes = []
+    width = 0
+    block = []
+
+    def flush():
+        nonlocal width
+        n = len(block)
+        width = max(width, max((len(r) for r in block), default=0))
+        for c in range(width):
+            column = [r[c] if c < len(r) else None for r in block]
+            for kind, array in _block_arrays(column).items():
+                columns.setdefault((c, kind), [None] * len(block_sizes)).append(array)
+        block_sizes.append(n)
+        for chunks in columns.values():
+            if len(chunks) < len(block_sizes):
+                chunks.append(None)
+        block.clear()
+
+    for row in rows:
+        block.append(row)
+        if len(block) >= BLOCK_ROWS:
+            flush()
+            checkpoint(sum(block_sizes))
+    if block:
+        flush()
+
+    fields, arrays = [], []
+    for (c, kind) in sorted(columns, key=lambda key: (key[0], _KIND_ORDER.index(key[1]))):
+        chunks = columns[c, kind]
+        types = [a.type for a in chunks if a is not None and not pa.types.is_null(a.type)]
+        if kind in (INT, NUM):
+            target = pa.int64() if kind == INT else pa.float64()
+        else:
+            target = types[0] if types else pa.null()
+        parts = [pa.nulls(n, target) if a is None or pa.types.is_null(a.type) else a.cast(target)
+                 for a, n in zip(chunks, block_sizes)]
+        merged = pa.chunked_array(parts, type=target)
+        if kind in (INT, NUM):
+            array = _compact_numbers(merged)
+        elif kind == STR:
+            array = merged.combine_chunks().dictionary_encode()
+        else:
+            array = merged.combine_chunks()
+        fields.append(pa.field(f"{c}:{kind}", array.type))
+        arrays.append(array)
+
+    rows_total = sum(block_sizes)
+    schema = pa.schema(fields, metadata={"width": str(width), "rows": str(rows_total)})
+    table = pa.Table.from_arrays(arrays, schema=schema) if arrays else schema.empty_table()
+    with pa.OSFile(path, "wb") as sink, pa.ipc.new_file(sink, schema) as writer:
+        writer.write_table(table, max_chunksize=BLOCK_ROWS * 10)
+    return rows_total
+
+
+# --- чтение ---
+
+def read_meta(path: str) -> dict:
+    with open(os.path.join(path, META), encoding="utf-8") as f:
+        return json.load(f)
+
+
+def sheet_names(path: str) -> list:
+    return list(read_meta(path)["sheets"])
+
+
+def _sheet_index(path: str, sheet) -> int:
+    if sheet is None:
+        return 0
+    sheets = read_meta(path)["sheets"]
+    if isinstance(sheet, int):
+        return sheet
+    return sheets.index(sheet)
+
+
+def open_sheet(path: str, sheet=None) -> tuple:
+    """(таблица, ширина листа) — таблица отображена в память, без копирования"""
+    source = pa.memory_map(sheet_file(path, _sheet_index(path, sheet)))
+    table = pa.ipc.open_file(source).read_all()
+    return table, int(table.schema.metadata[b"width"])
+
+
+def _layout(table: pa.Table) -> dict:
+    """номер колонки листа -> [(вид, индекс колонки таблицы)]"""
+    layout = {}
+    for i, name in enumerate(table.schema.names):
+        c, kind = name.split(":")
+        layout.setdefault(int(c), []).append((kind, i))
+    return layout
+
+
+def _exact_floats(values: np.ndarray) -> np.ndarray:
+    """float32 -> float64 с той же кратчайшей десятичной записью (0.702, а не 0.7020000219)"""
+    return values.astype(str).astype(np.float64)
+
+
+def _python_values(array) -> list:
+    if pa.types.is_dictionary(array.type):
+        array = array.cast(array.type.value_type)
+    if pa.types.is_float32(array.type):
+        values = _exact_floats(array.to_numpy(zero_copy_only=False))
+        valid = array.is_valid().to_numpy(zero_copy_only=False)
+        return [v if ok else None for v, ok in zip(values.tolist(), valid)]
+    return array.to_pylist()
+
+
+def iter_rows(path: str, sheet=None):
+    """строки листа кортежами python-значений, как у openpyxl.
+    первый блок маленький: чаще всего читают только заголовок"""
+    table, width = open_sheet(path, sheet)
+    layout = _layout(table)
+    offset, size = 0, HEAD_ROWS
+    while offset < table.num_rows:
+        part = table.slice(offset, size)
+        n = part.num_rows
+        columns = []
+        for c in range(width):
+            values = [None] * n
+            for _, i in layout.get(c, ()):
+                for j, v in enumerate(_python_values(part.column(i))):
+                    if v is not None:
+                        values[j] = v
+            columns.append(values)
+        yield from zip(*columns) if columns else ((),) * n
+        offset, size = offset + n, BLOCK_ROWS
+
+
+def _series(table: pa.Table, parts: list, n: int) -> pd.Series:
+    arrays = [(kind, table.column(i)) for kind, i in parts]
+    arrays = [(kind, a) for kind, a in arrays if a.null_count < len(a)]
+    if not arrays:
+        return pd.Series([None] * n, dtype=object)
+    if len(arrays) == 1:
+        kind, array = arrays[0]
+        if pa.types.is_dictionary(array.type):
+            array = array.cast(array.type.value_type)
+        elif pa.types.is_integer(array.type):
+            # на диске int8/int16 ради места, в расчётах — int64, как при чтении Excel
+            array = array.cast(pa.int64())
+        elif pa.types.is_float32(array.type):
+            return pd.Series(_exact_floats(array.to_numpy(zero_copy_only=False)))
+        return array.to_pandas()
+    if {kind for kind, _ in arrays} == {INT, NUM}:
+        # целые вперемешку с дробными — float64, как при чтении Excel
+        values = np.full(n, np.nan)
+        for kind, array in arrays:
+            valid = array.is_valid().to_numpy(zero_copy_only=False)
+            dense = array.cast(pa.float64()).to_numpy(zero_copy_only=False)
+            if pa.types.is_float32(array.type):
+                dense = _exact_floats(array.to_numpy(zero_copy_only=False))
+            values[valid] = dense[valid]
+        return pd.Series(values)
+    # в одной колонке и числа, и строки — собираем object, как при чтении Excel
+    values = np.full(n, None, dtype=object)
+    for kind, array in arrays:
+        valid = array.is_valid().to_numpy(zero_copy_only=False)
+        if pa.types.is_float32(array.type):
+            dense = _exact_floats(array.to_numpy(zero_copy_only=False))
+        elif pa.types.is_dictionary(array.type):
+            dense = np.asarray(array.cast(array.type.value_type).to_pylist(), dtype=object)
+        else:
+            dense = np.asarray(array.to_pylist(), dtype=object)
+        values[valid] = dense[valid]
+    return pd.Series(values, dtype=object)
+
+
+def iter_frames(path: str, sheet=None, start: int = 0, width: int = None, chunk_size: int = BLOCK_ROWS):
+    """DataFrame-блоки строк листа начиная со start; колонки нумеруются 0..width-1"""
+    table, sheet_width = open_sheet(path, sheet)
+    width = sheet_width if width is None else width
+    layout = _layout(table)
+    for offset in range(start, table.num_rows, chunk_size):
+        part = table.slice(offset, chunk_size)
+        n = part.num_rows
+        data = {c: _series(part, layout.get(c, []), n) for c in range(width)}
+        yield offset - start, pd.DataFrame(data, index=pd.RangeIndex(n))
@@ -4,64 +4,117 @@ import pandas as pd
 from telegram import Update
 from telegram.helpers import escape_markdown
 from telegram.ext import ContextTypes
-from .report_store import send_and_store
+from .report_store import send_and_store, StoredReport
+from .entity_index import NameSummary, people_frame
+from .excel_stream import iter_chunks
+from .column_schema import resolve_file
+from .workers import SheetResult, analyze_sheets, split_failed, failed_lines, failed_message
+from .rules import DEFAULT_RULES, compile_rules, rules_for_update
 
 logger = logging.getLogger(__name__)
 
 async def start_students_report(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
-    text = "👥 *Отчет по студентам*\n\nЗагрузите файл: Отчет по студентам.xls или .xlsx\n\nБот найдёт студентов с:\n• ДЗ = 1 *или*\n• Классная работа < 3"
+    text = "👥 *Отчет по студентам*\n\nЗагрузите файл: Отчет по студентам.xls или .xlsx\n\nБот найдёт студентов с:\n• ДЗ = 1 *или*\n• Классная работа < 3\n\nПороги настраиваются командой /rules"
     if update.callback_query:
         await update.callback_query.edit_message_text(text, parse_mode='Markdown')
     else:
         await update.message.reply_text("👥 Загрузите файл с данными студентов.\nБот покажет студентов с ДЗ = 1 ИЛИ классной работой < 3")
 
-async def process_students_file(update: Update, context: ContextTypes.DEFAULT_TYPE, file_path: str) -> None:
-    try:
-        df = pd.read_excel(file_path, header=0)
+def analyze_students_sheet(file_path: str, sheet=None, strict: bool = False, rules: tuple = None):
+    """разбор одного листа; None — в листе нет колонок FIO/Homework/Classroom"""
+    compiled = compile_rules('students', rules or tuple(DEFAULT_RULES['students'].items()))
+    header, _, mapping = resolve_file('students', file_path, sheet)
+    if not mapping.ok:
+        return None
+
+    # приводим найденные колонки к каноническим именам отчёта
+    rename = {mapping.get('fio'): 'FIO', mapping.get('homework'): 'Homework', mapping.get('classroom'): 'Classroom'}
+    if mapping.get('group') is not None:
+        rename[mapping.get('group')] = 'Группа'
+    cols_to_copy = list(rename.values()) + ['Уровень']
+
+    # в памяти копятся только проблемные строки, сам файл читается чанками
+    parts = []
+    rows = 0
+    people = NameSummary(mean=('homework', 'classroom'))
+    for chunk in iter_chunks(file_path, header=header, sheet=sheet):
+        rows += len(chunk)
+        chunk = chunk[list(rename)].rename(columns=rename)
+        chunk['Homework'] = pd.to_numeric(chunk['Homework'], errors='coerce')
+        chunk['Classroom'] = pd.to_numeric(chunk['Classroom'], errors='coerce')
+        people.feed(chunk['FIO'], {'homework': chunk['Homework'], 'classroom': chunk['Classroom']}, chunk.get('Группа'))
+        tiers = compiled.evaluate({'homework': chunk['Homework'], 'classroom': chunk['Classroom']})
+        mask = tiers != ''
+        if mask.any():
+            parts.append(chunk[mask].assign(Уровень=tiers[mask]))
+    problems = pd.concat(parts) if parts else pd.DataFrame(columns=cols_to_copy)
+    problems['FIO'] = problems['FIO'].astype(str).str.strip()
+    return SheetResult(sheet, problems, mapping.notes(), rows, people=people.result())
+
+
+def _count_text(n: int) -> str:
+    return "студент" if n == 1 else "студента" if 2 <= n % 10 <= 4 and n % 100 not in [12,13,14] else "студентов"
 
-        if not all(col in df.columns for col in ['FIO', 'Homework', 'Classroom']):
-            await update.message.reply_text("❌ Нет нужных колонок в файле")
-            return
 
-        df['Homework'] = pd.to_numeric(df['Homework'], errors='coerce')
-        df['Classroom'] = pd.to_numeric(df['Classroom'], errors='coerce')
+def _problems_text(problems: pd.DataFrame, rules) -> str:
+    has_group = 'Группа' in problems.columns
+    report = ""
+    for _, row in problems.iterrows():
+        hw = row['Homework']
+        cw = row['Classroom']
 
-        has_group = 'Группа' in df.columns
-        mask = (df['Homework'] == 1) | (df['Classroom'] < 3)
-        cols_to_copy = ['FIO', 'Homework', 'Classroom']
+        report += f"• *{row['FIO']}*"
         if has_group:
-            cols_to_copy.append('Группа')
-        problems = df[mask][cols_to_copy].copy()
-        problems['FIO'] = problems['FIO'].str.strip()
+            group = row['Группа'] if pd.notna(row['Группа']) else '-'
+            report += f" \({group}\)"
+        report += "\n"
+        report += f"  ДЗ: {int(hw) if pd.notna(hw) else '-'} | Класс: {cw if pd.notna(cw) else '-'}\n"
+        report += f"  Правило: {rules.describe(row['Уровень'])}\n"
+        report += "\n"
+    return report
+
+
+async def process_students_file(update: Update, context: ContextTypes.DEFAULT_TYPE, file_path: str) -> None:
+    try:
+        rules = rules_for_update(update, 'students')
+        compiled = compile_rules('students', rules)
+        sections, failed = split_failed(await analyze_sheets(file_path, analyze_students_sheet, rules))
+
+        if not sections:
+            await update.message.reply_text(failed_message(failed, "❌ Нет нужных колонок в файле"))
+            return
 
+        total = sum(len(section.items) for section in sections)
         report = "👥 *Отчет по студентам с проблемами*\n\n"
+        if failed:
+            report += "\n".join(failed_lines(failed)) + "\n\n"
 
-        if len(problems) == 0:
+        if total == 0:
             report += "✅ Проблемных студентов не найдено."
+        elif len(sections) == 1:
+            report += f"⚠️ Найдено {total} {_count_text(total)}:\n\n"
+            report += _problems_text(sections[0].items, compiled)
         else:
-            count_text = "студент" if len(problems) == 1 else "студента" if 2 <= len(problems) % 10 <= 4 and len(problems) % 100 not in [12,13,14] else "студентов"
-            report += f"⚠️ Найдено {len(problems)} {count_text}:\n\n"
-            for _, row in problems.iterrows():
-                hw = row['Homework']
-                cw = row['Classroom']
-                reason = []
-                if pd.notna(hw) and hw == 1:
-                    reason.append("ДЗ = 1 🔥")
-                if pd.notna(cw) and cw < 3:
-                    reason.append("Классная < 3 ⚠️")
-
-                report += f"• *{row['FIO']}*"
-                if has_group:
-                    group = row['Группа'] if pd.notna(row['Группа']) else '-'
-                    report += f" \({group}\)"
-                report += "\n"
-                report += f"  ДЗ: {int(hw) if pd.notna(hw) else '-'} | Класс: {cw if pd.notna(cw) else '-'}\n"
-                if reason:
-                    report += f"  Причина: {', '.join(reason)}\n"
-                report += "\n"
+            for section in sections:
+                n = len(section.items)
+                report += f"📄 Лист «{section.sheet}»: {n} {_count_text(n)}\n\n"
+                report += _problems_text(section.items, compiled)
+            report += f"🧮 Итого по {len(sections)} листам: {total} {_count_text(total)}"
 
+        results = pd.concat([
+            pd.DataFrame({
+                'name': section.items['FIO'],
+                'group': section.items['Группа'] if 'Группа' in section.items.columns else '',
+                'homework': section.items['Homework'],
+                'classroom': section.items['Classroom'],
+                'tier': section.items['Уровень'],
+                'sheet': section.sheet,
+            })
+            for section in sections
+        ])
+        stored = StoredReport.from_results('students', results, 'homework', people=people_frame(sections))
         escaped_report = escape_markdown(report, version=2)
-        await send_and_store(update, context, escaped_report, parse_mode='MarkdownV2', metadata={'type': 'students'})
+        await send_and_store(update, context, escaped_report, parse_mode='MarkdownV2', metadata={'type': 'students'}, report=stored)
 
     except Exception as e:
         logger.exception("ошибка в отчете по студентам")
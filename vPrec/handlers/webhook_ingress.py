@@ -0,0 +1,324 @@
+"""Приём вебхуков Telegram: мгновенный ответ, ограниченная очередь, дедупликация и пул обработчиков.
+
+Telegram повторяет доставку, если ответ на вебхук задерживается, поэтому апдейт
+только кладётся в очередь, а обработка идёт в фоне. Повторы отсекаются по update_id.
+У каждого чата своя очередь и одна задача, которая её разбирает: апдейты чата идут
+строго по порядку, а слот обработки (их WEBHOOK_WORKERS) занимается только на время
+самой обработки — медленный чат не задерживает остальные.
+
+/metrics и /healthz на публичном порту отдаются только с заголовком секрета вебхука;
+без проверки — на отдельном локальном адресе WEBHOOK_METRICS_LISTEN (например 127.0.0.1:9102).
+"""
+import os
+import json
+import signal
+import time
+import asyncio
+import logging
+from functools import partial
+from collections import OrderedDict, deque
+from telegram import Update
+from telegram.ext import Application
+
+logger = logging.getLogger(__name__)
+
+WEBHOOK_QUEUE_SIZE = int(os.getenv("WEBHOOK_QUEUE_SIZE", "1000"))
+WEBHOOK_WORKERS = int(os.getenv("WEBHOOK_WORKERS", "8"))
+WEBHOOK_DEDUP_SIZE = int(os.getenv("WEBHOOK_DEDUP_SIZE", "10000"))
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET")
+WEBHOOK_METRICS_LISTEN = os.getenv("WEBHOOK_METRICS_LISTEN")  # host:port только для метрик
+
+MAX_BODY = 1024 * 1024
+READ_TIMEOUT = 30.0
+
+_REASONS = {200: "OK", 400: "Bad Request", 403: "Forbidden", 404: "Not Found",
+            405: "Method Not Allowed", 413: "Payload Too Large", 503: "Service Unavailable"}
+
+
+class UpdateDeduper:
+    """ограниченное LRU-множество уже принятых update_id"""
+
+    def __init__(self, max_size: int = WEBHOOK_DEDUP_SIZE):
+        self.max_size = max_size
+        self._seen = OrderedDict()
+
+    def __contains__(self, update_id) -> bool:
+        return update_id in self._seen
+
+    def add(self, update_id) -> None:
+        self._seen[update_id] = None
+        self._seen.move_to_end(update_id)
+        while len(self._seen) > self.max_size:
+            self._seen.popitem(last=False)
+
+
+class LatencyWindow:
+    """последние N замеров для квантилей p50/p95/p99"""
+
+    def __init__(self, size: int = 2048):
+        self._values = deque(maxlen=size)
+
+    def add(self, seconds: float) -> None:
+        self._values.append(seconds)
+
+    def quantiles(self) -> dict:
+        values = sorted(self._values)
+        if not values:
+            return {}
+        return {q: values[min(len(values) - 1, int(q * len(values)))] for q in (0.5, 0.95, 0.99)}
+
+
+class IngressMetrics:
+    def __init__(self):
+        self.received = 0
+        self.duplicates = 0
+        self.dropped = 0
+        self.rejected = 0
+        self.processed = 0
+        self.failed = 0
+        self.ingress = LatencyWindow()
+        self.queue_wait = LatencyWindow()
+        self.processing = LatencyWindow()
+
+    def render(self, queue_depth: int, queue_size: int, busy: int, chats: int = 0) -> str:
+        """метрики в текстовом формате Prometheus"""
+        lines = []
+        for name, value in (("received", self.received), ("duplicates", self.duplicates),
+                            ("dropped", self.dropped), ("rejected", self.rejected),
+                            ("processed", self.processed), ("failed", self.failed)):
+            lines.append(f"bot_webhook_updates_{name}_total {value}")
+        lines.append(f"bot_webhook_queue_depth {queue_depth}")
+        lines.append(f"bot_webhook_queue_capacity {queue_size}")
+        lines.append(f"bot_webhook_workers_busy {busy}")
+        lines.append(f"bot_webhook_chats_active {chats}")
+        for name, window in (("ingress", self.ingress), ("queue_wait", self.queue_wait),
+                             ("processing", self.processing)):
+            for q, value in window.quantiles().items():
+                lines.append(f'bot_webhook_{name}_seconds{{quantile="{q}"}} {value:.6f}')
+        return "\n".join(lines) + "\n"
+
+
+def _update_key(update: Update):
+    """апдейты одного чата (или пользователя) обрабатываются последовательно"""
+    if update.effective_chat is not None:
+        return update.effective_chat.id
+    if update.effective_user is not None:
+        return update.effective_user.id
+    return None
+
+
+class WebhookIngress:
+    def __init__(self, application: Application, url_path: str, secret_token: str = WEBHOOK_SECRET,
+                 queue_size: int = WEBHOOK_QUEUE_SIZE, workers: int = WEBHOOK_WORKERS,
+                 dedup_size: int = WEBHOOK_DEDUP_SIZE):
+        self.application = application
+        self.url_path = "/" + url_path.lstrip("/")
+        self.secret_token = secret_token
+        self.queue_size = queue_size
+        self.worker_count = workers
+        self.deduper = UpdateDeduper(dedup_size)
+        self.metrics = IngressMetrics()
+        self.pending = 0  # принято и ещё не обработано, по всем чатам
+        self.busy = 0
+        self.port = None
+        self._chats = {}  # ключ чата -> deque апдейтов, ждущих обработки
+        self._tasks = set()  # задачи, разбирающие очереди чатов
+        self._slots = asyncio.Semaphore(workers)
+        self._idle = asyncio.Event()
+        self._idle.set()
+        self._server = None
+        self._metrics_server = None
+        self.metrics_port = None
+
+    # --- http ---
+
+    async def start(self, host: str, port: int) -> None:
+        self._server = await asyncio.start_server(partial(self._serve_connection, public=True), host, port)
+        self.port = self._server.sockets[0].getsockname()[1]
+        logger.info("вебхук слушает %s:%s%s, воркеров %d, очередь %d",
+                    host, port, self.url_path, self.worker_count, self.queue_size)
+
+    async def start_metrics(self, host: str, port: int) -> None:
+        """отдельный адрес для /metrics и /healthz без секрета; наружу его не открывают"""
+        self._metrics_server = await asyncio.start_server(partial(self._serve_connection, public=False), host, port)
+        self.metrics_port = self._metrics_server.sockets[0].getsockname()[1]
+        logger.info("метрики вебхука: %s:%s/metrics", host, self.metrics_port)
+
+    async def stop(self, drain_timeout: float = 10.0) -> None:
+        for server in (self._server, self._metrics_server):
+            if server is not None:
+                server.close()
+                await server.wait_closed()
+        try:
+            await asyncio.wait_for(self._idle.wait(), drain_timeout)
+        except asyncio.TimeoutError:
+            logger.warning("вебхук: не дождались обработки %d апдейтов", self.pending)
+        tasks = list(self._tasks)
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    async def _serve_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter,
+                                public: bool = True) -> None:
+        try:
+            while True:
+                try:
+                    request_line = await asyncio.wait_for(reader.readline(), READ_TIMEOUT)
+                except asyncio.TimeoutError:
+                    break
+                if not request_line:
+                    break
+                started = time.perf_counter()
+                method, path, version = (request_line.decode("latin-1").split() + ["", "", ""])[:3]
+                headers = {}
+                while True:
+                    line = await asyncio.wait_for(reader.readline(), READ_TIMEOUT)
+                    if line in (b"\r\n", b"\n", b""):
+                        break
+                    name, _, value = line.decode("latin-1").partition(":")
+                    headers[name.strip().lower()] = value.strip()
+
+                length = int(headers.get("content-length") or 0)
+                if length > MAX_BODY:
+                    await self._respond(writer, 413, close=True)
+                    break
+                body = await asyncio.wait_for(reader.readexactly(length), READ_TIMEOUT) if length else b""
+
+                status, content_type, payload = self._route(method, path.split("?", 1)[0], headers, body, public)
+                keep_alive = version == "HTTP/1.1" and headers.get("connection", "").lower() != "close"
+                await self._respond(writer, status, payload, content_type, close=not keep_alive)
+                if method == "POST":
+                    self.metrics.ingress.add(time.perf_counter() - started)
+                if not keep_alive:
+                    break
+        except (asyncio.IncompleteReadError, asyncio.TimeoutError, ConnectionError, ValueError):
+            pass
+        except Exception:
+            logger.exception("вебхук: ошибка соединения")
+        finally:
+            writer.close()
+
+    async def _respond(self, writer, status: int, payload: bytes = b"", content_type: str = "text/plain", close: bool = False) -> None:
+        head = (f"HTTP/1.1 {status} {_REASONS.get(status, '')}\r\n"
+                f"Content-Type: {content_type}\r\nContent-Length: {len(payload)}\r\n"
+                f"Connection: {'close' if close else 'keep-alive'}\r\n\r\n")
+        writer.write(head.encode("latin-1") + payload)
+        await writer.drain()
+
+    def _authorized(self, headers: dict) -> bool:
+        return headers.get("x-telegram-bot-api-secret-token") == self.secret_token
+
+    def _route(self, method: str, path: str, headers: dict, body: bytes, public: bool = True) -> tuple:
+        if path in ("/metrics", "/healthz") and method == "GET":
+            # на публичном порту — только с секретом; без секрета служебных путей там нет
+            if public and not (self.secret_token and self._authorized(headers)):
+                return 404, "text/plain", b""
+            if path == "/healthz":
+                return 200, "text/plain", b"ok"
+            text = self.metrics.render(self.pending - self.busy, self.queue_size, self.busy, len(self._chats))
+            return 200, "text/plain; version=0.0.4", text.encode()
+        if not public or path != self.url_path:
+            return 404, "text/plain", b""
+        if method != "POST":
+            return 405, "text/plain", b""
+        if self.secret_token and not self._authorized(headers):
+            self.metrics.rejected += 1
+            return 403, "text/plain", b""
+        try:
+            data = json.loads(body)
+            update_id = data["update_id"]
+        except (ValueError, KeyError, TypeError):
+            self.metrics.rejected += 1
+            return 400, "text/plain", b""
+        return self.enqueue(update_id, data)
+
+    # --- очередь ---
+
+    def enqueue(self, update_id, data: dict) -> tuple:
+        """ответ вебхуку без ожидания обработки; повтор — сразу 200, переполнение — 503"""
+        self.metrics.received += 1
+        if update_id in self.deduper:
+            self.metrics.duplicates += 1
+            return 200, "text/plain", b""
+        if self.pending >= self.queue_size:
+            # не запоминаем update_id: Telegram повторит доставку, и апдейт не потеряется
+            self.metrics.dropped += 1
+            return 503, "text/plain", b""
+        self.deduper.add(update_id)
+        try:
+            update = Update.de_json(data, self.application.bot)
+        except Exception:
+            # повтор не поможет — отвечаем 200, чтобы Telegram не слал его снова
+            logger.exception("вебхук: не удалось разобрать апдейт")
+            self.metrics.failed += 1
+            return 200, "text/plain", b""
+
+        key = _update_key(update)
+        chat = self._chats.get(key)
+        if chat is None:
+            chat = self._chats[key] = deque()
+            task = asyncio.create_task(self._drain(key, chat))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+        chat.append((time.perf_counter(), update))
+        self.pending += 1
+        self._idle.clear()
+        return 200, "text/plain", b""
+
+    async def _drain(self, key, chat: deque) -> None:
+        """разбирает очередь одного чата по порядку; слот занимается только на время обработки"""
+        try:
+            while chat:
+                queued_at, update = chat.popleft()
+                try:
+                    async with self._slots:
+                        self.metrics.queue_wait.add(time.perf_counter() - queued_at)
+                        await self._process(update)
+                finally:
+                    self.pending -= 1
+                    if self.pending == 0:
+                        self._idle.set()
+        finally:
+            # между проверкой очереди и удалением нет await — новый апдейт не потеряется
+            if self._chats.get(key) is chat:
+                del self._chats[key]
+
+    async def _process(self, update: Update) -> None:
+        self.busy += 1
+        started = time.perf_counter()
+        try:
+            await self.application.process_update(update)
+            self.metrics.processed += 1
+        except Exception:
+            logger.exception("вебхук: ошибка обработки апдейта %s", update.update_id)
+            self.metrics.failed += 1
+        finally:
+            self.metrics.processing.add(time.perf_counter() - started)
+            self.busy -= 1
+
+
+async def serve_webhook(application: Application, webhook_url: str, listen: str, port: int,
+                        url_path: str, secret_token: str = WEBHOOK_SECRET) -> None:
+    """жизненный цикл бота в режиме вебхука поверх WebhookIngress (вместо run_webhook)"""
+    ingress = WebhookIngress(application, url_path, secret_token=secret_token)
+    await application.initialize()
+    await application.start()
+    await ingress.start(listen, port)
+    if WEBHOOK_METRICS_LISTEN:
+        metrics_host, _, metrics_port = WEBHOOK_METRICS_LISTEN.rpartition(":")
+        await ingress.start_metrics(metrics_host or "127.0.0.1", int(metrics_port))
+    await application.bot.set_webhook(webhook_url, secret_token=secret_token,
+                                      allowed_updates=Update.ALL_TYPES)
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(sig, stop.set)
+        except (NotImplementedError, RuntimeError):
+            pass
+    try:
+        await stop.wait()
+    finally:
+        await ingress.stop()
+        await application.stop()
+        await application.shutdown()
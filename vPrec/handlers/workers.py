@@ -0,0 +1,166 @@
+"""Пул процессов для разбора Excel и параллельная обработка листов книги"""
+import os
+import shutil
+import asyncio
+import logging
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field
+from .excel_stream import sheet_names, iter_rows
+from . import snapshots
+from .progress import JobCancelled, current_job, run_bound, shutdown_manager
+from .profiling import current_session, profiled_call, record_worker
+
+logger = logging.getLogger(__name__)
+
+SHEET_WORKERS = int(os.getenv("SHEET_WORKERS", str(min(2, os.cpu_count() or 1))))
+
+_pool = None
+
+
+@dataclass
+class SheetResult:
+    """результат разбора одного листа; items — строки отчёта, notes — предупреждения,
+    error — текст для пользователя, если лист разобрать не удалось,
+    kind — вид листа, если в книге бывают листы разного назначения,
+    people — сводка по всем разобранным именам листа (entity_index.NameSummary)"""
+    sheet: str
+    items: object
+    notes: list = field(default_factory=list)
+    rows: int = 0
+    error: str = None
+    kind: str = None
+    people: object = None
+
+
+def get_pool() -> ProcessPoolExecutor:
+    global _pool
+    if _pool is None:
+        # spawn: рабочие процессы не наследуют потоки и event loop бота
+        _pool = ProcessPoolExecutor(max_workers=SHEET_WORKERS, mp_context=multiprocessing.get_context("spawn"))
+    return _pool
+
+
+def shutdown_pool(wait: bool = False) -> None:
+    """wait=True — дождаться выхода рабочих процессов (нужно, чтобы учесть их пик памяти)"""
+    global _pool
+    if _pool is not None:
+        _pool.shutdown(wait=wait, cancel_futures=True)
+        _pool = None
+    shutdown_manager()
+
+
+async def run_in_pool(func, *args):
+    """тяжёлая синхронная функция в пуле процессов, не блокируя event loop.
+    для запросов из выборки профилирования вызов в воркере идёт под cProfile/tracemalloc"""
+    loop = asyncio.get_running_loop()
+    job = current_job()
+    if job is not None:
+        # контрольные точки в воркере: строки для статуса и проверка /cancel
+        func, args = run_bound, (job.token(), func) + args
+    session = current_session()
+    if session is None:
+        return await loop.run_in_executor(get_pool(), func, *args)
+    result, stats, peak = await loop.run_in_executor(get_pool(), profiled_call, func, *args)
+    record_worker(session, stats, peak)
+    return result
+
+
+async def _analyze_sheet(file_path: str, analyze, sheet, strict: bool, *args):
+    """падение разбора одного листа не роняет весь отчёт — лист возвращается с ошибкой"""
+    try:
+        return await run_in_pool(analyze, file_path, sheet, strict, *args)
+    except Exception:
+        logger.exception("ошибка разбора листа %s", sheet)
+        return SheetResult(sheet, None, error="❌ Ошибка обработки листа.")
+
+
+async def analyze_sheets(file_path: str, analyze, *args) -> list:
+    """запускает analyze(file_path, sheet, strict, *args) по всем листам параллельно.
+
+    strict=True — лист берётся, только если его заголовок распознан схемой
+    (analyze возвращает None для чужих листов). если не подошёл ни один лист,
+    первый лист разбирается в нестрогом режиме — как раньше, с запасными колонками.
+    листы, которые разобрать не удалось, возвращаются с error (см. split_failed).
+    """
+    sheets = await run_in_pool(sheet_names, file_path)
+    results = await asyncio.gather(*(_analyze_sheet(file_path, analyze, sheet, True, *args) for sheet in sheets))
+    found = [r for r in results if r is not None]
+    if found:
+        return found
+    fallback = await _analyze_sheet(file_path, analyze, sheets[0] if sheets else None, False, *args)
+    return [fallback] if fallback is not None else []
+
+
+def split_failed(sections: list) -> tuple:
+    """(разобранные листы, листы с ошибкой)"""
+    return [s for s in sections if not s.error], [s for s in sections if s.error]
+
+
+def failed_lines(failed: list) -> list:
+    """по строке на лист, который не удалось разобрать — для отчёта по остальным листам"""
+    return [f"⚠️ Лист «{s.sheet}» не разобран: {s.error.splitlines()[0].lstrip('❌ ')}" for s in failed]
+
+
+def failed_message(failed: list, default: str) -> str:
+    """ответ, когда не разобран ни один лист"""
+    if len(failed) == 1:
+        return failed[0].error
+    if failed:
+        return "\n".join(["❌ Не удалось разобрать ни один лист:"] + failed_lines(failed))
+    return default
+
+
+def _snapshot_sheet(file_path: str, sheet, dst: str) -> int:
+    return snapshots.write_sheet(iter_rows(file_path, sheet), dst)
+
+
+def _prepare_snapshot(file_path: str) -> tuple:
+    """(хэш, готовый снимок или None, листы) — хэш и поиск без разбора книги"""
+    digest = snapshots.content_hash(file_path)
+    path = snapshots.snapshot_path(digest)
+    if snapshots.is_snapshot(path):
+        snapshots.touch(path)
+        return digest, path, None
+    return digest, None, sheet_names(file_path)
+
+
+_building = {}  # хэш -> задача сборки: одинаковые файлы, загруженные одновременно, собираются один раз
+
+
+async def _build_snapshot(file_path: str, digest: str, sheets: list) -> str:
+    build_dir = snapshots.new_build_dir(digest)
+    try:
+        await asyncio.gather(*(run_in_pool(_snapshot_sheet, file_path, sheet, snapshots.sheet_file(build_dir, i))
+                               for i, sheet in enumerate(sheets)))
+    except BaseException:
+        shutil.rmtree(build_dir, ignore_errors=True)
+        raise
+    path = snapshots.publish(build_dir, digest, sheets)
+    await run_in_pool(snapshots.evict, None, path)
+    return path
+
+
+async def snapshot_workbook(file_path: str, build: bool = True) -> str:
+    """путь к Arrow-снимку книги (по хэшу содержимого): готовый из кэша или собранный
+    параллельно по листам. build=False — только из кэша. если снимка нет и собрать
+    его не удалось, возвращается сам file_path — отчёты читают Excel как раньше"""
+    try:
+        digest, path, sheets = await run_in_pool(_prepare_snapshot, file_path)
+        if path is not None or not build:
+            return path or file_path
+        task = _building.get(digest)
+        if task is None:
+            task = asyncio.ensure_future(_build_snapshot(file_path, digest, sheets))
+            _building[digest] = task
+            task.add_done_callback(lambda _: _building.pop(digest, None))
+        return await asyncio.shield(task)
+    except JobCancelled:
+        # сборку, общую с другим запросом, мог отменить его владелец — тогда читаем Excel сами
+        job = current_job()
+        if job is not None and job.cancelled:
+            raise
+        return file_path
+    except Exception:
+        logger.warning("не удалось собрать снимок %s, читаем Excel", file_path, exc_info=True)
+        return file_path
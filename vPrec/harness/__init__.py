@@ -0,0 +1,2 @@
+"""Стенды без Telegram: нагрузочный (фейковый Bot API, прогон сценариев через настоящий бот)
+и офлайн-бенчмарк обработчиков с фейковыми Update/Context и бюджетами времени и памяти"""
@@ -0,0 +1,234 @@
+"""Офлайн-бенчмарк обработчиков отчётов с бюджетами времени и памяти.
+
+Каждый process_*_file вызывается напрямую с фейковыми Update/Context (harness.fakes)
+на детерминированной книге из генераторов workbooks (фиксированный seed) — в xlsx
+и в Arrow-снимке, как их читает бот. Каждый прогон — в отдельном процессе со своим пулом:
+пик RSS бота и рабочих процессов не смешивается с другими прогонами.
+
+запуск из каталога vPrec:
+    python -m harness.bench
+    python -m harness.bench --types attendance,lessons --rows 20000 --formats xlsx
+    python -m harness.bench --time-scale 3 --json bench.json
+код возврата 1 — отчёт не собрался или превышен бюджет.
+на уменьшенном объёме те же бюджеты проверяет tests/test_bench.py.
+"""
+import os
+import sys
+import json
+import time
+import asyncio
+import logging
+import argparse
+import resource
+import tempfile
+import importlib
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, asdict
+from .workbooks import GENERATORS, write_workbook
+from .fakes import FakeUpdate, FakeContext
+
+FORMATS = ("xlsx", "snapshot")
+# постоянная часть: интерпретатор с pandas, pyarrow и openpyxl, чтение шапки, отправка ответа
+BASE_MB = 200
+BASE_SECONDS = 3.0
+
+
+@dataclass(frozen=True)
+class Budget:
+    """лимиты сверх BASE_* на 100 000 строк; с запасом примерно вдвое к замеру на одном ядре"""
+    xlsx_seconds: float
+    snapshot_seconds: float
+    mb: float  # пик RSS бота или рабочего процесса
+
+    def seconds(self, fmt: str) -> float:
+        return self.snapshot_seconds if fmt == "snapshot" else self.xlsx_seconds
+
+
+BUDGETS = {
+    'attendance': Budget(20, 5, 150),
+    'homework_check': Budget(30, 10, 250),
+    'homework_submit': Budget(30, 6, 250),
+    'students': Budget(25, 8, 200),
+    'lessons': Budget(50, 12, 100),
+    'schedule': Budget(80, 35, 400),
+}
+
+# что сценарий кладёт в user_data до загрузки файла
+USER_DATA = {
+    'homework_check': {'hw_check_period': 'month'},
+}
+
+
+@dataclass
+class CaseResult:
+    report_type: str
+    fmt: str
+    rows: int
+    seconds: float
+    bot_mb: float  # пик RSS процесса бота
+    pool_mb: float  # пик RSS самого тяжёлого рабочего процесса
+    replies: int
+    error: str = None
+
+    @property
+    def seconds_per_100k(self) -> float:
+        return self.seconds * 100_000 / max(1, self.rows)
+
+    @property
+    def peak_mb(self) -> float:
+        return max(self.bot_mb, self.pool_mb)
+
+
+def _peak_mb(who) -> float:
+    # ru_maxrss в Linux — в килобайтах
+    return resource.getrusage(who).ru_maxrss / 1024
+
+
+def _warm(module: str) -> None:
+    importlib.import_module(module)
+
+
+async def _run_case(report_type: str, fmt: str, source: str, rows: int) -> CaseResult:
+    from handlers import registry
+    from handlers.workers import run_in_pool, shutdown_pool
+
+    processor = registry.PROCESSORS[report_type]
+    # пул бота всегда прогрет — запуск процессов и импорты в замер не входят
+    await run_in_pool(_warm, processor.__module__)
+    update, context = FakeUpdate(), FakeContext(USER_DATA.get(report_type))
+    context.user_data['report_type'] = report_type
+    started = time.perf_counter()
+    try:
+        await processor(update, context, source)
+    finally:
+        seconds = time.perf_counter() - started
+        shutdown_pool(wait=True)
+    errors = [text for text in update.texts if text.startswith("❌")]
+    error = errors[0] if errors else (None if update.outbox else "обработчик ничего не ответил")
+    return CaseResult(report_type, fmt, rows, seconds, _peak_mb(resource.RUSAGE_SELF),
+                      _peak_mb(resource.RUSAGE_CHILDREN), len(update.outbox), error)
+
+
+def run_case(report_type: str, fmt: str, source: str, rows: int) -> CaseResult:
+    """выполняется в отдельном процессе"""
+    logging.disable(logging.WARNING)
+    return asyncio.run(_run_case(report_type, fmt, source, rows))
+
+
+def build_snapshot(xlsx_path: str) -> str:
+    """выполняется в отдельном процессе: снимок книги тем же путём, что и в боте"""
+    from handlers.workers import snapshot_workbook, shutdown_pool
+
+    async def build():
+        try:
+            return await snapshot_workbook(xlsx_path)
+        finally:
+            shutdown_pool(wait=True)
+    return asyncio.run(build())
+
+
+def in_child(func, *args):
+    with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context("spawn")) as pool:
+        return pool.submit(func, *args).result()
+
+
+def fixture(report_type: str, fmt: str, rows: int, sheets: int, seed: int, directory: str) -> str:
+    """книга (или снимок) для прогона; уже собранные берутся из directory"""
+    path = os.path.join(directory, f"{report_type}_{rows}x{sheets}_{seed}.xlsx")
+    if not os.path.exists(path):
+        write_workbook(path + ".tmp", report_type, rows, seed=seed, sheets=sheets)
+        os.replace(path + ".tmp", path)
+    if fmt == "snapshot":
+        source = in_child(build_snapshot, path)
+        if source == path:
+            raise RuntimeError(f"не удалось собрать снимок {path}")
+        return source
+    return path
+
+
+def check_budget(result: CaseResult, time_scale: float = 1.0) -> list:
+    """нарушения бюджета; пустой список — в норме"""
+    budget = BUDGETS.get(result.report_type)
+    problems = []
+    if result.error:
+        problems.append(f"ошибка: {result.error[:200]}")
+    if budget is None:
+        return problems
+    scale = result.rows / 100_000
+    limit_seconds = (BASE_SECONDS + budget.seconds(result.fmt) * scale) * time_scale
+    if result.seconds > limit_seconds:
+        problems.append(f"время {result.seconds:.1f} с > {limit_seconds:.1f}")
+    limit_mb = BASE_MB + budget.mb * scale
+    if result.peak_mb > limit_mb:
+        problems.append(f"память {result.peak_mb:.0f} МБ > {limit_mb:.0f}")
+    return problems
+
+
+def format_result(result: CaseResult, problems: list) -> str:
+    line = (f"{result.report_type:16} {result.fmt:8} {result.rows:>8} строк  {result.seconds:7.2f} с "
+            f"({result.seconds_per_100k:6.1f} с/100k)  бот {result.bot_mb:4.0f} МБ  пул {result.pool_mb:4.0f} МБ  "
+            f"ответов {result.replies}")
+    return line + ("  ❌ " + "; ".join(problems) if problems else "  ok")
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="офлайн-бенчмарк process_*_file с бюджетами времени и памяти")
+    parser.add_argument("--types", default=",".join(GENERATORS), help="типы отчётов через запятую")
+    parser.add_argument("--formats", default=",".join(FORMATS), help="xlsx, snapshot")
+    parser.add_argument("--rows", type=int, default=100_000, help="строк данных на лист")
+    parser.add_argument("--sheets", type=int, default=1)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--repeat", type=int, default=1, help="прогонов на случай; берётся лучшее время")
+    parser.add_argument("--time-scale", type=float, default=float(os.getenv("BENCH_TIME_SCALE", "1")),
+                        help="множитель бюджетов времени для медленных машин")
+    parser.add_argument("--fixtures", default=None, help="каталог для книг и снимков (по умолчанию временный)")
+    parser.add_argument("--json", default=None, help="куда записать результаты")
+    args = parser.parse_args(argv)
+    args.types = [t.strip() for t in args.types.split(",") if t.strip()]
+    args.formats = [f.strip() for f in args.formats.split(",") if f.strip()]
+    unknown = (set(args.types) - set(GENERATORS)) | (set(args.formats) - set(FORMATS))
+    if unknown:
+        parser.error(f"неизвестные типы или форматы: {', '.join(sorted(unknown))}")
+    return args
+
+
+def run(args) -> tuple:
+    """(результаты, есть ли нарушения); печатает строку на каждый случай по мере готовности"""
+    failed = False
+    results = []
+    for report_type in args.types:
+        for fmt in args.formats:
+            source = fixture(report_type, fmt, args.rows, args.sheets, args.seed, args.fixtures)
+            runs = [in_child(run_case, report_type, fmt, source, args.rows * args.sheets)
+                    for _ in range(args.repeat)]
+            best = min(runs, key=lambda r: r.seconds)
+            best.bot_mb = max(r.bot_mb for r in runs)
+            best.pool_mb = max(r.pool_mb for r in runs)
+            problems = check_budget(best, args.time_scale)
+            failed = failed or bool(problems)
+            results.append(best)
+            print(format_result(best, problems), flush=True)
+    return results, failed
+
+
+def main(argv=None) -> None:
+    args = parse_args(argv)
+    with tempfile.TemporaryDirectory(prefix="bench_") as tmp:
+        args.fixtures = args.fixtures or tmp
+        os.makedirs(args.fixtures, exist_ok=True)
+        # дочерние процессы читают окружение при импорте handlers: снимки — рядом с книгами,
+        # правила порогов — по умолчанию, а не из rules.json рабочего каталога
+        os.environ["SNAPSHOT_DIR"] = os.path.join(args.fixtures, "snapshots")
+        os.environ["RULES_PATH"] = os.path.join(tmp, "rules.json")
+        os.environ.setdefault("PROFILE_SAMPLE_PERCENT", "0")
+        results, failed = run(args)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump([dict(asdict(r), seconds_per_100k=r.seconds_per_100k) for r in results], f,
+                      ensure_ascii=False, indent=2)
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
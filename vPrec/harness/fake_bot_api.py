@@ -0,0 +1,201 @@
+"""Локальный фейковый Bot API: отдаёт файлы через getFile и записывает исходящие сообщения бота"""
+import json
+import time
+import asyncio
+import logging
+import itertools
+from dataclasses import dataclass
+from email.parser import BytesParser
+from urllib.parse import parse_qsl, unquote
+
+logger = logging.getLogger(__name__)
+
+BOT_USER = {"id": 100000, "is_bot": True, "first_name": "vPrec", "username": "vprec_bot"}
+
+
+@dataclass
+class SentMessage:
+    ts: float
+    method: str
+    chat_id: int
+    text: str
+
+
+class FakeBotAPI:
+    """минимальный HTTP-сервер с методами Bot API, которые вызывает бот.
+
+    delay — искусственная задержка ответа (имитация сети до api.telegram.org).
+    """
+
+    def __init__(self, token: str = "100000:HARNESS", delay: float = 0.0):
+        self.token = token
+        self.delay = delay
+        self.files = {}  # file_id -> (file_path, bytes)
+        self._paths = {}  # file_path -> bytes
+        self.sent = []
+        self.last_text = {}  # chat_id -> последний текст бота
+        self.calls = {}
+        self.port = None
+        self._ids = itertools.count(1)
+        self._waiters = {}  # chat_id -> [(prefixes, future)]
+        self._server = None
+
+    # --- адреса для Application.builder() ---
+
+    @property
+    def base_url(self) -> str:
+        return f"http://127.0.0.1:{self.port}/bot"
+
+    @property
+    def base_file_url(self) -> str:
+        return f"http://127.0.0.1:{self.port}/file/bot"
+
+    def add_file(self, data: bytes, name: str = "report.xlsx") -> str:
+        file_id = f"file{next(self._ids)}"
+        file_path = f"documents/{file_id}_{name}"
+        self.files[file_id] = (file_path, data)
+        self._paths[file_path] = data
+        return file_id
+
+    def expect(self, chat_id: int, prefixes: tuple) -> asyncio.Future:
+        """future, которое завершится, когда бот пришлёт в чат текст с одним из префиксов"""
+        fut = asyncio.get_running_loop().create_future()
+        self._waiters.setdefault(chat_id, []).append((prefixes, fut))
+        return fut
+
+    async def start(self, host: str = "127.0.0.1", port: int = 0) -> None:
+        self._server = await asyncio.start_server(self._serve_connection, host, port)
+        self.port = self._server.sockets[0].getsockname()[1]
+
+    async def stop(self) -> None:
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+
+    # --- http ---
+
+    async def _read_body(self, reader, headers: dict) -> bytes:
+        if headers.get("transfer-encoding", "").lower() == "chunked":
+            body = b""
+            while True:
+                size = int((await reader.readline()).strip().split(b";")[0], 16)
+                if size == 0:
+                    await reader.readline()
+                    return body
+                body += await reader.readexactly(size)
+                await reader.readline()
+        length = int(headers.get("content-length") or 0)
+        return await reader.readexactly(length) if length else b""
+
+    async def _serve_connection(self, reader, writer) -> None:
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                method, path, _ = request_line.decode("latin-1").split(" ", 2)
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b"\r\n", b"\n", b""):
+                        break
+                    name, _, value = line.decode("latin-1").partition(":")
+                    headers[name.strip().lower()] = value.strip()
+                body = await self._read_body(reader, headers)
+
+                if self.delay:
+                    await asyncio.sleep(self.delay)
+                status, content_type, payload = self._route(path, headers, body)
+                writer.write(
+                    f"HTTP/1.1 {status} OK\r\nContent-Type: {content_type}\r\n"
+                    f"Content-Length: {len(payload)}\r\nConnection: keep-alive\r\n\r\n".encode() + payload
+                )
+                await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionError, ValueError):
+            pass
+        finally:
+            writer.close()
+
+    @staticmethod
+    def _params(headers: dict, body: bytes) -> dict:
+        content_type = headers.get("content-type", "")
+        if content_type.startswith("application/json"):
+            return json.loads(body or b"{}")
+        if content_type.startswith("multipart/form-data"):
+            msg = BytesParser().parsebytes(f"Content-Type: {content_type}\r\n\r\n".encode() + body)
+            params = {}
+            for part in msg.get_payload():
+                name = part.get_param("name", header="content-disposition")
+                if part.get_filename() is None:
+                    params[name] = part.get_payload(decode=True).decode()
+                else:
+                    params[name] = part.get_filename()
+            return params
+        return dict(parse_qsl(body.decode()))
+
+    def _route(self, path: str, headers: dict, body: bytes) -> tuple:
+        path = unquote(path)
+        file_prefix = f"/file/bot{self.token}/"
+        if path.startswith(file_prefix):
+            file_path = path[len(file_prefix):]
+            data = self._paths.get(file_path)
+            if data is None:
+                return 404, "text/plain", b""
+            return 200, "application/octet-stream", data
+
+        api_prefix = f"/bot{self.token}/"
+        if not path.startswith(api_prefix):
+            return 404, "application/json", b'{"ok": false, "error_code": 404, "description": "Not Found"}'
+        api_method = path[len(api_prefix):]
+        params = self._params(headers, body)
+        self.calls[api_method] = self.calls.get(api_method, 0) + 1
+        ok, result = self._call(api_method, params)
+        if not ok:
+            return 400, "application/json", json.dumps({"ok": False, "error_code": 400, "description": result}).encode()
+        return 200, "application/json", json.dumps({"ok": True, "result": result}).encode()
+
+    def _message(self, chat_id: int, text: str = None, **extra) -> dict:
+        msg = {"message_id": next(self._ids), "date": int(time.time()), "from": BOT_USER,
+               "chat": {"id": chat_id, "type": "private"}}
+        if text is not None:
+            msg["text"] = text
+        msg.update(extra)
+        return msg
+
+    def _record(self, method: str, chat_id: int, text: str) -> None:
+        self.sent.append(SentMessage(time.perf_counter(), method, chat_id, text))
+        self.last_text[chat_id] = text
+        waiters = self._waiters.get(chat_id)
+        if not waiters:
+            return
+        for item in list(waiters):
+            prefixes, fut = item
+            if text.startswith(prefixes) and not fut.done():
+                fut.set_result(time.perf_counter())
+                waiters.remove(item)
+
+    def _call(self, method: str, params: dict) -> tuple:
+        if method == "getMe":
+            return True, BOT_USER
+        if method == "getFile":
+            entry = self.files.get(params.get("file_id"))
+            if entry is None:
+                return False, "Bad Request: invalid file_id"
+            file_path, data = entry
+            return True, {"file_id": params["file_id"], "file_unique_id": params["file_id"],
+                          "file_size": len(data), "file_path": file_path}
+        if method in ("sendMessage", "editMessageText"):
+            chat_id = int(params.get("chat_id") or 0)
+            text = params.get("text", "")
+            self._record(method, chat_id, text)
+            if method == "editMessageText" and params.get("inline_message_id"):
+                return True, True
+            return True, self._message(chat_id, text)
+        if method == "sendDocument":
+            chat_id = int(params.get("chat_id") or 0)
+            self._record(method, chat_id, params.get("caption", ""))
+            document = {"file_id": f"sent{next(self._ids)}", "file_unique_id": "sent",
+                        "file_name": str(params.get("document", "file"))}
+            return True, self._message(chat_id, document=document)
+        # answerCallbackQuery, sendChatAction, setWebhook, answerInlineQuery и прочее
+        return True, True
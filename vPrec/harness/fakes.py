@@ -0,0 +1,77 @@
+"""Фейковые Update и Context: обработчики вызываются напрямую, без Telegram и сети.
+
+Ответы бота не уходят никуда, а складываются в общий список outbox —
+по нему стенд проверяет, что отчёт собран, а не упал с ошибкой.
+"""
+import itertools
+from dataclasses import dataclass, field
+from types import SimpleNamespace
+
+_ids = itertools.count(1)
+
+
+@dataclass
+class Reply:
+    method: str  # reply_text, edit_text, reply_document
+    text: str
+    kwargs: dict = field(default_factory=dict)
+
+
+class FakeMessage:
+    def __init__(self, chat_id: int, outbox: list, text: str = None, document=None, caption: str = None):
+        self.message_id = next(_ids)
+        self.chat_id = chat_id
+        self.chat = SimpleNamespace(id=chat_id, type="private")
+        self.text = text
+        self.document = document
+        self.caption = caption
+        self.reply_to_message = None
+        self.outbox = outbox
+
+    def _reply(self, method: str, text: str, kwargs: dict) -> "FakeMessage":
+        self.outbox.append(Reply(method, text, kwargs))
+        return FakeMessage(self.chat_id, self.outbox, text=text)
+
+    async def reply_text(self, text: str, **kwargs) -> "FakeMessage":
+        return self._reply("reply_text", text, kwargs)
+
+    async def edit_text(self, text: str, **kwargs) -> "FakeMessage":
+        self.text = text
+        return self._reply("edit_text", text, kwargs)
+
+    async def reply_document(self, document, **kwargs) -> "FakeMessage":
+        # содержимое читаем, как это сделал бы PTB при отправке
+        size = len(document.read()) if hasattr(document, "read") else 0
+        return self._reply("reply_document", kwargs.get("caption") or "", dict(kwargs, size=size))
+
+
+class FakeUpdate:
+    """апдейт с сообщением пользователя user_id в личном чате"""
+
+    def __init__(self, user_id: int = 1, text: str = None, outbox: list = None):
+        self.outbox = [] if outbox is None else outbox
+        self.update_id = next(_ids)
+        self.effective_user = SimpleNamespace(id=user_id, is_bot=False, first_name=f"User{user_id}")
+        self.effective_chat = SimpleNamespace(id=user_id, type="private")
+        self.message = FakeMessage(user_id, self.outbox, text=text)
+        self.callback_query = None
+        self.inline_query = None
+
+    @property
+    def texts(self) -> list:
+        return [r.text for r in self.outbox]
+
+
+class FakeContext:
+    def __init__(self, user_data: dict = None, args: list = None):
+        self.user_data = dict(user_data or {})
+        self.chat_data = {}
+        self.bot_data = {}
+        self.args = list(args or [])
+        self.application = SimpleNamespace(bot_data=self.bot_data)
+        self.bot = SimpleNamespace(send_message=self._send_message)
+        self.sent = []
+
+    async def _send_message(self, chat_id: int, text: str, **kwargs) -> FakeMessage:
+        self.sent.append(Reply("send_message", text, kwargs))
+        return FakeMessage(chat_id, self.sent, text=text)
@@ -0,0 +1,87 @@
+"""Локальный OpenAI-совместимый LLM-сервер для тестов маршрутизатора llm_backends.
+
+Отвечает на POST /v1/chat/completions и GET /v1/models; задержку, код ответа и
+текст можно менять на ходу, чтобы имитировать медленный, сбоящий или зависший бэкенд.
+"""
+import json
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+
+class StubLLMServer:
+    """delay — задержка ответа, status — код ответа chat/completions,
+    api_key — если задан, без заголовка Authorization: Bearer <api_key> будет 401"""
+
+    def __init__(self, reply: str = "ok", delay: float = 0.0, status: int = 200, api_key: str = None):
+        self.reply = reply
+        self.delay = delay
+        self.status = status
+        self.api_key = api_key
+        self.prompts = []
+        self.calls = 0
+        self._lock = threading.Lock()
+        self._stopping = threading.Event()
+        self._server = None
+        self._thread = None
+
+    @property
+    def endpoint(self) -> str:
+        return f"http://127.0.0.1:{self._server.server_address[1]}/v1/chat/completions"
+
+    def start(self) -> "StubLLMServer":
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def _send(self, status: int, payload: dict = None) -> None:
+                body = json.dumps(payload or {}).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def _authorized(self) -> bool:
+                return not stub.api_key or self.headers.get("Authorization") == f"Bearer {stub.api_key}"
+
+            def do_GET(self):
+                if self.path != "/v1/models":
+                    return self._send(404)
+                if not self._authorized():
+                    return self._send(401, {"message": "unauthorized"})
+                self._send(200, {"data": [{"id": "stub"}]})
+
+            def do_POST(self):
+                if self.path != "/v1/chat/completions":
+                    return self._send(404)
+                data = json.loads(self.rfile.read(int(self.headers.get("Content-Length") or 0)) or b"{}")
+                with stub._lock:
+                    stub.calls += 1
+                    stub.prompts.append(data.get("messages", [{}])[-1].get("content"))
+                if not self._authorized():
+                    return self._send(401, {"message": "unauthorized"})
+                # остановка сервера прерывает ожидание, чтобы тесты не висели на зависшем запросе
+                if stub.delay and stub._stopping.wait(stub.delay):
+                    return
+                if stub.status != 200:
+                    return self._send(stub.status, {"message": "stub error"})
+                self._send(200, {"choices": [{"index": 0, "message": {"role": "assistant", "content": stub.reply}}]})
+
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self._server.daemon_threads = True
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._stopping.set()
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self) -> "StubLLMServer":
+        return self.start()
+
+    def __exit__(self, *exc) -> None:
+        self.stop()
@@ -0,0 +1,237 @@
+"""Нагрузочный прогон: синтетические пользователи проходят настоящий ConversationHandler
+(/start -> кнопка отчёта -> загрузка книги) против локального фейкового Bot API.
+
+запуск из каталога vPrec:
+    python -m harness.loadtest --users 1000 --concurrency 50 --rows 2000
+    python -m harness.loadtest --users 200 --types attendance,schedule --webhook
+"""
+import os
+import time
+import asyncio
+import logging
+import argparse
+import resource
+import multiprocessing
+from dataclasses import dataclass
+import httpx
+from telegram import Update
+from main import build_application
+from handlers.workers import shutdown_pool
+from handlers.webhook_ingress import WebhookIngress
+from .fake_bot_api import FakeBotAPI
+from .workbooks import GENERATORS, workbook_bytes
+from .updates import command_update, callback_update, document_update
+
+logger = logging.getLogger(__name__)
+
+# кнопки, которые пользователь нажимает перед загрузкой файла
+FLOWS = {
+    'homework_check': ('homework_check', 'hw_check_month'),
+}
+DONE_PREFIX = "✅ Готово"
+FINAL_PREFIXES = (DONE_PREFIX, "❌")  # любой отказ или ошибка завершает сценарий
+
+
+@dataclass
+class FlowResult:
+    report_type: str
+    ok: bool
+    total: float  # весь сценарий, секунды
+    document: float  # от загрузки файла до «Готово»
+
+
+def percentile(values: list, q: float) -> float:
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+
+def rss_bytes(pid: int = None) -> int:
+    """RSS процесса по /proc; без /proc — пик RSS текущего процесса"""
+    try:
+        with open(f"/proc/{pid or os.getpid()}/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        if pid is None:
+            return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+        return 0
+
+
+class MemorySampler:
+    """RSS бота и процессов пула через равные интервалы"""
+
+    def __init__(self, interval: float = 1.0):
+        self.interval = interval
+        self.samples = []  # (секунды от старта, rss бота, rss пула)
+        self._task = None
+
+    def sample(self, started: float) -> None:
+        children = sum(rss_bytes(p.pid) for p in multiprocessing.active_children())
+        self.samples.append((time.perf_counter() - started, rss_bytes(), children))
+
+    async def _run(self, started: float) -> None:
+        while True:
+            self.sample(started)
+            await asyncio.sleep(self.interval)
+
+    def start(self, started: float) -> None:
+        self._task = asyncio.create_task(self._run(started))
+
+    async def stop(self, started: float) -> None:
+        self._task.cancel()
+        await asyncio.gather(self._task, return_exceptions=True)
+        self.sample(started)
+
+
+class LoadTest:
+    def __init__(self, args):
+        self.args = args
+        self.api = FakeBotAPI(delay=args.api_delay)
+        self.application = None
+        self.ingress = None
+        self.client = None
+        self.files = {}  # (тип, вариант) -> (file_id, имя, размер)
+
+    async def setup(self) -> None:
+        await self.api.start()
+        self.application = build_application(self.api.token, self.api.base_url, self.api.base_file_url)
+        await self.application.initialize()
+        # файлы обрабатываются фоновыми задачами приложения — ему нужно быть запущенным
+        await self.application.start()
+        for report_type in self.args.types:
+            for variant in range(self.args.variants):
+                data = workbook_bytes(report_type, self.args.rows, seed=variant, sheets=self.args.sheets)
+                name = f"{report_type}_{variant}.xlsx"
+                self.files[report_type, variant] = (self.api.add_file(data, name), name, len(data))
+        if self.args.webhook:
+            self.ingress = WebhookIngress(self.application, "hook", secret_token=None,
+                                          workers=self.args.concurrency)
+            await self.ingress.start("127.0.0.1", 0)
+            self.client = httpx.AsyncClient(base_url=f"http://127.0.0.1:{self.ingress.port}",
+                                            limits=httpx.Limits(max_connections=self.args.concurrency))
+
+    async def teardown(self) -> None:
+        if self.ingress is not None:
+            await self.client.aclose()
+            await self.ingress.stop()
+        await self.application.stop()
+        await self.application.shutdown()
+        await self.api.stop()
+        shutdown_pool()
+
+    async def _send(self, data: dict) -> None:
+        if self.client is not None:
+            resp = await self.client.post("/hook", json=data)
+            resp.raise_for_status()
+        else:
+            await self.application.process_update(Update.de_json(data, self.application.bot))
+
+    async def run_user(self, user_id: int) -> FlowResult:
+        report_type = self.args.types[user_id % len(self.args.types)]
+        file_id, name, size = self.files[report_type, user_id % self.args.variants]
+        started = time.perf_counter()
+
+        await self._send(command_update(user_id, "start"))
+        for data in FLOWS.get(report_type, (report_type,)):
+            await self._send(callback_update(user_id, data))
+
+        done = self.api.expect(user_id, FINAL_PREFIXES)
+        uploaded = time.perf_counter()
+        await self._send(document_update(user_id, file_id, name, size))
+        try:
+            finished = await asyncio.wait_for(done, self.args.timeout)
+        except asyncio.TimeoutError:
+            finished = time.perf_counter()
+        ok = self.api.last_text.get(user_id, "").startswith(DONE_PREFIX)
+        return FlowResult(report_type, ok, finished - started, finished - uploaded)
+
+    async def run(self) -> tuple:
+        semaphore = asyncio.Semaphore(self.args.concurrency)
+
+        async def one(user_id: int) -> FlowResult:
+            async with semaphore:
+                try:
+                    return await self.run_user(user_id)
+                except Exception:
+                    logger.exception("пользователь %s: сценарий упал", user_id)
+                    return FlowResult("?", False, 0.0, 0.0)
+
+        sampler = MemorySampler(self.args.memory_interval)
+        started = time.perf_counter()
+        sampler.start(started)
+        results = await asyncio.gather(*(one(1_000_000 + i) for i in range(self.args.users)))
+        wall = time.perf_counter() - started
+        await sampler.stop(started)
+        return results, wall, sampler.samples
+
+
+def format_report(results: list, wall: float, samples: list, api: FakeBotAPI, ingress=None) -> str:
+    mb = lambda b: b / 1024 / 1024
+    ok = [r for r in results if r.ok]
+    lines = [
+        f"пользователей: {len(results)}, успешно: {len(ok)}, ошибок: {len(results) - len(ok)}",
+        f"время: {wall:.2f} с, пропускная способность: {len(results) / wall:.1f} сценариев/с",
+    ]
+    for title, values in (("сценарий целиком", [r.total for r in results]),
+                          ("загрузка -> «Готово»", [r.document for r in results])):
+        lines.append(f"{title}: p50 {percentile(values, 0.5) * 1000:.0f} мс, "
+                     f"p95 {percentile(values, 0.95) * 1000:.0f} мс, p99 {percentile(values, 0.99) * 1000:.0f} мс")
+    by_type = {}
+    for r in results:
+        by_type.setdefault(r.report_type, []).append(r.document)
+    for report_type, values in sorted(by_type.items()):
+        lines.append(f"  {report_type}: n={len(values)}, p50 {percentile(values, 0.5) * 1000:.0f} мс, "
+                     f"p95 {percentile(values, 0.95) * 1000:.0f} мс")
+    lines.append("вызовы Bot API: " + ", ".join(f"{m}={n}" for m, n in sorted(api.calls.items())))
+    if ingress is not None:
+        m = ingress.metrics
+        lines.append(f"вебхук: принято {m.received}, повторов {m.duplicates}, отброшено {m.dropped}, ошибок {m.failed}")
+    if samples:
+        peak_bot = max(s[1] for s in samples)
+        peak_total = max(s[1] + s[2] for s in samples)
+        lines.append(f"память: пик бота {mb(peak_bot):.0f} МБ, пик бота с пулом {mb(peak_total):.0f} МБ")
+        step = max(1, len(samples) // 10)
+        lines.extend(f"  t={t:6.1f} с: бот {mb(own):.0f} МБ, пул {mb(pool):.0f} МБ" for t, own, pool in samples[::step])
+    return "\n".join(lines)
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="нагрузочный прогон бота против фейкового Bot API")
+    parser.add_argument("--users", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--rows", type=int, default=1000, help="строк данных на лист")
+    parser.add_argument("--sheets", type=int, default=1)
+    parser.add_argument("--variants", type=int, default=3, help="разных книг на тип отчёта")
+    parser.add_argument("--types", default=",".join(GENERATORS), help="типы отчётов через запятую")
+    parser.add_argument("--api-delay", type=float, default=0.0, help="задержка ответа Bot API, с")
+    parser.add_argument("--timeout", type=float, default=300.0, help="таймаут сценария, с")
+    parser.add_argument("--memory-interval", type=float, default=1.0)
+    parser.add_argument("--webhook", action="store_true", help="апдейты через WebhookIngress по HTTP")
+    args = parser.parse_args(argv)
+    args.types = [t.strip() for t in args.types.split(",") if t.strip()]
+    unknown = set(args.types) - set(GENERATORS)
+    if unknown:
+        parser.error(f"неизвестные типы: {', '.join(sorted(unknown))}")
+    return args
+
+
+async def main_async(args) -> str:
+    test = LoadTest(args)
+    await test.setup()
+    try:
+        results, wall, samples = await test.run()
+        return format_report(results, wall, samples, test.api, test.ingress)
+    finally:
+        await test.teardown()
+
+
+def main(argv=None) -> None:
+    args = parse_args(argv)
+    for name in ("httpx", "telegram", "handlers", "__main__", "main"):
+        logging.getLogger(name).setLevel(logging.WARNING)
+    print(asyncio.run(main_async(args)))
+
+
+if __name__ == "__main__":
+    main()
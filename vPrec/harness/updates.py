@@ -0,0 +1,43 @@
+"""Сырые апдейты Telegram (dict) от синтетических пользователей"""
+import time
+import itertools
+
+_update_ids = itertools.count(1)
+
+
+def _user(user_id: int) -> dict:
+    return {"id": user_id, "is_bot": False, "first_name": f"User{user_id}"}
+
+
+def _chat(user_id: int) -> dict:
+    return {"id": user_id, "type": "private"}
+
+
+def _message(user_id: int, **fields) -> dict:
+    msg = {"message_id": next(_update_ids), "date": int(time.time()), "from": _user(user_id), "chat": _chat(user_id)}
+    msg.update(fields)
+    return msg
+
+
+def command_update(user_id: int, command: str, args: str = "") -> dict:
+    text = f"/{command}" + (f" {args}" if args else "")
+    entities = [{"type": "bot_command", "offset": 0, "length": len(command) + 1}]
+    return {"update_id": next(_update_ids), "message": _message(user_id, text=text, entities=entities)}
+
+
+def text_update(user_id: int, text: str) -> dict:
+    return {"update_id": next(_update_ids), "message": _message(user_id, text=text)}
+
+
+def callback_update(user_id: int, data: str) -> dict:
+    menu = _message(user_id, text="меню")
+    menu["from"] = {"id": 100000, "is_bot": True, "first_name": "vPrec"}
+    query = {"id": str(next(_update_ids)), "from": _user(user_id), "chat_instance": str(user_id),
+             "data": data, "message": menu}
+    return {"update_id": next(_update_ids), "callback_query": query}
+
+
+def document_update(user_id: int, file_id: str, file_name: str, file_size: int) -> dict:
+    document = {"file_id": file_id, "file_unique_id": file_id, "file_name": file_name, "file_size": file_size,
+                "mime_type": "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"}
+    return {"update_id": next(_update_ids), "message": _message(user_id, document=document)}
@@ -0,0 +1,99 @@
+"""Генераторы синтетических книг для каждого типа отчёта"""
+import io
+import numpy as np
+from handlers.excel_stream import write_sheets
+
+DAYS = ("Пн", "Вт", "Ср", "Чт", "Пт", "Сб")
+DISCIPLINES = ("Математика", "Физика", "Информатика", "История", "Английский язык", "Химия")
+
+
+def attendance_rows(n: int, rng) -> list:
+    rows = [("ФИО преподавателя", "Средняя посещаемость")]
+    for i, value in enumerate(rng.uniform(0, 100, n)):
+        # неразрывный пробел и запятая — как в реальных выгрузках
+        rows.append((f"Иванов\xa0{i} И.И.", f"{value:.1f}%".replace(".", ",")))
+    return rows
+
+
+def homework_check_rows(n: int, rng) -> list:
+    rows = [("ФИО преподавателя", "Домашние задания", None), (None, "Получено", "Проверено")]
+    issued = rng.integers(1, 50, n)
+    for i, iss in enumerate(issued):
+        rows.append((f"Петров {i} П.П.", int(iss), int(rng.integers(0, iss + 1))))
+    return rows
+
+
+def homework_submit_rows(n: int, rng) -> list:
+    rows = [("FIO", "Группа", "Percentage Homework")]
+    for i, value in enumerate(rng.uniform(0, 1, n)):
+        rows.append((f"Студент {i}", f"ГР-{i % 40}", float(round(value, 3))))
+    return rows
+
+
+def students_rows(n: int, rng) -> list:
+    rows = [("FIO", "Homework", "Classroom", "Группа")]
+    homework = rng.integers(1, 6, n)
+    classroom = rng.integers(1, 6, n)
+    for i in range(n):
+        rows.append((f" Студент {i} ", int(homework[i]), int(classroom[i]), f"ГР-{i % 40}"))
+    return rows
+
+
+def lessons_rows(n: int, rng) -> list:
+    rows = [("Дата", "Группа", "Тема урока")]
+    broken = ("Урок {i} Тема - Алгебра", "Тема: Алгебра", "Урок № {i}", "", "Урок № {i}. Тема:")
+    kinds = rng.integers(0, 10, n)
+    for i in range(n):
+        # примерно каждая пятая тема записана с ошибкой
+        topic = f"Урок № {i}. Тема: Алгебра" if kinds[i] > 1 else broken[i % len(broken)].format(i=i)
+        rows.append((f"2024-09-{i % 28 + 1:02d}", f"ГР-{i % 40}", topic))
+    return rows
+
+
+def schedule_rows(n: int, rng) -> list:
+    """n — число строк (группа x пара); по 4 пары на группу"""
+    header = ["Группа", "Пара", "Время"]
+    for day in DAYS:
+        header.extend((day, None))
+    rows = [tuple(header)]
+    for i in range(n):
+        group, slot = divmod(i, 4)
+        row = [f"ГР-{group}", slot + 1, f"{9 + 2 * slot}:00"]
+        for d in range(len(DAYS)):
+            if rng.random() < 0.15:
+                row.extend((None, None))
+                continue
+            disc = DISCIPLINES[int(rng.integers(0, len(DISCIPLINES)))]
+            teacher = int(rng.integers(0, max(2, n // 8)))
+            room = 100 + int(rng.integers(0, max(2, n // 6)))
+            row.extend((f"Предмет: {disc}\nПреподаватель: Сидоров {teacher}\nАудитория: {room}", None))
+        rows.append(tuple(row))
+    return rows
+
+
+GENERATORS = {
+    'attendance': attendance_rows,
+    'homework_check': homework_check_rows,
+    'homework_submit': homework_submit_rows,
+    'students': students_rows,
+    'lessons': lessons_rows,
+    'schedule': schedule_rows,
+}
+
+
+def workbook_sheets(report_type: str, rows: int, seed: int = 0, sheets: int = 1) -> list:
+    rng = np.random.default_rng(seed)
+    make = GENERATORS[report_type]
+    return [(f"Лист{i + 1}", make(rows, rng)) for i in range(sheets)]
+
+
+def workbook_bytes(report_type: str, rows: int, seed: int = 0, sheets: int = 1) -> bytes:
+    """xlsx-книга отчёта report_type с rows строками данных на каждом листе"""
+    buf = io.BytesIO()
+    write_sheets(buf, workbook_sheets(report_type, rows, seed, sheets))
+    return buf.getvalue()
+
+
+def write_workbook(path: str, report_type: str, rows: int, seed: int = 0, sheets: int = 1) -> str:
+    write_sheets(path, workbook_sheets(report_type, rows, seed, sheets))
+    return path
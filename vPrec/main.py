@@ -1,5 +1,6 @@
 import os
 import sys
+import asyncio
 import logging
 import tempfile
 from dotenv import load_dotenv
@@ -7,10 +8,11 @@ from dotenv import load_dotenv
 # загрузить переменные окружения из .env
 load_dotenv()
 
-from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
+from telegram import Update
 from telegram.ext import (
     Application,
     CommandHandler,
+    InlineQueryHandler,
     CallbackQueryHandler,
     ConversationHandler,
     MessageHandler,
@@ -19,14 +21,16 @@ from telegram.ext import (
 )
 
 from handlers import (
-    schedule_handler,
-    lessons_handler,
-    students_handler,
-    attendance_handler,
-    homework_check_handler,
-    homework_submit_handler,
     ai_handler,
+    registry,
+    rules,
+    entity_index,
+    profiling,
+    admission,
+    progress,
 )
+from handlers.webhook_ingress import serve_webhook
+from handlers.workers import run_in_pool, shutdown_pool, snapshot_workbook
 
 # настройка логирования
 logging.basicConfig(
@@ -34,70 +38,21 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-# состояния разговора (строковые — удобно и читаемо)
-SCHEDULE = "schedule"
-LESSONS = "lessons"
-STUDENTS = "students"
-ATTENDANCE = "attendance"
-HOMEWORK_CHECK = "homework_check"
-HOMEWORK_SUBMIT = "homework_submit"
-AI = "ai"
-
-# главное меню
-def get_main_keyboard():
-    return InlineKeyboardMarkup(
-        [
-            [InlineKeyboardButton("📅 Отчет по расписанию", callback_data=SCHEDULE)],
-            [InlineKeyboardButton("📚 Отчет по темам занятий", callback_data=LESSONS)],
-            [InlineKeyboardButton("👥 Отчет по студентам", callback_data=STUDENTS)],
-            [InlineKeyboardButton("📊 Отчет по посещаемости", callback_data=ATTENDANCE)],
-            [InlineKeyboardButton("✅ Отчет по проверке ДЗ", callback_data=HOMEWORK_CHECK)],
-            [InlineKeyboardButton("📝 Отчет по сдаче ДЗ", callback_data=HOMEWORK_SUBMIT)],
-            [InlineKeyboardButton("🤖 AI-помощник", callback_data=AI)],
-            [InlineKeyboardButton("❓ Справка", callback_data="help")],
-            [InlineKeyboardButton("🔄 Начать заново", callback_data="restart")],
-        ]
-    )
+START_TEXT = "👋 Привет! Я бот для анализа учебных отчётов.\n\nВыберите нужный отчёт:"
 
 async def start(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """обработчик /start и кнопки 'Начать заново'"""
-    text = "👋 Привет! Я бот для анализа учебных отчётов.\n\nВыберите нужный отчёт:"
-    reply_markup = get_main_keyboard()
-
     if update.message:
-        await update.message.reply_text(text, reply_markup=reply_markup)
+        await update.message.reply_text(START_TEXT, reply_markup=registry.MAIN_KEYBOARD)
     else:
-        await update.callback_query.edit_message_text(text, reply_markup=reply_markup)
+        await update.callback_query.edit_message_text(START_TEXT, reply_markup=registry.MAIN_KEYBOARD)
 
 async def help_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """справка по боту"""
-    help_text = """
-*справка по боту*
-
-*Доступные отчёты:*
-
-📅 *Отчет по расписанию* — файл Расписание групп.xlsx
-📚 *Отчет по темам занятий* — файл Темы уроков.xls
-👥 *Отчет по студентам* — файл Отчет по студентам.xls
-📊 *Отчет по посещаемости* — файл Посещаемость по преподавателям.xlsx
-✅ *Отчет по проверке ДЗ* — файл Отчет по домашним заданиям.xlsx
-📝 *Отчет по сдаче ДЗ* — файл Отчет по студентам.xls
-
-*Как пользоваться:*
-1. Нажмите на нужный отчёт
-2. Загрузите соответствующий Excel-файл
-3. Получите результат
-
-Команды:
-/start — главное меню
-/help — эта справка
-/cancel — отменить текущую операцию
-"""
-
     if update.message:
-        await update.message.reply_text(help_text, parse_mode="Markdown")
+        await update.message.reply_text(registry.HELP_TEXT, parse_mode="Markdown")
     else:
-        await update.callback_query.edit_message_text(help_text, parse_mode="Markdown")
+        await update.callback_query.edit_message_text(registry.HELP_TEXT, parse_mode="Markdown")
 
 async def button_handler(update: Update, context: ContextTypes.DEFAULT_TYPE) -> str:
     """обработка всех inline-кнопок"""
@@ -106,43 +61,35 @@ async def button_handler(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
 
     choice = query.data
 
-    if choice == "help":
+    if choice == registry.HELP:
         await help_command(update, context)
         return ConversationHandler.END
 
-    if choice == "restart":
+    if choice == registry.RESTART:
         await start(update, context)
         return ConversationHandler.END
 
-    if choice in ("hw_check_month", "hw_check_week"):
-        context.user_data["report_type"] = HOMEWORK_CHECK
-        await homework_check_handler.handle_hw_check_period(update, context)
-        return HOMEWORK_CHECK
-
-    start_handlers = {
-        SCHEDULE: schedule_handler.start_schedule_report,
-        LESSONS: lessons_handler.start_lessons_report,
-        STUDENTS: students_handler.start_students_report,
-        ATTENDANCE: attendance_handler.start_attendance_report,
-        HOMEWORK_CHECK: homework_check_handler.start_homework_check_report,
-        HOMEWORK_SUBMIT: homework_submit_handler.start_homework_submit_report,
-        AI: ai_handler.start_ai_report,
-    }
-
-    handler_func = start_handlers.get(choice)
-    if handler_func:
-        context.user_data["report_type"] = choice
+    if choice in registry.CALLBACKS:
+        report_type, handler_func = registry.CALLBACKS[choice]
+        context.user_data["report_type"] = report_type
         await handler_func(update, context)
+        return report_type
+
+    report = registry.BY_KEY.get(choice)
+    if report:
+        context.user_data["report_type"] = choice
+        await report.start(update, context)
         return choice
 
     return ConversationHandler.END
 
+@profiling.profiled("file")
 async def file_handler(update: Update, context: ContextTypes.DEFAULT_TYPE) -> str:
     """единый обработчик всех загруженных файлов"""
     report_type = context.user_data.get("report_type")
 
     if not report_type:
-        await update.message.reply_text("❌ Сначала выберите отчёт из меню.", reply_markup=get_main_keyboard())
+        await update.message.reply_text("❌ Сначала выберите отчёт из меню.", reply_markup=registry.MAIN_KEYBOARD)
         return ConversationHandler.END
 
     document = update.message.document
@@ -150,7 +97,14 @@ async def file_handler(update: Update, context: ContextTypes.DEFAULT_TYPE) -> st
         await update.message.reply_text("❌ Пожалуйста, отправьте файл Excel (.xls или .xlsx).")
         return report_type
 
-    await update.message.reply_text("📥 Файл получен, обрабатываю...")
+    verdict = admission.check_document(document.file_size)
+    if verdict.verdict == admission.REJECT:
+        await update.message.reply_text(verdict.message)
+        return report_type
+
+    status = await update.message.reply_text("📥 Файл получен, обрабатываю...")
+    # один статус на задачу: этап, строки и оценка времени; /cancel останавливает на контрольной точке
+    job = await progress.start_job((update.effective_chat.id, update.effective_user.id), status)
 
     tmp_path = None
     try:
@@ -163,23 +117,38 @@ async def file_handler(update: Update, context: ContextTypes.DEFAULT_TYPE) -> st
         tmp = tempfile.NamedTemporaryFile(prefix="bot_", suffix=".xlsx", delete=False)
         tmp_path = tmp.name
         tmp.close()
-        await file_obj.download_to_drive(tmp_path)
+        progress.stage("download")
+        with profiling.stage("download"):
+            await file_obj.download_to_drive(tmp_path)
+
+        progress.stage("check")
+        # оценка по метаданным книги до разбора: огромные — отказ, большие — в очередь тяжёлых задач
+        verdict = await run_in_pool(admission.admit_workbook, tmp_path)
+        if verdict.verdict == admission.REJECT:
+            await update.message.reply_text(verdict.message)
+            return report_type
+        job.total_rows = verdict.rows
         context.user_data[processed_key] = True
 
-        processors = {
-            SCHEDULE: schedule_handler.process_schedule_file,
-            LESSONS: lessons_handler.process_lessons_file,
-            STUDENTS: students_handler.process_students_file,
-            ATTENDANCE: attendance_handler.process_attendance_file,
-            HOMEWORK_CHECK: homework_check_handler.process_homework_check_file,
-            HOMEWORK_SUBMIT: homework_submit_handler.process_homework_submit_file,
-        }
-
-        processor = processors.get(report_type)
+        processor = registry.PROCESSORS.get(report_type)
         if processor:
-            await processor(update, context, tmp_path)
+            async with admission.job_slot(verdict, update.message):
+                # Excel разбирается один раз: отчёты и повторные загрузки читают Arrow-снимок
+                progress.stage("parse")
+                with profiling.stage("snapshot"):
+                    source = await snapshot_workbook(tmp_path)
+                progress.stage("analyze")
+                with profiling.stage("process"):
+                    await processor(update, context, source)
+
+        await progress.end_job(job, "✅ Файл обработан.")
+        await update.message.reply_text("✅ Готово! Выберите следующий отчёт:", reply_markup=registry.MAIN_KEYBOARD)
+        context.user_data.clear()
+        return ConversationHandler.END
 
-        await update.message.reply_text("✅ Готово! Выберите следующий отчёт:", reply_markup=get_main_keyboard())
+    except progress.JobCancelled:
+        await progress.end_job(job, "⏹ Обработка отменена.")
+        await update.message.reply_text("⏹ Обработка отменена. Выберите отчёт:", reply_markup=registry.MAIN_KEYBOARD)
         context.user_data.clear()
         return ConversationHandler.END
 
@@ -189,6 +158,7 @@ async def file_handler(update: Update, context: ContextTypes.DEFAULT_TYPE) -> st
         return ConversationHandler.END
 
     finally:
+        await progress.end_job(job)
         if tmp_path and os.path.exists(tmp_path):
             try:
                 os.remove(tmp_path)
@@ -196,32 +166,32 @@ async def file_handler(update: Update, context: ContextTypes.DEFAULT_TYPE) -> st
                 pass
 
 async def cancel(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
-    """отмена текущей операции"""
-    await update.message.reply_text("❌ Операция отменена.", reply_markup=get_main_keyboard())
+    """отмена текущей операции; во время обработки файла — остановка задачи"""
+    if progress.cancel_job((update.effective_chat.id, update.effective_user.id)):
+        # ответ и выход из разговора — за file_handler, когда задача дойдёт до контрольной точки
+        await update.message.reply_text("⏹ Останавливаю обработку файла...")
+        return ConversationHandler.END
+    await update.message.reply_text("❌ Операция отменена.", reply_markup=registry.MAIN_KEYBOARD)
     context.user_data.clear()
     return ConversationHandler.END
 
-def main():
-    load_dotenv()
-    
-    token = os.getenv("TELEGRAM_BOT_TOKEN")
-    if not token:
-        logger.error("TELEGRAM_BOT_TOKEN environment variable is not set")
-        sys.exit(1)
-
-    application = Application.builder().token(token).build()
-    application.bot_data["main_keyboard"] = get_main_keyboard()
+def build_application(token: str, base_url: str = None, base_file_url: str = None) -> Application:
+    """приложение со всеми обработчиками; base_url/base_file_url — для локального Bot API (нагрузочный стенд)"""
+    builder = Application.builder().token(token)
+    if base_url:
+        builder = builder.base_url(base_url)
+    if base_file_url:
+        builder = builder.base_file_url(base_file_url)
+    application = builder.build()
+    application.bot_data["main_keyboard"] = registry.MAIN_KEYBOARD
 
     conv_handler = ConversationHandler(
         entry_points=[CommandHandler("start", start), CallbackQueryHandler(button_handler)],
         states={
-            SCHEDULE: [MessageHandler(filters.Document.ALL, file_handler)],
-            LESSONS: [MessageHandler(filters.Document.ALL, file_handler)],
-            STUDENTS: [MessageHandler(filters.Document.ALL, file_handler)],
-            ATTENDANCE: [MessageHandler(filters.Document.ALL, file_handler)],
-            HOMEWORK_CHECK: [MessageHandler(filters.Document.ALL, file_handler)],
-            HOMEWORK_SUBMIT: [MessageHandler(filters.Document.ALL, file_handler)],
-            AI: [
+            # файлы обрабатываются без блокировки, чтобы /cancel дошёл во время обработки (состояние WAITING)
+            **{key: [MessageHandler(filters.Document.ALL, file_handler, block=False)] for key in registry.PROCESSORS},
+            ConversationHandler.WAITING: [CommandHandler("cancel", cancel)],
+            registry.AI: [
                 MessageHandler(filters.TEXT & ~filters.COMMAND, ai_handler.process_ai_query),
                 MessageHandler(filters.Document.ALL, ai_handler.process_ai_file),
             ],
@@ -232,8 +202,24 @@ def main():
 
     application.add_handler(conv_handler)
     application.add_handler(CommandHandler("help", help_command))
+    application.add_handler(CommandHandler("rules", rules.rules_command))
+    application.add_handler(CommandHandler("teacher", entity_index.teacher_command))
+    application.add_handler(CommandHandler("student", entity_index.student_command))
+    application.add_handler(CommandHandler("profile", profiling.profile_command))
+    application.add_handler(InlineQueryHandler(entity_index.inline_query))
     application.add_handler(MessageHandler(filters.TEXT & filters.REPLY, ai_handler.process_ai_query))
     application.add_handler(MessageHandler(filters.Document.ALL & filters.REPLY, ai_handler.process_ai_file))
+    return application
+
+def main():
+    load_dotenv()
+    
+    token = os.getenv("TELEGRAM_BOT_TOKEN")
+    if not token:
+        logger.error("TELEGRAM_BOT_TOKEN environment variable is not set")
+        sys.exit(1)
+
+    application = build_application(token)
 
     webhook_url = os.getenv("WEBHOOK_URL")
     port = int(os.getenv("PORT", "8080"))
@@ -242,15 +228,21 @@ def main():
     if webhook_url:
         print(f"🤖 Запускаю webhook на {listen}:{port}")
         print(f"   Webhook URL: {webhook_url}/{token}")
-        application.run_webhook(
-            listen=listen,
-            port=port,
-            url_path=f"/{token}",
-            webhook_url=f"{webhook_url}/{token}",
-        )
+        # свой приём вебхуков: ответ Telegram сразу, обработка — из очереди в фоне
+        try:
+            asyncio.run(serve_webhook(
+                application,
+                webhook_url=f"{webhook_url}/{token}",
+                listen=listen,
+                port=port,
+                url_path=f"/{token}",
+            ))
+        finally:
+            shutdown_pool()
     else:
         print("⚠️ WEBHOOK_URL не задан — работаю в polling-режиме")
         application.run_polling()
+        shutdown_pool()
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -0,0 +1,5 @@
+"""общие настройки тестов: импорт handlers и harness из каталога vPrec без установки пакета"""
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,74 @@
+import io
+import zipfile
+from openpyxl import Workbook
+from handlers import admission
+from handlers.admission import HEAVY, OK, REJECT, _scan_sheet, admit_workbook, check_document, workbook_size
+from handlers.excel_stream import write_sheets
+
+
+def sheet_zip(xml: bytes) -> zipfile.ZipFile:
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w") as zf:
+        zf.writestr("xl/worksheets/sheet1.xml", xml)
+    return zipfile.ZipFile(buffer)
+
+
+def sheet_xml(rows: int, cols: str, dimension: bytes = b"", prefix: bytes = b"") -> bytes:
+    body = b"".join(b'<%srow r="%d"><%sc r="A%d"/><%sc r="%s%d"/></%srow>' % (
+        prefix, r, prefix, r, prefix, cols.encode(), r, prefix) for r in range(1, rows + 1))
+    return b'<?xml version="1.0"?><%sworksheet>%s<%ssheetData>%s</%ssheetData></%sworksheet>' % (
+        prefix, dimension, prefix, body, prefix, prefix)
+
+
+def test_scan_sheet_reads_dimension():
+    # <dimension> считается правдой, даже если строк в xml меньше
+    zf = sheet_zip(sheet_xml(3, "B", b'<dimension ref="A1:F500"/>'))
+    assert _scan_sheet(zf, "xl/worksheets/sheet1.xml") == (500, 6)
+
+
+def test_scan_sheet_without_dimension_walks_rows():
+    zf = sheet_zip(sheet_xml(120_000, "AB"))
+    assert zf.getinfo("xl/worksheets/sheet1.xml").file_size > 2 * 1024 * 1024  # несколько чанков чтения
+    assert _scan_sheet(zf, "xl/worksheets/sheet1.xml") == (120_000, 28)
+    # одна ячейка без диапазона в <dimension> и префикс пространства имён
+    zf = sheet_zip(sheet_xml(7, "C", b'<x:dimension ref="A1"/>', prefix=b"x:"))
+    assert _scan_sheet(zf, "xl/worksheets/sheet1.xml") == (7, 3)
+
+
+def test_workbook_size_for_both_writers(tmp_path):
+    streamed = str(tmp_path / "streamed.xlsx")
+    write_sheets(streamed, [("Данные", [(i, "x", None, 1.5) for i in range(250)]), ("Пусто", [])])
+    assert [(s.name, s.rows, s.cols) for s in workbook_size(streamed)] == [("Данные", 250, 4), ("Пусто", 0, 0)]
+
+    wb = Workbook()
+    for row in range(40):
+        wb.active.append([row, row, row])
+    regular = str(tmp_path / "regular.xlsx")
+    wb.save(regular)
+    assert [(s.rows, s.cols) for s in workbook_size(regular)] == [(40, 3)]
+
+
+def test_admission_verdicts(tmp_path, monkeypatch):
+    path = str(tmp_path / "book.xlsx")
+    write_sheets(path, [("Лист1", [(i, i) for i in range(100)])])
+    assert admit_workbook(path).verdict == OK
+    monkeypatch.setattr(admission, "HEAVY_CELLS", 150)
+    assert admit_workbook(path).verdict == HEAVY
+    monkeypatch.setattr(admission, "MAX_CELLS", 150)
+    rejected = admit_workbook(path)
+    assert rejected.verdict == REJECT and rejected.cells == 200 and "лимита 150" in rejected.message
+
+
+def test_zip_bomb_is_rejected_without_scanning(tmp_path, monkeypatch):
+    monkeypatch.setattr(admission, "MAX_UNPACKED_MB", 1)
+    path = str(tmp_path / "bomb.xlsx")
+    with zipfile.ZipFile(path, "w", zipfile.ZIP_DEFLATED) as zf:
+        zf.writestr("xl/worksheets/sheet1.xml", b"\0" * (4 * 1024 * 1024))
+    assert (tmp_path / "bomb.xlsx").stat().st_size < 64 * 1024
+    assert admit_workbook(path).verdict == REJECT
+
+
+def test_oversized_document_is_rejected_before_download():
+    assert check_document(int(admission.MAX_FILE_MB * 1024 * 1024) + 1).verdict == REJECT
+    assert check_document(1024).verdict == OK
+    assert check_document(None).verdict == OK
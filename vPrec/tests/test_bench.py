@@ -0,0 +1,29 @@
+"""бюджеты harness.bench на уменьшенном объёме: каждый тип отчёта в xlsx и в снимке"""
+import pytest
+from harness import bench
+from harness.workbooks import GENERATORS
+
+ROWS = 2000
+
+
+@pytest.fixture(scope="module")
+def fixtures(tmp_path_factory):
+    directory = tmp_path_factory.mktemp("bench")
+    # дочерние процессы читают окружение при импорте handlers — как в bench.main()
+    with pytest.MonkeyPatch.context() as mp:
+        mp.setenv("SNAPSHOT_DIR", str(directory / "snapshots"))
+        mp.setenv("RULES_PATH", str(directory / "rules.json"))
+        mp.setenv("PROFILE_SAMPLE_PERCENT", "0")
+        yield str(directory)
+
+
+@pytest.mark.parametrize("report_type", list(GENERATORS))
+def test_report_fits_budget(report_type, fixtures):
+    args = bench.parse_args(["--types", report_type, "--rows", str(ROWS)])
+    args.fixtures = fixtures
+    results, failed = bench.run(args)
+    assert [r.fmt for r in results] == list(bench.FORMATS)
+    for result in results:
+        assert result.replies > 0
+        assert bench.check_budget(result, args.time_scale) == [], bench.format_result(result, [])
+    assert not failed
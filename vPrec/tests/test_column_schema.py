@@ -0,0 +1,69 @@
+from handlers.column_schema import resolve_columns, resolve_file
+from handlers.excel_stream import write_sheets
+
+
+def test_ambiguous_headers_pick_first_and_warn():
+    mapping = resolve_columns("attendance", ["ФИО преподавателя", "Посещаемость, %", "Посещаемость за месяц"])
+    assert mapping.get("teacher") == "ФИО преподавателя"
+    assert mapping.get("attendance") == "Посещаемость, %"
+    assert mapping.ambiguous == {"attendance": ["Посещаемость, %", "Посещаемость за месяц"]}
+    [note] = mapping.notes()
+    assert "посещаемость" in note and "выбрана «Посещаемость, %»" in note
+
+
+def test_earlier_pattern_wins_over_column_order():
+    # «преподав» важнее «фио», хотя колонка с ФИО идёт первой
+    mapping = resolve_columns("attendance", ["ФИО", "Преподаватель", "Средний %"])
+    assert mapping.get("teacher") == "Преподаватель" and not mapping.ambiguous
+    assert mapping.get("attendance") == "Средний %"
+
+
+def test_fallback_index_and_missing_roles():
+    mapping = resolve_columns("attendance", ["A", "B", "C"])
+    assert mapping.columns == {"teacher": "A", "attendance": "B"}
+    assert mapping.ok and not mapping.recognized
+    mapping = resolve_columns("students", ["fio", "homework"])
+    assert mapping.missing == ["classroom"] and not mapping.ok
+
+
+def test_cached_mapping_is_not_shared():
+    first = resolve_columns("lessons", ["Тема урока"])
+    first.columns["topic"] = "испорчено"
+    assert resolve_columns("lessons", ["Тема урока"]).get("topic") == "Тема урока"
+
+
+def test_header_rows_candidates_are_tried_in_order(tmp_path):
+    # двухстрочный заголовок: объединённая «Домашние задания» над «Получено»/«Проверено»
+    two_rows = str(tmp_path / "two.xlsx")
+    write_sheets(two_rows, [("Лист1", [("Преподаватель", "Домашние задания", None),
+                                       (None, "Получено", "Проверено"),
+                                       ("Иванов", 10, 8)])])
+    header, columns, mapping = resolve_file("homework_check", two_rows)
+    assert header == [0, 1] and mapping.recognized
+    assert mapping.get("issued") == "Домашние задания Получено"
+
+    # однострочный заголовок: вариант (0, 1) распознаётся, но строка 1 — уже данные
+    one_row = str(tmp_path / "one.xlsx")
+    write_sheets(one_row, [("Лист1", [("Преподаватель", "Получено", "Проверено"),
+                                      ("Иванов", 10, 8), ("Петров", 5, 5)])])
+    header, columns, mapping = resolve_file("homework_check", one_row)
+    assert header == 0 and mapping.columns == {"teacher": "Преподаватель", "issued": "Получено", "checked": "Проверено"}
+
+    # строка с названием отчёта над таблицей без ролей сама по себе — остаётся частью заголовка
+    titled = str(tmp_path / "titled.xlsx")
+    write_sheets(titled, [("Лист1", [("Отчёт по проверке ДЗ",),
+                                     ("Преподаватель", "Получено", "Проверено"),
+                                     ("Иванов", 10, 8)])])
+    header, columns, mapping = resolve_file("homework_check", titled)
+    assert header == [0, 1] and mapping.get("checked") == "Отчёт по проверке ДЗ Проверено"
+
+def test_unrecognized_header_falls_back_to_first_candidate(tmp_path):
+    path = str(tmp_path / "unknown.xlsx")
+    write_sheets(path, [("Лист1", [("x", "y"), ("1", "2"), ("3", "4")])])
+    header, columns, mapping = resolve_file("homework_check", path)
+    assert header == [0, 1] and columns == ["x 1", "y 2"]
+    assert not mapping.ok and set(mapping.missing) == {"issued", "checked"}
+
+    empty = str(tmp_path / "empty.xlsx")
+    write_sheets(empty, [("Лист1", [])])
+    assert resolve_file("homework_check", empty)[:2] == (0, [])
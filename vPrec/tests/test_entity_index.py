@@ -0,0 +1,121 @@
+import asyncio
+from collections import OrderedDict
+import pytest
+import pandas as pd
+from harness.fakes import FakeUpdate, FakeContext
+from harness.workbooks import write_workbook
+from handlers import entity_index, rules
+from handlers.entity_index import EntityIndex, NameSummary
+from handlers.report_store import StoredReport
+from handlers.workers import shutdown_pool
+
+
+@pytest.fixture(autouse=True)
+def isolated(tmp_path, monkeypatch):
+    monkeypatch.setattr(rules, "rules_store", rules.RulesStore(str(tmp_path / "rules.json")))
+    monkeypatch.setattr(entity_index, "_indexes", OrderedDict())
+    monkeypatch.setattr(entity_index, "_user_chats", OrderedDict())
+    yield
+    shutdown_pool(wait=True)
+
+
+def test_name_summary_aggregates_across_chunks():
+    summary = NameSummary(mean=('attendance',))
+    summary.feed(pd.Series(["Иванов", " Петров ", None]), {'attendance': [10.0, 50.0, 99.0]})
+    summary.feed(pd.Series(["Иванов", ""]), {'attendance': [float('nan'), 1.0]})
+    people = summary.result().set_index('name')
+    assert sorted(people.index) == ["Иванов", "Петров"]
+    assert people.loc["Иванов", 'attendance'] == 10.0
+    assert people.loc["Иванов", 'rows'] == 2
+
+
+def test_unflagged_people_are_indexed_with_summary():
+    results = pd.DataFrame([("Иванов И.И.", 20.0, 'critical', "Лист1")],
+                           columns=['name', 'attendance', 'tier', 'sheet'])
+    people = pd.DataFrame([("Иванов И.И.", 20.0, 1, "Лист1"), ("Петров П.П.", 85.0, 3, "Лист1")],
+                          columns=['name', 'attendance', 'rows', 'sheet'])
+    index = EntityIndex()
+    index.add_report(StoredReport.from_results('attendance', results, 'attendance', people=people))
+    [flagged] = index.search('teacher', "иванов и и")
+    assert flagged.facts['attendance'][0]['tier'] == 'critical'
+    [normal] = index.search('teacher', "петров п п")
+    text = entity_index.describe_entity(normal)
+    assert "посещаемость: 85%" in text and "за 3 строк" in text
+
+
+def test_teacher_command_finds_teacher_without_problems(tmp_path):
+    path = write_workbook(str(tmp_path / "att.xlsx"), 'attendance', 50, seed=0)
+    from handlers.attendance_handler import process_attendance_file
+
+    async def scenario():
+        await process_attendance_file(FakeUpdate(user_id=7), FakeContext(), path)
+        index = entity_index.index_for(7)
+        # в отчёт попадают только строки под правилами, в индекс — все преподаватели листа
+        assert len(index) == 50
+        normal = [e for e in index._entities.values() if 'tier' not in e.facts['attendance'][0]]
+        assert normal
+        update = FakeUpdate(user_id=7)
+        await entity_index.teacher_command(update, FakeContext(args=normal[0].name.split()))
+        assert update.texts[0].startswith(f"👤 {normal[0].name}")
+    asyncio.run(scenario())
+
+
+def test_new_report_replaces_people_of_previous_one():
+    def report(names):
+        people = pd.DataFrame({'name': names, 'attendance': 50.0, 'rows': 1})
+        return StoredReport.from_results('attendance', people.iloc[:0], 'attendance', people=people)
+
+    index = EntityIndex()
+    index.add_report(report(["Иванов И.И.", "Петров П.П."]))
+    index.add_report(report(["Петров П.П."]))
+    assert len(index) == 1
+    assert index.search('teacher', "иванов") == []
+    assert [e.name for e in index.search(None, "пет", prefix=True)] == ["Петров П.П."]
+
+
+def test_chat_indexes_are_bounded(monkeypatch):
+    monkeypatch.setattr(entity_index, "ENTITY_INDEX_MAX_CHATS", 2)
+    monkeypatch.setattr(entity_index, "ENTITY_INDEX_MAX_USERS", 2)
+    for chat in (1, 2, 3):
+        entity_index.index_for(chat)
+        entity_index.remember_user(chat, chat)
+    assert list(entity_index._indexes) == [2, 3]
+    assert list(entity_index._user_chats) == [2, 3]
+    assert entity_index.chat_index(1) is None
+    # поиск не создаёт индексов для чатов без отчётов
+    assert entity_index.chat_index(4) is None and 4 not in entity_index._indexes
+
+
+def test_stale_indexes_expire_with_reports(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(entity_index.time, "monotonic", lambda: now[0])
+    monkeypatch.setattr(entity_index, "ENTITY_INDEX_TTL_SECONDS", 60)
+    index = entity_index.index_for(1)
+    entity_index.remember_user(5, 1)
+    assert entity_index.chat_index(1) is index
+    assert entity_index.indexes_for_user(5) == [index]
+    now[0] += 61
+    assert entity_index.chat_index(1) is None
+    assert entity_index.indexes_for_user(5) == []
+    assert 5 not in entity_index._user_chats
+
+
+def test_long_entity_card_fits_telegram_limit(monkeypatch):
+    monkeypatch.setattr(entity_index, "MAX_FACT_ROWS", 2)
+    entity = entity_index.Entity('teacher', "иванов", "Иванов" + "!" * 5000, 3)
+    entity.facts['schedule_load'] = [{'count': i, 'groups': 1} for i in range(10)]
+    text = entity_index.describe_entity(entity)
+    assert len(text) <= entity_index.MESSAGE_LIMIT and text.endswith("…")
+
+    entity.name = "Иванов"
+    lines = entity_index.describe_entity(entity).splitlines()
+    assert len(lines) == 4 and lines[-1].strip() == "... и ещё 8"
+
+
+def test_lookup_reply_is_truncated(monkeypatch):
+    people = pd.DataFrame({'name': [f"Иванов {'И' * 900} {i}" for i in range(5)], 'attendance': 50.0, 'rows': 1})
+    entity_index.index_for(7).add_report(
+        StoredReport.from_results('attendance', people.iloc[:0], 'attendance', people=people))
+    update = FakeUpdate(user_id=7)
+    asyncio.run(entity_index.teacher_command(update, FakeContext(args=["иванов"])))
+    assert len(update.texts[0]) <= entity_index.MESSAGE_LIMIT
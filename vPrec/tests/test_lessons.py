@@ -0,0 +1,60 @@
+import pandas as pd
+import pytest
+from openpyxl import load_workbook
+from handlers import lessons_handler
+from handlers.excel_stream import write_sheets
+from handlers.lessons_handler import (LessonTopicsCheck, analyze_lessons_sheet, suggest_fixes,
+                                      write_corrected_workbook)
+
+
+def categorize(*topics) -> dict:
+    check = LessonTopicsCheck()
+    check.feed(pd.Series(topics))
+    return {text: name for name, examples in check.examples.items() for _, text, _ in examples}
+
+
+@pytest.mark.parametrize("topic, category", [
+    ("Урок 5 Тема - Алгебра", 'separator'),
+    ("Урок № 5 Тема - Алгебра", 'separator'),
+    ("Урок № 5. Алгебра", 'no_topic_label'),
+    ("Тема - Алгебра", 'no_lesson'),
+    ("Тема: Алгебра", 'no_lesson'),
+    ("Урок № 5. Тема:", 'empty'),
+])
+def test_category(topic, category):
+    assert categorize(topic) == {topic: category}
+
+
+def test_separator_error_is_fixed():
+    check = LessonTopicsCheck()
+    check.feed(pd.Series(["Урок № 1. Тема: Введение", "Урок 5 Тема - Алгебра"]))
+    assert check.correct == 1 and check.fixable == 1
+    assert suggest_fixes(pd.Series(["Урок 5 Тема - Алгебра"])).tolist() == ["Урок № 5. Тема: Алгебра"]
+
+
+def test_non_lesson_text_is_not_fixed():
+    text = pd.Series(["5 марта контрольная", "12. Алгебра", "Тема: Алгебра", "Урок № 5. Тема: Алгебра"])
+    assert suggest_fixes(text).isna().all()
+    check = LessonTopicsCheck()
+    check.feed(text)
+    assert check.fixable == 0
+
+
+def test_corrected_workbook_keeps_every_sheet(tmp_path, monkeypatch):
+    monkeypatch.setattr(lessons_handler, "FIX_BATCH_ROWS", 3)
+    src, dst = str(tmp_path / "src.xlsx"), str(tmp_path / "dst.xlsx")
+    topics = [f"Урок {i} Тема - Алгебра" for i in range(10)] + ["5 марта контрольная", None]
+    write_sheets(src, [
+        ("Темы", [("Дата", "Тема урока")] + [("01.09", t) for t in topics]),
+        ("Справка", [("что", "сколько"), ("5 марта контрольная", 1)]),
+    ])
+    result = analyze_lessons_sheet(src, "Темы", True)
+    assert result.items.fixable == 10
+    write_corrected_workbook(src, dst, [result.items])
+
+    wb = load_workbook(dst, read_only=True)
+    assert wb.sheetnames == ["Темы", "Справка"]
+    fixed = [(row + (None,))[1] for row in wb["Темы"].iter_rows(min_row=2, values_only=True)]
+    assert fixed == [f"Урок № {i}. Тема: Алгебра" for i in range(10)] + ["5 марта контрольная", None]
+    assert list(wb["Справка"].iter_rows(values_only=True)) == [("что", "сколько"), ("5 марта контрольная", 1)]
+    wb.close()
@@ -0,0 +1,109 @@
+import time
+import pytest
+from harness.llm_stub import StubLLMServer
+from handlers.llm_backends import (CircuitBreaker, LLMBackend, LLMRouter, MistralBackend,
+                                   OpenAICompatibleBackend, RuleBasedBackend)
+
+
+@pytest.fixture
+def stubs():
+    servers = []
+
+    def start(**kwargs):
+        servers.append(StubLLMServer(**kwargs).start())
+        return servers[-1]
+    yield start
+    for server in servers:
+        server.stop()
+
+
+def backend(stub, name="local"):
+    return OpenAICompatibleBackend(name, stub.endpoint, "stub")
+
+
+def router(backends, **kwargs):
+    # проверки здоровья не должны влиять на порядок бэкендов в тестах
+    kwargs.setdefault("health_interval", 3600)
+    return LLMRouter(backends, **kwargs)
+
+
+def test_backend_reads_openai_reply(stubs):
+    stub = stubs(reply="привет")
+    assert backend(stub).complete("вопрос", timeout=5) == "привет"
+    assert stub.prompts == ["вопрос"]
+
+
+def test_mistral_sends_api_key(stubs):
+    stub = stubs(api_key="secret")
+    assert MistralBackend(endpoint=stub.endpoint, api_key="secret").complete("x", timeout=5) == "ok"
+    with pytest.raises(RuntimeError, match="401"):
+        MistralBackend(endpoint=stub.endpoint, api_key="wrong").complete("x", timeout=5)
+
+
+def test_llm_backend_is_abstract():
+    with pytest.raises(TypeError):
+        LLMBackend()
+
+
+def test_hedged_request_answers_from_second_backend(stubs):
+    slow, fast = stubs(reply="slow", delay=5), stubs(reply="fast")
+    r = router([backend(slow, "slow"), backend(fast, "fast")], deadline=10, hedge_after=0.2)
+    started = time.monotonic()
+    assert r.complete("x") == "fast"
+    assert time.monotonic() - started < 2
+    assert slow.calls == 1 and fast.calls == 1
+
+
+def test_failing_backend_falls_through_to_next(stubs):
+    broken, good = stubs(status=500), stubs(reply="good")
+    r = router([backend(broken, "broken"), backend(good, "good")], deadline=10, hedge_after=5)
+    assert r.complete("x") == "good"
+    assert r.states[0].breaker.failures == 1
+
+
+def test_breaker_opens_and_skips_backend(stubs):
+    broken = stubs(status=500)
+    r = router([backend(broken)], deadline=10, hedge_after=5,
+               breaker_factory=lambda: CircuitBreaker(failures=2, reset_after=60))
+    for _ in range(2):
+        assert r.complete("x").startswith("⚙️ ai сейчас недоступен")
+    assert r.states[0].breaker.state == "open"
+    r.complete("x")
+    assert broken.calls == 2
+
+
+def test_half_open_allows_single_trial():
+    now = [0.0]
+    breaker = CircuitBreaker(failures=1, reset_after=10, clock=lambda: now[0])
+    breaker.record_failure()
+    assert not breaker.allow()
+    now[0] = 11
+    assert breaker.state == "half-open"
+    assert breaker.allow()
+    assert not breaker.allow() and not breaker.available()
+    breaker.record_failure()
+    assert breaker.state == "open"
+    now[0] = 22
+    assert breaker.allow()
+    breaker.record_success()
+    assert breaker.state == "closed"
+    assert breaker.allow() and breaker.allow()
+
+
+def test_late_result_after_deadline_is_counted_once(stubs):
+    hung = stubs(delay=1.5)
+    r = router([backend(hung)], deadline=0.3, hedge_after=0.1)
+    assert r.complete("x").startswith("⚙️ ai сейчас недоступен")
+    assert r.states[0].breaker.failures == 1
+    # поздний ответ приходит уже после дедлайна и в breaker не попадает
+    time.sleep(2)
+    assert r.states[0].breaker.failures == 1
+
+
+def test_rule_based_fallback_without_backends():
+    r = router([])
+    reply = r.complete("Иванов, 35\nПетров, 80\nвопрос пользователя: кто отстаёт?")
+    assert reply.startswith("⚙️ ai сейчас недоступен")
+    assert "запрос: кто отстаёт?" in reply
+    assert "строк с данными: 2" in reply
+    assert reply == RuleBasedBackend().complete("Иванов, 35\nПетров, 80\nвопрос пользователя: кто отстаёт?")
@@ -0,0 +1,79 @@
+import asyncio
+import pytest
+from handlers import progress
+from handlers.progress import JobCancelled, cancel_job, checkpoint, end_job, run_bound, start_job
+
+
+@pytest.fixture(autouse=True)
+def manager():
+    yield
+    progress.shutdown_manager()
+
+
+def count_rows(limit: int) -> int:
+    for rows in range(limit):
+        checkpoint(rows)
+    return limit
+
+
+def test_checkpoint_raises_after_cancel_in_main_process():
+    async def scenario():
+        job = await start_job((1, 1))
+        checkpoint(10)
+        assert cancel_job((1, 1))
+        with pytest.raises(JobCancelled):
+            checkpoint(20)
+        with pytest.raises(JobCancelled):
+            progress.stage("analyze")
+        await end_job(job)
+        assert not cancel_job((1, 1))
+        checkpoint(30)  # без задачи контрольная точка ничего не делает
+    asyncio.run(scenario())
+
+
+def test_checkpoint_raises_in_worker_after_cancel():
+    async def scenario():
+        job = await start_job((1, 2))
+        # так воркер пула получает задачу: номер вызова, очередь строк и Event отмены менеджера
+        assert run_bound(job.token(), count_rows, 5) == 5
+        token = job.token()
+        assert cancel_job((1, 2)) and job.cancel_event.is_set()
+        with pytest.raises(JobCancelled):
+            run_bound(token, count_rows, 5)
+        assert progress._bound is None
+        await end_job(job)
+    asyncio.run(scenario())
+
+
+def test_new_job_cancels_previous_one_of_same_user():
+    async def scenario():
+        first = await start_job((1, 3))
+        second = await start_job((1, 3))
+        assert first.cancelled and not second.cancelled
+        with pytest.raises(JobCancelled):
+            first.check()
+        await end_job(first)
+        # завершение старой задачи не снимает с учёта новую
+        assert cancel_job((1, 3)) and second.cancelled
+        await end_job(second)
+    asyncio.run(scenario())
+
+
+def test_cancel_reaches_pool_worker(tmp_path):
+    from harness.workbooks import write_workbook
+    from handlers import workers
+    path = write_workbook(str(tmp_path / "att.xlsx"), 'attendance', 6000, seed=0)
+
+    async def scenario():
+        job = await start_job((1, 4))
+        try:
+            cancel_job((1, 4))
+            # запись снимка проходит контрольную точку на каждом блоке строк
+            with pytest.raises(JobCancelled):
+                await workers.run_in_pool(workers._snapshot_sheet, path, None, str(tmp_path / "0.arrow"))
+        finally:
+            await end_job(job)
+    try:
+        asyncio.run(scenario())
+    finally:
+        workers.shutdown_pool(wait=True)
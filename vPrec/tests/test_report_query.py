@@ -0,0 +1,40 @@
+import pandas as pd
+from handlers.report_query import answer_locally, report_context
+from handlers.report_store import StoredReport
+
+
+def attendance_report() -> StoredReport:
+    results = pd.DataFrame({'name': ["Иванов", "Петров"], 'attendance': [10.0, 30.0],
+                            'tier': "critical", 'sheet': "Лист1"})
+    people = pd.DataFrame({'name': ["Иванов", "Петров", "Сидоров", "Смирнов"],
+                           'attendance': [10.0, 30.0, 90.0, 70.0], 'rows': [1, 2, 1, 1], 'sheet': "Лист1"})
+    return StoredReport.from_results('attendance', results, 'attendance', people=people)
+
+
+def test_aggregates_cover_whole_report():
+    report = attendance_report()
+    assert answer_locally(report, "средняя посещаемость") == "📊 среднее (посещаемость): 50 по 4 строкам"
+    assert "Сидоров" in answer_locally(report, "у кого максимальная посещаемость")
+    assert answer_locally(report, "сколько преподавателей выше 50") == "🔢 подходящих строк: 2"
+
+
+def test_flagged_questions_use_report_rows():
+    report = attendance_report()
+    answer = answer_locally(report, "сколько проблемных")
+    assert answer == "🔢 подходящих строк: 2 (только попавшие под правила)"
+    assert "Сидоров" not in answer_locally(report, "покажи проблемных")
+
+
+def test_min_max_skip_missing_values():
+    results = pd.DataFrame({'name': ["Студент 1", "Студент 2"], 'homework': [float('nan')] * 2,
+                            'classroom': [2.0, 4.0], 'tier': "critical", 'sheet': ""})
+    report = StoredReport.from_results('students', results, 'homework')
+    assert answer_locally(report, "у кого минимальный дз") == "ℹ️ нет строк, подходящих под условие."
+    assert answer_locally(report, "средний дз") == "ℹ️ нет строк, подходящих под условие."
+    assert "Студент 2" in answer_locally(report, "максимальная классная")
+
+
+def test_context_summarizes_every_name():
+    text = report_context(attendance_report())
+    assert "всего имён в отчёте: 4, под правилами строк: 2" in text
+    assert "посещаемость по всем: среднее 50, мин 10, макс 90" in text
@@ -0,0 +1,34 @@
+import time
+import asyncio
+from collections import OrderedDict
+import pandas as pd
+from harness.fakes import FakeUpdate, FakeContext
+from handlers import entity_index, report_store
+from handlers.report_store import StoredReport, send_and_store
+
+
+def test_indexing_does_not_block_event_loop(monkeypatch):
+    monkeypatch.setattr(entity_index, "_indexes", OrderedDict())
+    monkeypatch.setattr(report_store, "store", report_store.ReportStore())
+    # тяжёлый индекс на большом отчёте — имитируем синхронной задержкой
+    monkeypatch.setattr(entity_index.EntityIndex, "add_report", lambda self, report: time.sleep(0.5))
+    report = StoredReport.from_results('attendance', pd.DataFrame({'name': ["Иванов"], 'attendance': [10.0]}),
+                                       'attendance')
+
+    async def scenario():
+        ticks = 0
+
+        async def ticker():
+            nonlocal ticks
+            while True:
+                await asyncio.sleep(0.02)
+                ticks += 1
+
+        task = asyncio.create_task(ticker())
+        update = FakeUpdate(user_id=3)
+        await send_and_store(update, FakeContext(), "отчёт", report=report)
+        task.cancel()
+        assert update.texts == ["отчёт"]
+        # цикл событий продолжал работать, пока строился индекс
+        assert ticks >= 10
+    asyncio.run(scenario())
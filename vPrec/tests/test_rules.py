@@ -0,0 +1,45 @@
+import asyncio
+import pytest
+from handlers import rules
+from handlers.rules import RuleError, compile_rules
+from harness.fakes import FakeUpdate, FakeContext
+
+
+@pytest.mark.parametrize("text", [
+    "посещаемость <",
+    "(",
+    "посещаемость < 40 и",
+    "посещаемость < 40 или",
+    "(посещаемость < 40",
+    "посещаемость",
+])
+def test_truncated_rule_is_rule_error(text):
+    with pytest.raises(RuleError):
+        compile_rules('attendance', (('critical', text),))
+
+
+@pytest.mark.parametrize("text", ["посещаемость < 40)", "(посещаемость < 40))", ")"])
+def test_unbalanced_rule_is_rule_error(text):
+    with pytest.raises(RuleError):
+        compile_rules('attendance', (('critical', text),))
+
+
+def test_end_of_rule_message():
+    with pytest.raises(RuleError, match="неожиданный конец правила"):
+        compile_rules('attendance', (('critical', "посещаемость < 40 и"),))
+
+
+def test_valid_rule_still_compiles():
+    compiled = compile_rules('students', (('critical', "(дз = 1 или классная < 3) и дз != 5"),))
+    tiers = compiled.evaluate({'homework': [1, 4, 5], 'classroom': [5, 2, 1]})
+    assert list(tiers) == ['critical', 'critical', '']
+
+
+@pytest.mark.parametrize("text", ["посещаемость <", "(", "посещаемость < 40 и"])
+def test_rules_command_replies_on_truncated_rule(tmp_path, monkeypatch, text):
+    monkeypatch.setattr(rules, "rules_store", rules.RulesStore(str(tmp_path / "rules.json")))
+    update = FakeUpdate()
+    context = FakeContext(args=["attendance", "critical", *text.split()])
+    asyncio.run(rules.rules_command(update, context))
+    assert update.texts and update.texts[0].startswith("❌")
+    assert not (tmp_path / "rules.json").exists()
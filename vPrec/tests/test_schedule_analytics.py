@@ -0,0 +1,109 @@
+import pandas as pd
+from handlers.excel_stream import write_sheets
+from handlers.schedule_analytics import (ScheduleAnalytics, concat_tables, finalize_table, parse_chunk,
+                                         read_plan)
+
+
+def cell(discipline: str, teacher: str = None, room: str = None) -> str:
+    text = f"Предмет: {discipline}"
+    if teacher:
+        text += f"\nПреподаватель: {teacher}"
+    if room:
+        text += f"\nАудитория: {room}"
+    return text
+
+
+def schedule(rows: list, sheet="Лист1") -> pd.DataFrame:
+    """rows: (группа, пара, понедельник, вторник)"""
+    chunk = pd.DataFrame(rows, columns=['Группа', 'Пара', 'Понедельник', 'Вторник'])
+    part = parse_chunk(chunk, 'Группа', 'Пара', ['Понедельник', 'Вторник'])
+    return finalize_table([part], sheet, list(chunk['Группа'].dropna()))
+
+
+def test_parse_chunk_splits_subgroups_and_fields():
+    table = schedule([
+        ("ИС-11", 1, cell("Математика", "Иванов И.И.", "101") + "\n" + cell("Физика", "Петров П.П."), None),
+        ("ИС-12", 1, "столовая", cell("История")),
+        (None, 2, cell("Лишнее"), None),
+    ])
+    rows = table[['group', 'day', 'slot', 'discipline', 'teacher', 'room']].astype(object).where(table.notna(), None)
+    assert rows.values.tolist() == [
+        ["ИС-11", "Понедельник", 1, "Математика", "Иванов И.И.", "101"],
+        ["ИС-11", "Понедельник", 1, "Физика", "Петров П.П.", None],
+        ["ИС-12", "Вторник", 1, "История", None, None],
+    ]
+    assert list(table['group'].cat.categories) == ["ИС-11", "ИС-12"]
+
+
+def test_room_conflicts():
+    analytics = ScheduleAnalytics(schedule([
+        # 101 в первую пару: два разных преподавателя — конфликт
+        ("ИС-11", 1, cell("Математика", "Иванов И.И.", "101"), None),
+        ("ИС-12", 1, cell("Физика", "Петров П.П.", "101"), None),
+        # поток: один преподаватель у двух групп в одной аудитории — не конфликт
+        ("ИС-11", 2, cell("История", "Сидоров С.С.", "202"), None),
+        ("ИС-12", 2, cell("История", "Сидоров С.С.", "202"), None),
+        # без преподавателя занятость считается по группам
+        ("ИС-11", 3, None, cell("Химия", room="303")),
+        ("ИС-12", 3, None, cell("Биология", room="303")),
+    ]))
+    conflicts = analytics.room_conflicts.astype(object)
+    assert conflicts[['day', 'slot', 'room', 'groups']].values.tolist() == [
+        ["Понедельник", 1, "101", "ИС-11, ИС-12"],
+        ["Вторник", 3, "303", "ИС-11, ИС-12"],
+    ]
+    assert analytics.teacher_conflicts.empty
+
+
+def test_teacher_conflicts():
+    analytics = ScheduleAnalytics(schedule([
+        ("ИС-11", 1, cell("Математика", "Иванов И.И.", "101"), cell("Математика", "Иванов И.И.", "101")),
+        ("ИС-12", 1, cell("Математика", "Иванов И.И.", "102"), cell("Математика", "Иванов И.И.", "101")),
+        ("ИС-13", 2, cell("Физика", "Петров П.П."), None),
+        ("ИС-14", 2, cell("Физика", "Петров П.П."), None),
+    ]))
+    conflicts = analytics.teacher_conflicts.astype(object)
+    # во вторник Иванов у двух групп в одной аудитории; у Петрова аудитория не указана — не конфликт
+    assert conflicts[['day', 'slot', 'teacher', 'groups']].values.tolist() == [
+        ["Понедельник", 1, "Иванов И.И.", "ИС-11, ИС-12"],
+    ]
+
+
+def test_conflicts_are_per_sheet():
+    first = schedule([("ИС-11", 1, cell("Математика", "Иванов И.И.", "101"), None)], sheet="1 курс")
+    second = schedule([("ИС-21", 1, cell("Физика", "Петров П.П.", "101"), None)], sheet="2 курс")
+    analytics = ScheduleAnalytics(concat_tables([first, second]))
+    assert analytics.room_conflicts.empty
+    assert list(analytics.pairs_by_group['group']) == ["ИС-11", "ИС-21"]
+
+
+def test_plan_vs_fact(tmp_path):
+    table = schedule([
+        ("ИС-11", 1, cell("Математика"), cell("Математика")),
+        ("ИС-11", 2, cell("Ёмкостные цепи"), None),
+        ("ИС-11", 3, cell("Физкультура"), None),
+        ("ИС-12", 1, cell("История"), None),
+    ])
+    path = str(tmp_path / "plan.xlsx")
+    write_sheets(path, [("План", [("Группа", "Дисциплина", "Часы"),
+                                  ("ИС-11", "математика", 4),
+                                  ("ис-11", "емкостные  цепи", 6),
+                                  ("ИС-11", "Информатика", 2),
+                                  ("ИС-11", "Без часов", None)])])
+    plan = read_plan(path)
+    assert plan['discipline'].tolist() == ["математика", "емкостные  цепи", "Информатика"]
+
+    diff = ScheduleAnalytics(table, plan, pair_hours=2).plan_comparison
+    # математика совпала (2 пары = 4 ч); ИС-12 в плане нет — не сравнивается
+    assert diff.astype(object).values.tolist() == [
+        ["ис-11", "емкостные  цепи", 6.0, 2.0, -4.0],
+        ["ИС-11", "Информатика", 2.0, 0.0, -2.0],
+        ["ИС-11", "Физкультура", 0.0, 2.0, 2.0],
+    ]
+    assert ScheduleAnalytics(table).plan_comparison.empty
+
+
+def test_read_plan_ignores_other_sheets(tmp_path):
+    path = str(tmp_path / "schedule.xlsx")
+    write_sheets(path, [("Расписание", [("Группа", "Пара", "Понедельник"), ("ИС-11", 1, cell("Математика"))])])
+    assert read_plan(path) is None
@@ -0,0 +1,54 @@
+import asyncio
+import pytest
+from harness.fakes import FakeUpdate, FakeContext
+from handlers import homework_check_handler, rules, workers
+from handlers.excel_stream import write_sheets
+from handlers.workers import SheetResult, analyze_sheets, split_failed
+
+
+def analyze_or_fail(file_path, sheet, strict):
+    """выполняется в пуле: второй лист падает"""
+    if sheet == "Плохой":
+        raise ValueError("битый лист")
+    return SheetResult(sheet, [], rows=1)
+
+
+@pytest.fixture(autouse=True)
+def isolated(tmp_path, monkeypatch):
+    monkeypatch.setattr(rules, "rules_store", rules.RulesStore(str(tmp_path / "rules.json")))
+    yield
+    workers.shutdown_pool(wait=True)
+
+
+def test_failing_sheet_does_not_fail_workbook(tmp_path):
+    path = str(tmp_path / "book.xlsx")
+    write_sheets(path, [("Хороший", [("a",), (1,)]), ("Плохой", [("a",), (1,)])])
+    sections, failed = split_failed(asyncio.run(analyze_sheets(path, analyze_or_fail)))
+    assert [s.sheet for s in sections] == ["Хороший"]
+    assert [s.sheet for s in failed] == ["Плохой"]
+
+
+def fake_sections(*results):
+    async def analyze(*args):
+        return list(results)
+    return analyze
+
+
+def test_report_lists_failed_sheets(monkeypatch):
+    ok = SheetResult("Январь", [("Иванов", 10, 2, 20.0, 'critical')], rows=1)
+    bad = SheetResult("Февраль", [], error="❌ не найдены колонки 'получено' или 'проверено'.\nнайденные заголовки:")
+    monkeypatch.setattr(homework_check_handler, "analyze_sheets", fake_sections(ok, bad))
+    update = FakeUpdate(user_id=11)
+    asyncio.run(homework_check_handler.process_homework_check_file(update, FakeContext(), "unused.xlsx"))
+    [text] = update.texts
+    assert "⚠️ Лист «Февраль» не разобран: не найдены колонки 'получено' или 'проверено'." in text
+    assert "Иванов" in text
+
+
+def test_all_sheets_failed(monkeypatch):
+    bad = [SheetResult(name, [], error=f"❌ лист {name} пуст") for name in ("А", "Б")]
+    monkeypatch.setattr(homework_check_handler, "analyze_sheets", fake_sections(*bad))
+    update = FakeUpdate(user_id=12)
+    asyncio.run(homework_check_handler.process_homework_check_file(update, FakeContext(), "unused.xlsx"))
+    assert update.texts == ["❌ Не удалось разобрать ни один лист:\n"
+                            "⚠️ Лист «А» не разобран: лист А пуст\n⚠️ Лист «Б» не разобран: лист Б пуст"]
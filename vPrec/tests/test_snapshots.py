@@ -0,0 +1,109 @@
+import os
+import time
+import datetime
+import pytest
+import pandas as pd
+import pyarrow as pa
+from handlers import excel_stream, snapshots
+
+
+@pytest.fixture
+def snapshot_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(snapshots, "SNAPSHOT_DIR", str(tmp_path))
+    return tmp_path
+
+
+def fake_snapshot(name: str, size: int, used: float, published: bool = True) -> str:
+    path = os.path.join(snapshots.SNAPSHOT_DIR, name)
+    os.makedirs(path)
+    with open(snapshots.sheet_file(path, 0), "wb") as f:
+        f.write(b"x" * size)
+    marker = os.path.join(path, snapshots.META) if published else snapshots.sheet_file(path, 0)
+    if published:
+        with open(marker, "w") as f:
+            f.write("{}")
+    os.utime(marker, (used, used))
+    os.utime(path, (used, used))
+    return path
+
+
+def test_evict_removes_old_snapshots_first(snapshot_dir):
+    now = time.time()
+    old = fake_snapshot("old.snap", 1000, now - 3600)
+    recent = fake_snapshot("recent.snap", 1000, now)
+    assert snapshots.evict(max_bytes=1500) == 1
+    assert not os.path.exists(old) and os.path.exists(recent)
+
+
+def test_evict_enforces_limit_for_recent_snapshots(snapshot_dir):
+    now = time.time()
+    first = fake_snapshot("first.snap", 1000, now - 20)
+    second = fake_snapshot("second.snap", 1000, now - 10)
+    newest = fake_snapshot("newest.snap", 1000, now)
+    building = fake_snapshot("x.tmp-1-1", 1000, now - 30, published=False)
+    # все моложе SNAPSHOT_MIN_AGE, но лимит важнее: уходят самые старые, кроме keep и идущей сборки
+    assert snapshots.evict(max_bytes=2500, keep=first) == 2
+    assert os.path.exists(first) and os.path.exists(building)
+    assert not os.path.exists(second) and not os.path.exists(newest)
+
+
+def snapshot_of(xlsx: str) -> str:
+    names = excel_stream.sheet_names(xlsx)
+    build_dir = snapshots.new_build_dir("roundtrip")
+    for i, sheet in enumerate(names):
+        snapshots.write_sheet(excel_stream.iter_rows(xlsx, sheet), snapshots.sheet_file(build_dir, i))
+    return snapshots.publish(build_dir, "roundtrip", names)
+
+
+def padded(rows) -> list:
+    rows = list(rows)
+    width = max((len(row) for row in rows), default=0)
+    return [tuple(row) + (None,) * (width - len(row)) for row in rows]
+
+
+def test_snapshot_rows_match_openpyxl(snapshot_dir, monkeypatch):
+    # несколько блоков, чтобы проверить склейку видов значений между ними
+    monkeypatch.setattr(snapshots, "BLOCK_ROWS", 7)
+    monkeypatch.setattr(snapshots, "HEAD_ROWS", 3)
+    rows = [("имя", "балл", "доля", "дата", "флаг", "смесь")]
+    for i in range(40):
+        rows.append((f"Иванов {i % 5}", i * 1000 if i % 9 else None, [0.1, 0.702, 1 / 3, 2.5][i % 4],
+                     datetime.datetime(2024, 1, 1 + i % 28, 8, 30), i % 2 == 0,
+                     ["текст", 7, 1.25, None, datetime.datetime(2024, 5, 1)][i % 5]))
+    rows.append((None, 2 ** 40, None, None, None, "хвост"))
+    xlsx = str(snapshot_dir / "book.xlsx")
+    excel_stream.write_sheets(xlsx, [("Лист1", rows), ("Пусто", []), ("Ещё", [("a", 1), (None, None, 3)])])
+
+    snapshot = snapshot_of(xlsx)
+    assert snapshots.is_snapshot(snapshot)
+    assert excel_stream.sheet_names(snapshot) == excel_stream.sheet_names(xlsx)
+    for sheet in excel_stream.sheet_names(xlsx):
+        # openpyxl обрезает пустой хвост строки, снимок дополняет строки до ширины листа
+        expected = padded(excel_stream.iter_rows(xlsx, sheet))
+        actual = padded(excel_stream.iter_rows(snapshot, sheet))
+        assert actual == expected, sheet
+        assert [tuple(map(type, row)) for row in actual] == [tuple(map(type, row)) for row in expected]
+
+
+def test_float32_only_when_values_are_exact():
+    exact = pa.chunked_array([pa.array([0.1, 0.702, 2.5, None, 1e6])])
+    assert snapshots._compact_numbers(exact).type == pa.float32()
+    lossy = pa.chunked_array([pa.array([0.1, 1 / 3])])
+    assert snapshots._compact_numbers(lossy).type == pa.float64()
+    precise = pa.chunked_array([pa.array([123456.789012])])
+    assert snapshots._compact_numbers(precise).type == pa.float64()
+    assert snapshots._compact_numbers(pa.chunked_array([pa.array([1, 300])])).type == pa.int16()
+    # чтение float32 отдаёт исходные числа, а не 0.7020000219
+    assert snapshots._python_values(snapshots._compact_numbers(exact)) == [0.1, 0.702, 2.5, None, 1e6]
+
+
+def test_snapshot_chunks_match_excel_chunks(snapshot_dir):
+    rows = [("имя", "балл", "доля", "смесь", 2024)]
+    rows += [(f"Иванов {i}", i, [0.702, 1 / 3, None][i % 3], ["текст", 7, None][i % 3], [5, 2.5][i % 2])
+             for i in range(30)]
+    xlsx = str(snapshot_dir / "book.xlsx")
+    excel_stream.write_sheets(xlsx, [("Лист1", rows)])
+    snapshot = snapshot_of(xlsx)
+    for expected, actual in zip(excel_stream.iter_chunks(xlsx, chunk_size=12),
+                                excel_stream.iter_chunks(snapshot, chunk_size=12), strict=True):
+        pd.testing.assert_frame_equal(actual, expected)
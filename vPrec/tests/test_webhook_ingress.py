@@ -0,0 +1,95 @@
+import asyncio
+from handlers.webhook_ingress import WebhookIngress
+
+
+def message(update_id: int, chat_id: int) -> dict:
+    return {"update_id": update_id, "message": {"message_id": update_id, "date": 0, "text": "x",
+                                                "chat": {"id": chat_id, "type": "private"}}}
+
+
+class SlowChatApp:
+    """обработка апдейтов чата slow_chat висит, пока тест не отпустит release"""
+    bot = None
+
+    def __init__(self, slow_chat: int):
+        self.slow_chat = slow_chat
+        self.release = asyncio.Event()
+        self.seen = []
+
+    async def process_update(self, update):
+        if update.effective_chat.id == self.slow_chat:
+            await self.release.wait()
+        self.seen.append((update.effective_chat.id, update.update_id))
+
+
+def test_flooding_chat_does_not_block_other_chats():
+    async def scenario():
+        app = SlowChatApp(slow_chat=1)
+        ingress = WebhookIngress(app, "hook", secret_token=None, workers=2, queue_size=100)
+        # медленных апдейтов одного чата больше, чем слотов обработки
+        for i in range(10):
+            assert ingress.enqueue(i, message(i, chat_id=1))[0] == 200
+        assert ingress.enqueue(100, message(100, chat_id=2))[0] == 200
+        for _ in range(50):
+            if (2, 100) in app.seen:
+                break
+            await asyncio.sleep(0.01)
+        assert app.seen == [(2, 100)]
+        # медленный чат занимает не больше одного слота
+        assert ingress.busy == 1
+
+        app.release.set()
+        await ingress.stop(drain_timeout=5)
+        assert [u for c, u in app.seen if c == 1] == list(range(10))
+        assert ingress.pending == 0 and not ingress._chats
+
+    asyncio.run(scenario())
+
+
+def test_duplicates_and_overflow():
+    async def scenario():
+        app = SlowChatApp(slow_chat=1)
+        ingress = WebhookIngress(app, "hook", secret_token=None, workers=1, queue_size=3)
+        codes = [ingress.enqueue(i, message(i, chat_id=1))[0] for i in range(5)]
+        assert codes == [200, 200, 200, 503, 503]
+        assert ingress.enqueue(0, message(0, chat_id=1))[0] == 200
+        assert ingress.metrics.duplicates == 1 and ingress.metrics.dropped == 2
+        # отклонённый апдейт не запомнен — повтор Telegram будет принят
+        app.release.set()
+        await ingress.stop(drain_timeout=5)
+        assert ingress.enqueue(3, message(3, chat_id=1))[0] == 200
+        await ingress.stop(drain_timeout=5)
+
+    asyncio.run(scenario())
+
+
+def test_metrics_need_secret_on_public_port():
+    async def scenario():
+        ingress = WebhookIngress(SlowChatApp(slow_chat=1), "hook", secret_token="s3", workers=1, queue_size=10)
+        for path in ("/metrics", "/healthz"):
+            assert ingress._route("GET", path, {}, b"")[0] == 404
+            assert ingress._route("GET", path, {"x-telegram-bot-api-secret-token": "bad"}, b"")[0] == 404
+            assert ingress._route("GET", path, {"x-telegram-bot-api-secret-token": "s3"}, b"")[0] == 200
+            # на локальном адресе метрик секрет не нужен
+            assert ingress._route("GET", path, {}, b"", public=False)[0] == 200
+        assert ingress._route("POST", "/hook", {"x-telegram-bot-api-secret-token": "s3"}, b"{}", public=False)[0] == 404
+
+        open_ingress = WebhookIngress(SlowChatApp(slow_chat=1), "hook", secret_token=None, workers=1, queue_size=10)
+        assert open_ingress._route("GET", "/metrics", {}, b"")[0] == 404
+    asyncio.run(scenario())
+
+
+def test_metrics_listener_serves_without_secret():
+    async def scenario():
+        ingress = WebhookIngress(SlowChatApp(slow_chat=1), "hook", secret_token="s3", workers=1, queue_size=10)
+        await ingress.start_metrics("127.0.0.1", 0)
+        try:
+            reader, writer = await asyncio.open_connection("127.0.0.1", ingress.metrics_port)
+            writer.write(b"GET /healthz HTTP/1.1\r\nHost: x\r\nConnection: close\r\n\r\n")
+            await writer.drain()
+            reply = await asyncio.wait_for(reader.read(), 5)
+            writer.close()
+            assert reply.startswith(b"HTTP/1.1 200") and reply.endswith(b"ok")
+        finally:
+            await ingress.stop(drain_timeout=1)
+    asyncio.run(scenario())